@@ -0,0 +1,390 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+壁纸编辑器 - 性能基准测试
+生成合成壁纸（1080p~16K，JPEG/PNG）和区域集合（5~500个，含长中文标签），
+无界面地测量解码、预览缩放、重绘、完整导出和项目保存/加载的耗时，有图形环境时还测量编辑器冷启动到首帧的时间，
+结果保存为JSON，并可与基线比较找出性能回退
+
+用法:
+    python benchmark.py                          # 默认 1080p/4K
+    python benchmark.py --sizes 1080p 8K 16K --regions 5 500
+    python benchmark.py --output result.json --baseline baseline.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+from PIL import Image
+
+from perf_metrics import memory_usage
+from pixel_cache import PixelCache
+from region_layout import LuminanceStats, auto_layout
+from wallpaper_render import Compositor, encode_image, format_size, scale_region
+
+WALLPAPER_SIZES = {
+    '1080p': (1920, 1080),
+    '1440p': (2560, 1440),
+    '4K': (3840, 2160),
+    '8K': (7680, 4320),
+    '16K': (15360, 8640),
+}
+DEFAULT_SIZES = ['1080p', '4K']
+DEFAULT_REGION_COUNTS = [5, 50, 500]
+PREVIEW_SIZE = (1200, 800)  # 与编辑器默认窗口中画布大小相当
+TILE_SIZE = 256
+REGRESSION_THRESHOLD = 0.10  # 比基线慢 10% 以上视为回退
+
+# 长中文标签，覆盖换行和字形缓存
+CJK_LABELS = ['待处理', '挂起', '处理中', '参考', '迭代',
+              '本周需要完成的重要文档和会议纪要',
+              '设计稿、素材与参考资料（按项目归档）',
+              '临时下载文件夹——每周五清理一次']
+FILLS = ['solid', 'solid', 'linear', 'radial', 'frosted']
+
+
+def synthetic_wallpaper(size, seed=0, noise=6):
+    """可复现的合成壁纸：平滑渐变叠加低频色块和噪声，压缩特性接近真实照片（noise 为噪声标准差）"""
+    width, height = size
+    rng = np.random.default_rng(seed)
+    # 低分辨率随机色块放大后作为大尺度结构
+    blocks = Image.fromarray(rng.integers(0, 256, (9, 16, 3), dtype=np.uint8))
+    image = blocks.resize(size, Image.Resampling.BICUBIC)
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None]
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :]
+    # 逐行块处理，避免16K时一次分配多份全尺寸浮点数组
+    pixels = np.asarray(image, dtype=np.uint8).copy()
+    for top in range(0, height, 1024):
+        bottom = min(top + 1024, height)
+        gradient = (x * 0.6 + y[top:bottom] * 0.4) * 80
+        grain = rng.normal(0, noise, (bottom - top, width)).astype(np.float32)
+        band = pixels[top:bottom].astype(np.float32) * 0.7 + (gradient + grain)[..., None]
+        pixels[top:bottom] = np.clip(band, 0, 255).astype(np.uint8)
+    return Image.fromarray(pixels, 'RGB')
+
+
+def synthetic_regions(count, preview_size, seed=0):
+    """可复现的区域集合（预览坐标），样式和标签轮换"""
+    rng = np.random.default_rng(seed)
+    width, height = preview_size
+    regions = []
+    for i in range(count):
+        region_width = int(rng.integers(40, max(41, width // 4)))
+        region_height = int(rng.integers(30, max(31, height // 4)))
+        regions.append({
+            'x': int(rng.integers(0, width - region_width)),
+            'y': int(rng.integers(0, height - region_height)),
+            'width': region_width,
+            'height': region_height,
+            'name': f"区域 {i + 1}",
+            'text': CJK_LABELS[i % len(CJK_LABELS)],
+            'color': '#%02x%02x%02x' % tuple(int(v) for v in rng.integers(0, 256, 3)),
+            'alpha': int(rng.integers(80, 200)),
+            'fill': FILLS[i % len(FILLS)],
+            'color2': '#000000',
+            'corner_radius': [0, 8, 16][i % 3]
+        })
+    return regions
+
+
+def fit_scale(image_size, preview_size=PREVIEW_SIZE):
+    """与编辑器 resize_image_to_fit 相同的适应窗口缩放比例"""
+    return min(preview_size[0] / image_size[0], preview_size[1] / image_size[1])
+
+
+def render_preview_tiles(image, scale):
+    """与编辑器 render_tile 相同的方式生成整幅预览的所有瓦片"""
+    content_width = int(image.width * scale)
+    content_height = int(image.height * scale)
+    tiles = []
+    for top in range(0, content_height, TILE_SIZE):
+        for left in range(0, content_width, TILE_SIZE):
+            right = min(left + TILE_SIZE, content_width)
+            bottom = min(top + TILE_SIZE, content_height)
+            box = (left / scale, top / scale,
+                   min(right / scale, image.width), min(bottom / scale, image.height))
+            tiles.append(image.resize((right - left, bottom - top), Image.Resampling.LANCZOS,
+                                      box=box, reducing_gap=2.0))
+    return tiles
+
+
+def redraw_layers(compositor, image, regions, scale, stats):
+    """与编辑器 region_preview_photo 相同的预览图层渲染（不含 PhotoImage 转换）"""
+    layers = []
+    for region in regions:
+        original = scale_region(region, scale)
+        sprite, position = None, None
+        if region['text']:
+            sprite, position = compositor.region_label(original, image.size, stats)
+        layers.append(compositor.preview_layer(image, region, scale, sprite, position))
+    return layers
+
+
+def measure(func, repeat):
+    """重复执行 func，返回各次耗时、tracemalloc 峰值和进程内存增量（Pillow 的像素内存只体现在后者）"""
+    runs = []
+    peak = 0
+    rss_delta = 0
+    for _ in range(repeat):
+        before = memory_usage()
+        tracemalloc.start()
+        start = time.perf_counter()
+        func()
+        runs.append(time.perf_counter() - start)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+        after = memory_usage()
+        if before is not None and after is not None:
+            rss_delta = max(rss_delta, after - before)
+    return runs, peak, rss_delta
+
+
+class BenchmarkSuite:
+    """按壁纸尺寸、格式和区域数量组合运行各项基准"""
+
+    def __init__(self, work_dir, repeat=3):
+        self.work_dir = work_dir
+        self.repeat = repeat
+        self.results = []
+
+    def record(self, name, params, runs, peak, rss_delta, work=None, unit=None):
+        """记录一项结果，work 为每次运行处理的工作量（如百万像素），用于计算吞吐量"""
+        median = statistics.median(runs)
+        result = {
+            'name': name,
+            'params': params,
+            'seconds': round(median, 6),
+            'runs': [round(run, 6) for run in runs],
+            'tracemalloc_peak_bytes': peak,
+            'rss_delta_bytes': rss_delta
+        }
+        if work is not None and median > 0:
+            result['throughput'] = round(work / median, 3)
+            result['unit'] = unit
+        self.results.append(result)
+        label = ' '.join(f"{key}={value}" for key, value in params.items())
+        rate = f", {result['throughput']} {unit}" if 'throughput' in result else ''
+        print(f"  {name:<14} {label:<36} {median * 1000:9.1f} ms{rate}, 峰值 {format_size(peak)}")
+        return result
+
+    def run_wallpaper(self, size_name, fmt, region_counts):
+        """对一张合成壁纸运行所有基准"""
+        size = WALLPAPER_SIZES[size_name]
+        megapixels = size[0] * size[1] / 1e6
+        file_path = os.path.join(self.work_dir, f"wallpaper_{size_name}.{fmt.lower()}")
+        if not os.path.exists(file_path):
+            print(f"🖼️ 生成合成壁纸 {size_name} {fmt} ...")
+            synthetic_wallpaper(size).save(file_path, fmt, **({'quality': 90} if fmt == 'JPEG' else {}))
+        params = {'size': size_name, 'format': fmt}
+
+        # 解码：直接解码，以及经过像素缓存（首次写入 / 再次打开时内存映射）。
+        # 映射后的 load() 不读取像素，所以两种情况都用 tobytes() 把全部像素读一遍
+        def decode():
+            with Image.open(file_path) as image:
+                image.load()
+        self.record('decode', params, *measure(decode, self.repeat), megapixels, 'MP/s')
+
+        cache = PixelCache(os.path.join(self.work_dir, 'pixel_cache'))
+        cache.clear()
+        def decode_cached():
+            cache.open_image(file_path).tobytes()
+        self.record('decode_cached', dict(params, cache='cold'),
+                    *measure(decode_cached, 1), megapixels, 'MP/s')
+        self.record('decode_cached', dict(params, cache='warm'),
+                    *measure(decode_cached, self.repeat), megapixels, 'MP/s')
+
+        image = cache.open_image(file_path)
+        scale = fit_scale(size)
+        preview_size = (int(size[0] * scale), int(size[1] * scale))
+
+        # 预览缩放：整幅预览的全部瓦片
+        self.record('preview_tiles', params,
+                    *measure(lambda: render_preview_tiles(image, scale), self.repeat), megapixels, 'MP/s')
+
+        # 亮度分析：自动布局和标签颜色用的积分图。编辑器从像素缓存拿到的源图是 RGBA，
+        # 与直接解码的 RGB 源图分开测量，缩小前没有先转亮度图时 RGBA 会明显更慢
+        with Image.open(file_path) as decoded:
+            decoded.load()
+        for source in (decoded, image):
+            analysis_params = dict(params, mode=source.mode)
+            self.record('auto_layout', analysis_params,
+                        *measure(lambda: auto_layout(source, size), self.repeat), megapixels, 'MP/s')
+            self.record('luminance', analysis_params,
+                        *measure(lambda: LuminanceStats(source), self.repeat), megapixels, 'MP/s')
+        del decoded
+
+        stats = LuminanceStats(image)
+        for count in region_counts:
+            regions = synthetic_regions(count, preview_size)
+            region_params = dict(params, regions=count)
+
+            # 重绘：冷缓存（新合成器）与热缓存（同一合成器再次渲染）
+            def redraw_cold():
+                redraw_layers(Compositor(), image, regions, scale, stats)
+            self.record('redraw_cold', region_params, *measure(redraw_cold, self.repeat),
+                        count, 'regions/s')
+            compositor = Compositor()
+            redraw_layers(compositor, image, regions, scale, stats)
+            self.record('redraw_warm', region_params,
+                        *measure(lambda: redraw_layers(compositor, image, regions, scale, stats),
+                                 self.repeat), count, 'regions/s')
+
+            # 完整导出：原始尺寸合成 + 均衡配置编码
+            output_path = os.path.join(self.work_dir, f"export_{size_name}.{fmt.lower()}")
+            def export():
+                output = Compositor().compose(image, regions, scale, stats)
+                encode_image(output, output_path, fmt=fmt)
+            self.record('export', region_params, *measure(export, self.repeat), megapixels, 'MP/s')
+
+        del image
+        cache.clear()
+
+    def run_project_io(self, region_counts):
+        """项目保存/加载（与编辑器相同的JSON格式），与壁纸尺寸无关，只运行一次"""
+        for count in region_counts:
+            regions = synthetic_regions(count, PREVIEW_SIZE)
+            project_path = os.path.join(self.work_dir, f"project_{count}.json")
+            def save_load():
+                with open(project_path, 'w', encoding='utf-8') as f:
+                    json.dump({'regions': regions, 'image_path': 'wallpaper.jpg'}, f,
+                              ensure_ascii=False, indent=2)
+                with open(project_path, 'r', encoding='utf-8') as f:
+                    json.load(f)
+            self.record('project_io', {'regions': count}, *measure(save_load, self.repeat),
+                        count, 'regions/s')
+
+    def run_startup(self):
+        """冷启动：在新进程中启动编辑器，首帧显示后退出（--startup-probe），
+        返回 (首帧时间中位数, 启动预算)（秒）；无法创建窗口时返回 None"""
+        editor_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'wallpaper_editor.py')
+        runs = []
+        imports = []
+        first_frames = []
+        budget = None
+        for _ in range(self.repeat):
+            start = time.perf_counter()
+            process = subprocess.run([sys.executable, editor_path, '--startup-probe'],
+                                     capture_output=True, text=True)
+            if process.returncode != 0:
+                error = process.stderr.strip().splitlines()
+                print(f"  ⚠️ 无法启动编辑器窗口: {error[-1] if error else process.returncode}")
+                return None
+            runs.append(time.perf_counter() - start)
+            timing = json.loads(process.stdout.strip().splitlines()[-1])
+            imports.append(timing['import'])
+            first_frames.append(timing['first_frame'])
+            budget = timing['budget']
+        self.record('startup_process', {}, runs, 0, 0)
+        self.record('startup_import', {}, imports, 0, 0)
+        self.record('startup_first_frame', {}, first_frames, 0, 0)
+        return statistics.median(first_frames), budget
+
+    def report(self):
+        """结果（含运行环境），可直接写入JSON"""
+        import PIL
+        return {
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': sys.version.split()[0],
+            'pillow': PIL.__version__,
+            'numpy': np.__version__,
+            'platform': sys.platform,
+            'repeat': self.repeat,
+            'results': self.results
+        }
+
+
+def result_key(result):
+    """用名称和参数匹配基线中的同一项"""
+    return (result['name'], tuple(sorted(result['params'].items())))
+
+
+def compare_with_baseline(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """与基线比较，返回 (项目, 基线耗时, 当前耗时, 比值) 的回退列表，并打印对比"""
+    baseline_map = {result_key(result): result for result in baseline.get('results', [])}
+    regressions = []
+    print("\n📊 与基线对比:")
+    for result in results:
+        base = baseline_map.get(result_key(result))
+        if base is None or not base['seconds']:
+            continue
+        ratio = result['seconds'] / base['seconds']
+        label = f"{result['name']} " + ' '.join(f"{k}={v}" for k, v in result['params'].items())
+        mark = '❌' if ratio > 1 + threshold else ('✅' if ratio < 1 - threshold else '  ')
+        print(f"  {mark} {label:<50} {base['seconds'] * 1000:9.1f} -> {result['seconds'] * 1000:9.1f} ms ({ratio:.2f}x)")
+        if ratio > 1 + threshold:
+            regressions.append((label, base['seconds'], result['seconds'], ratio))
+    return regressions
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="壁纸编辑器性能基准测试")
+    parser.add_argument('--sizes', nargs='+', default=DEFAULT_SIZES, choices=list(WALLPAPER_SIZES),
+                        help="壁纸尺寸")
+    parser.add_argument('--formats', nargs='+', default=['JPEG', 'PNG'], choices=['JPEG', 'PNG'],
+                        help="壁纸格式")
+    parser.add_argument('--regions', nargs='+', type=int, default=DEFAULT_REGION_COUNTS,
+                        help="区域数量")
+    parser.add_argument('--repeat', type=int, default=3, help="每项重复次数（取中位数）")
+    parser.add_argument('--work-dir', default=None, help="合成壁纸和导出文件的目录（默认临时目录）")
+    parser.add_argument('--output', default='benchmark_result.json', help="结果JSON文件")
+    parser.add_argument('--baseline', default=None, help="基线JSON文件，用于检测性能回退")
+    parser.add_argument('--threshold', type=float, default=REGRESSION_THRESHOLD,
+                        help="回退阈值（0.1 表示慢 10%%）")
+    parser.add_argument('--skip-startup', action='store_true', help="不测量冷启动时间")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("⏱️ 壁纸编辑器 - 性能基准测试")
+    print("=" * 50)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        work_dir = args.work_dir or temp_dir
+        os.makedirs(work_dir, exist_ok=True)
+        suite = BenchmarkSuite(work_dir, args.repeat)
+        for size_name in args.sizes:
+            for fmt in args.formats:
+                print(f"\n🖼️ {size_name} {fmt}")
+                suite.run_wallpaper(size_name, fmt, args.regions)
+        print("\n📁 项目保存/加载")
+        suite.run_project_io(args.regions)
+
+    over_budget = False
+    if not args.skip_startup:
+        print("\n🚀 冷启动")
+        startup = suite.run_startup()
+        if startup:
+            first_frame, budget = startup
+            over_budget = first_frame > budget
+            print(f"  {'❌ 超出' if over_budget else '✅ 未超出'}启动预算 {budget * 1000:.0f} ms"
+                  f"（首帧 {first_frame * 1000:.0f} ms）")
+
+    report = suite.report()
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 结果已保存到: {args.output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_with_baseline(report['results'], baseline, args.threshold)
+        if regressions:
+            print(f"\n❌ 发现 {len(regressions)} 项性能回退")
+            return 1
+        print("\n✅ 没有发现性能回退")
+    return 1 if over_budget else 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\n👋 基准测试已取消")
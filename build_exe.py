@@ -5,12 +5,34 @@
 使用PyInstaller将Python程序打包为可执行文件
 """
 
+import argparse
 import os
 import sys
 import subprocess
 import shutil
 from pathlib import Path
 
+# 构建配置
+# onefile: 单个exe，便于分发，但每次启动都要先解压到临时目录
+# fast: 单目录发布，免去解压；字节码预先按优化级别编译，排除用不到的模块，启动更快
+BUILD_PROFILES = {
+    'onefile': {
+        'options': ["--onefile"],
+        'output': "dist/壁纸编辑器.exe"
+    },
+    'fast': {
+        'options': ["--onedir", "--optimize=1", "--noupx"],
+        'output': "dist/壁纸编辑器/壁纸编辑器.exe"
+    }
+}
+
+# fast 配置排除的模块（编辑器运行时不会用到）
+EXCLUDED_MODULES = [
+    "pydoc", "doctest", "pdb", "lib2to3", "test", "tkinter.test", "idlelib",
+    "setuptools", "distutils", "pip", "numpy.f2py", "numpy.distutils",
+    "IPython", "matplotlib", "scipy", "pandas", "PyQt5", "PySide2", "PIL.ImageQt"
+]
+
 def check_pyinstaller():
     """检查PyInstaller是否已安装"""
     try:
@@ -27,28 +49,36 @@ def check_pyinstaller():
             print("❌ PyInstaller 安装失败")
             return False
 
-def build_executable():
+def build_executable(profile='onefile'):
     """构建可执行文件"""
-    print("🚀 开始构建可执行文件...")
+    print(f"🚀 开始构建可执行文件（{profile}）...")
     
     # 使用python -m pyinstaller来确保能找到pyinstaller
     cmd = [
         sys.executable, "-m", "PyInstaller",
-        "--onefile",                    # 打包成单个文件
+        *BUILD_PROFILES[profile]['options'],  # 打包方式
         "--windowed",                   # 无控制台窗口
         "--name=壁纸编辑器",            # 可执行文件名称
         "--hidden-import=PIL",          # 隐藏导入
         "--hidden-import=PIL.Image",    # 隐藏导入
         "--hidden-import=PIL.ImageTk",  # 隐藏导入
+        "--hidden-import=numpy",        # 隐藏导入
         "--hidden-import=tkinter",      # 隐藏导入
         "--hidden-import=tkinter.ttk",  # 隐藏导入
         "--hidden-import=tkinter.filedialog", # 隐藏导入
         "--hidden-import=tkinter.messagebox", # 隐藏导入
         "--hidden-import=tkinter.colorchooser", # 隐藏导入
+        "--hidden-import=tkinter.simpledialog", # 隐藏导入（延迟导入的模块需要显式声明）
+        "--hidden-import=PIL.ImageDraw",  # 隐藏导入
+        "--hidden-import=PIL.ImageFont",  # 隐藏导入
         "--clean",                      # 清理临时文件
         "wallpaper_editor.py"           # 主程序文件
     ]
     
+    if profile == 'fast':
+        for module in EXCLUDED_MODULES:
+            cmd.insert(-1, f"--exclude-module={module}")
+    
     # 如果有图标文件，添加图标参数
     if os.path.exists("icon.ico"):
         cmd.insert(-1, "--icon=icon.ico")
@@ -117,6 +147,11 @@ def cleanup():
 
 def main():
     """主函数"""
+    parser = argparse.ArgumentParser(description="壁纸编辑器可执行文件构建工具")
+    parser.add_argument('--profile', choices=list(BUILD_PROFILES), default='onefile',
+                        help="onefile: 单个exe；fast: 单目录发布，启动更快")
+    args = parser.parse_args()
+    
     print("=" * 50)
     print("🎨 壁纸编辑器 - 可执行文件构建工具")
     print("=" * 50)
@@ -135,10 +170,13 @@ def main():
         create_icon()
     
     # 构建可执行文件
-    if build_executable():
+    if build_executable(args.profile):
         print("\n🎉 构建完成！")
-        print("📁 可执行文件位置: dist/壁纸编辑器.exe")
-        print("💡 您可以将 dist 文件夹中的可执行文件复制到任何位置运行")
+        print(f"📁 可执行文件位置: {BUILD_PROFILES[args.profile]['output']}")
+        if args.profile == 'fast':
+            print("💡 请复制整个 dist/壁纸编辑器 文件夹，exe 需要与其中的依赖文件放在一起")
+        else:
+            print("💡 您可以将 dist 文件夹中的可执行文件复制到任何位置运行")
         
         # 询问是否清理临时文件
         try:
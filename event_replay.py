@@ -0,0 +1,302 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+壁纸编辑器 - 输入事件录制与回放
+在编辑器中按 F9 开始/停止录制：画布鼠标事件、名称/文字输入框的按键和窗口尺寸变化
+连同时间戳和录制开始时的壁纸、区域、缩放状态一起保存为JSON。
+回放时恢复初始状态，把事件逐个送入 WallpaperEditor 的处理函数，
+测量每个事件的处理耗时（含处理函数排入的空闲重绘），按事件类型输出 p50/p95/p99，
+并可与基线比较找出交互性能回退。回放需要图形界面，无显示器的机器上使用 Xvfb
+
+用法:
+    python event_replay.py drag.json
+    python event_replay.py drag.json --repeat 5 --output replay_result.json --baseline replay_base.json
+    xvfb-run -s "-screen 0 1920x1080x24" python event_replay.py drag.json
+"""
+
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+import types
+
+from perf_metrics import percentile
+
+RECORDING_VERSION = 1
+
+# (控件, 事件序列) -> (事件类型, 处理函数名)；控件名为 WallpaperEditor 的属性
+RECORDED_EVENTS = {
+    ('canvas', '<Button-1>'): ('click', 'on_canvas_click'),
+    ('canvas', '<B1-Motion>'): ('drag', 'on_canvas_drag'),
+    ('canvas', '<ButtonRelease-1>'): ('release', 'on_canvas_release'),
+    ('canvas', '<Motion>'): ('motion', 'on_canvas_motion'),
+    ('canvas', '<MouseWheel>'): ('wheel', 'on_canvas_wheel'),
+    ('canvas', '<Button-4>'): ('wheel', 'on_canvas_wheel'),
+    ('canvas', '<Button-5>'): ('wheel', 'on_canvas_wheel'),
+    ('canvas', '<ButtonPress-2>'): ('pan_start', 'on_pan_start'),
+    ('canvas', '<B2-Motion>'): ('pan', 'on_pan_drag'),
+    ('name_entry', '<KeyRelease>'): ('name_key', 'update_region_name'),
+    ('text_entry', '<KeyRelease>'): ('text_key', 'update_region_text'),
+    ('root', '<Configure>'): ('resize', 'handle_resize'),
+}
+
+# 输入框 -> 对应的 StringVar 属性（回放时先写入录制时的内容再调用处理函数）
+ENTRY_VARIABLES = {
+    'name_entry': 'name_var',
+    'text_entry': 'text_var',
+}
+
+EVENT_FIELDS = ('x', 'y', 'state', 'num', 'delta', 'keysym')
+PERCENTILES = (('p50', 0.50), ('p95', 0.95), ('p99', 0.99))
+
+
+class EventRecorder:
+    """在编辑器的控件上追加绑定，录制期间把事件记入列表（处理函数照常执行）"""
+
+    def __init__(self, editor):
+        self.editor = editor
+        self.recording = False
+        self.installed = False
+        self.started = None
+        self.initial = None
+        self.events = []
+        self.window_size = None
+
+    def install(self):
+        """追加绑定（只在第一次录制时进行；不录制时回调直接返回）"""
+        for widget_name, sequence in RECORDED_EVENTS:
+            widget = getattr(self.editor, widget_name)
+            widget.bind(sequence, lambda event, widget_name=widget_name, sequence=sequence:
+                        self.record(widget_name, sequence, event), add='+')
+        self.installed = True
+
+    def start(self):
+        """开始录制：保存壁纸、区域、选择、缩放和窗口尺寸作为回放的初始状态"""
+        if not self.installed:
+            self.install()
+        editor = self.editor
+        self.window_size = (editor.root.winfo_width(), editor.root.winfo_height())
+        self.initial = {
+            'image_path': editor.original_image_path,
+            'window_size': list(self.window_size),
+            'scale': editor.scale,
+            'zoom': editor.zoom,
+            'view': [editor.canvas.xview()[0], editor.canvas.yview()[0]],
+            'regions': copy.deepcopy(editor.regions),
+            'selected_regions': sorted(editor.selected_regions),
+            'selected_region': editor.selected_region,
+        }
+        self.events = []
+        self.started = time.perf_counter()
+        self.recording = True
+
+    def stop(self):
+        """停止录制，返回录制数据"""
+        self.recording = False
+        return self.recording_data()
+
+    def record(self, widget_name, sequence, event):
+        if not self.recording:
+            return
+        entry = {'t': round(time.perf_counter() - self.started, 6), 'widget': widget_name, 'sequence': sequence}
+        if widget_name == 'root':
+            # 子控件的 Configure 也会传到窗口的绑定上，只记录窗口尺寸真正变化的事件
+            size = (event.width, event.height)
+            if event.widget is not self.editor.root or size == self.window_size:
+                return
+            self.window_size = size
+            entry['width'], entry['height'] = size
+        else:
+            for field in EVENT_FIELDS:
+                value = getattr(event, field, None)
+                if isinstance(value, (int, str)) and value != '??':
+                    entry[field] = value
+            if widget_name in ENTRY_VARIABLES:
+                entry['value'] = getattr(self.editor, ENTRY_VARIABLES[widget_name]).get()
+        self.events.append(entry)
+
+    def recording_data(self):
+        return {
+            'version': RECORDING_VERSION,
+            'recorded_at': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'initial': self.initial,
+            'events': self.events,
+        }
+
+    def save(self, file_path):
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(self.recording_data(), f, ensure_ascii=False)
+
+
+def load_recording(file_path):
+    """读取录制文件"""
+    with open(file_path, 'r', encoding='utf-8') as f:
+        recording = json.load(f)
+    if recording.get('version', RECORDING_VERSION) > RECORDING_VERSION:
+        raise ValueError(f"录制文件版本过新: {recording['version']}")
+    if not recording.get('initial', {}).get('image_path'):
+        raise ValueError("录制文件缺少壁纸路径")
+    return recording
+
+
+def restore_initial_state(editor, initial, image_path=None):
+    """恢复录制开始时的窗口尺寸、壁纸、区域、选择、缩放和滚动位置"""
+    width, height = initial['window_size']
+    editor.root.geometry(f"{width}x{height}")
+    editor.root.update()
+
+    editor.stash_document()
+    document = editor.workspace.open(image_path or initial['image_path'])
+    document.regions = copy.deepcopy(initial['regions'])
+    document.history = []
+    document.selected_regions = set(initial['selected_regions'])
+    document.selected_region = initial['selected_region']
+    document.zoom = initial['zoom']
+    document.scale = initial['scale']  # 预览比例与录制时不同时 activate_document 会换算区域
+    document.view = tuple(initial['view'])
+    editor.activate_document(document)
+    editor.update_document_menu()
+    editor.redraw_regions()
+    editor.root.update()
+
+
+def replay(editor, recording, realtime=False, image_path=None):
+    """回放一次录制，返回 {事件类型: [处理耗时（秒）, ...]}"""
+    restore_initial_state(editor, recording['initial'], image_path)
+    latencies = {}
+    began = time.perf_counter()
+    for entry in recording['events']:
+        kind, handler_name = RECORDED_EVENTS[(entry['widget'], entry['sequence'])]
+        if realtime:
+            delay = entry['t'] - (time.perf_counter() - began)
+            if delay > 0:
+                time.sleep(delay)
+
+        if entry['widget'] == 'root':
+            # 窗口尺寸变化本身不计时，只测量编辑器的 handle_resize
+            editor.root.geometry(f"{entry['width']}x{entry['height']}")
+            editor.root.update_idletasks()
+            args = ()
+        else:
+            if entry['widget'] in ENTRY_VARIABLES:
+                getattr(editor, ENTRY_VARIABLES[entry['widget']]).set(entry.get('value', ''))
+            event = types.SimpleNamespace(widget=getattr(editor, entry['widget']), x=0, y=0, state=0,
+                                          num='??', delta=0, keysym='??')
+            for field in EVENT_FIELDS:
+                if field in entry:
+                    setattr(event, field, entry[field])
+            args = (event,)
+
+        handler = getattr(editor, handler_name)
+        start = time.perf_counter()
+        handler(*args)
+        editor.root.update_idletasks()  # 处理函数排入的空闲重绘计入该事件
+        latencies.setdefault(kind, []).append(time.perf_counter() - start)
+        editor.root.update()  # 其他待处理的窗口事件和定时器不计时
+    return latencies
+
+
+def summarize(latencies):
+    """按事件类型汇总：次数和 p50/p95/p99/max（毫秒），'all' 为所有事件"""
+    groups = dict(latencies)
+    groups['all'] = [value for values in latencies.values() for value in values]
+    summary = {}
+    for kind, values in groups.items():
+        values = sorted(values)
+        if not values:
+            continue
+        summary[kind] = {'count': len(values)}
+        for name, fraction in PERCENTILES:
+            summary[kind][f"{name}_ms"] = round(percentile(values, fraction) * 1000, 3)
+        summary[kind]['max_ms'] = round(values[-1] * 1000, 3)
+    return summary
+
+
+def baseline_results(summary):
+    """转换为 benchmark.py 的结果格式，以便复用基线比较"""
+    return [{'name': 'replay', 'params': {'event': kind, 'percentile': name},
+             'seconds': stats[f"{name}_ms"] / 1000}
+            for kind, stats in summary.items() for name, _ in PERCENTILES]
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="回放录制的输入事件，测量交互延迟")
+    parser.add_argument('recording', help="录制文件（编辑器中按 F9 录制）")
+    parser.add_argument('--repeat', type=int, default=1, help="回放次数（延迟合并统计）")
+    parser.add_argument('--realtime', action='store_true', help="按录制时的时间间隔回放（默认尽快回放）")
+    parser.add_argument('--image', default=None, help="替换录制中的壁纸路径")
+    parser.add_argument('--output', default='replay_result.json', help="结果JSON文件")
+    parser.add_argument('--baseline', default=None, help="基线JSON文件，用于检测交互性能回退")
+    parser.add_argument('--threshold', type=float, default=None,
+                        help="回退阈值（0.1 表示慢 10%%，默认与基准测试相同）")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("🎬 壁纸编辑器 - 输入事件回放")
+    print("=" * 50)
+
+    recording = load_recording(args.recording)
+    image_path = args.image or recording['initial']['image_path']
+    if not os.path.isfile(image_path):
+        print(f"❌ 找不到壁纸: {image_path}（可用 --image 指定）")
+        return 1
+
+    import tkinter as tk
+    from wallpaper_editor import WallpaperEditor
+    try:
+        root = tk.Tk()
+    except tk.TclError as e:
+        print(f"❌ 无法打开窗口: {str(e)}（无显示器时使用 xvfb-run 运行）")
+        return 1
+    editor = WallpaperEditor(root)
+    editor.auto_save_enabled = False  # 回放不写自动保存文件
+    root.update()
+
+    latencies = {}
+    for run in range(args.repeat):
+        for kind, values in replay(editor, recording, args.realtime, image_path).items():
+            latencies.setdefault(kind, []).extend(values)
+        print(f"  ✅ 第 {run + 1}/{args.repeat} 次回放完成 ({len(recording['events'])} 个事件)")
+    root.destroy()
+
+    summary = summarize(latencies)
+    print(f"\n{'事件':<12}{'次数':>8}{'p50':>10}{'p95':>10}{'p99':>10}{'max':>10}  (ms)")
+    for kind, stats in summary.items():
+        print(f"{kind:<12}{stats['count']:>8}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}"
+              f"{stats['p99_ms']:>10.2f}{stats['max_ms']:>10.2f}")
+
+    report = {
+        'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'python': sys.version.split()[0],
+        'platform': sys.platform,
+        'recording': os.path.basename(args.recording),
+        'repeat': args.repeat,
+        'realtime': args.realtime,
+        'events': summary,
+        'results': baseline_results(summary),
+    }
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"\n💾 结果已保存到: {args.output}")
+
+    if args.baseline:
+        from benchmark import REGRESSION_THRESHOLD, compare_with_baseline
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        threshold = REGRESSION_THRESHOLD if args.threshold is None else args.threshold
+        regressions = compare_with_baseline(report['results'], baseline, threshold)
+        if regressions:
+            print(f"\n❌ 发现 {len(regressions)} 项交互性能回退")
+            return 1
+        print("\n✅ 没有发现交互性能回退")
+    return 0
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\n👋 回放已取消")
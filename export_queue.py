@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+壁纸编辑器 - 后台导出队列
+每次保存把项目快照（区域深拷贝，源图和亮度积分图只读共享）放入队列，由工作线程按优先级执行，
+编辑不必等待导出完成。同一输出文件的新任务会取代仍在排队或正在执行的旧任务。
+取消是协作式的：任务在合成、编码等阶段之间检查取消标志；输出先写临时文件，
+只有未被取消时才在队列锁内替换正式文件，所以被取代的旧任务不会覆盖新结果。
+使用线程而不是进程：合成和编码的耗时部分在 Pillow 内部释放 GIL，线程之间还能共享已解码的源图和各级缓存
+"""
+
+import itertools
+import os
+import threading
+import time
+
+from perf_metrics import metrics
+from wallpaper_render import (ANIMATED_FORMATS, build_output_path, encode_image, export_targets,
+                              format_for_path, format_size, save_animated, target_output_path)
+
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2
+PRIORITY_LABELS = {PRIORITY_HIGH: '高', PRIORITY_NORMAL: '普通', PRIORITY_LOW: '低'}
+
+STATE_LABELS = {
+    'queued': '⏳ 排队中',
+    'running': '⚙️ 导出中',
+    'done': '✅ 完成',
+    'failed': '❌ 失败',
+    'cancelled': '⛔ 已取消',
+    'superseded': '⏭️ 已被取代',
+}
+ACTIVE_STATES = ('queued', 'running')
+FINISHED_LIMIT = 50  # 队列中保留的已结束任务数
+
+_job_ids = itertools.count(1)
+
+
+class ExportCancelled(Exception):
+    """导出任务已取消或被取代"""
+
+
+class ExportJob:
+    """一个导出任务：run(job) 在工作线程中执行，返回结果字典或结果列表"""
+
+    def __init__(self, kind, name, outputs, run, priority=PRIORITY_NORMAL):
+        self.id = next(_job_ids)
+        self.kind = kind  # 计时名称，如 save_wallpaper
+        self.name = name
+        self.outputs = frozenset(outputs)  # 输出路径，用于判断新任务是否取代旧任务
+        self.run = run
+        self.priority = priority
+        self.state = 'queued'
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.queue = None
+        self.cancel_reason = None
+        self._cancelled = threading.Event()
+        self._temp_paths = set()
+
+    def check(self):
+        """阶段之间调用：已取消时抛出 ExportCancelled"""
+        if self._cancelled.is_set():
+            raise ExportCancelled()
+
+    def temp_path(self, file_path):
+        """输出文件对应的临时文件（保留扩展名，编码器按扩展名识别格式）"""
+        base, ext = os.path.splitext(file_path)
+        temp_path = f"{base}.{self.id}.part{ext}"
+        self._temp_paths.add(temp_path)
+        return temp_path
+
+    def commit(self, temp_path, file_path):
+        """未取消时用临时文件替换输出文件（与取代检查在同一把锁内，保证不会覆盖更新的结果）"""
+        with self.queue.lock:
+            self.check()
+            os.replace(temp_path, file_path)
+        self._temp_paths.discard(temp_path)
+
+    def cleanup(self):
+        """删除未提交的临时文件"""
+        for temp_path in self._temp_paths:
+            try:
+                os.remove(temp_path)
+            except OSError:
+                pass
+        self._temp_paths.clear()
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def describe(self):
+        """状态面板中的一行"""
+        line = f"{STATE_LABELS[self.state]}  {self.name}  [{PRIORITY_LABELS[self.priority]}]"
+        if self.state == 'running':
+            line += f"  {self.elapsed:.1f} 秒"
+        elif self.state == 'done':
+            results = self.result if isinstance(self.result, list) else [self.result]
+            line += f"  {self.elapsed:.1f} 秒, {format_size(sum(result['bytes'] for result in results))}"
+        elif self.state == 'failed':
+            line += f"  {self.error}"
+        return line
+
+
+class ExportQueue:
+    """按优先级（同优先级先进先出）执行导出任务的线程池"""
+
+    def __init__(self, workers=1):
+        self.jobs = []  # 所有任务（含最近结束的），按提交顺序
+        self.lock = threading.RLock()
+        self._wakeup = threading.Condition(self.lock)
+        self._closed = False
+        self._threads = [threading.Thread(target=self._work, name=f'export-{index}', daemon=True)
+                         for index in range(workers)]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, job):
+        """加入队列；输出相同的排队中或执行中的旧任务被取代"""
+        with self.lock:
+            for other in self.jobs:
+                if other.state in ACTIVE_STATES and other.outputs & job.outputs:
+                    self._cancel(other, 'superseded')
+            job.queue = self
+            self.jobs.append(job)
+            self._trim()
+            self._wakeup.notify()
+        return job
+
+    def cancel(self, job, reason='cancelled'):
+        """取消任务：排队中的直接结束，执行中的在下一个检查点停止"""
+        with self.lock:
+            self._cancel(job, reason)
+
+    def _cancel(self, job, reason):
+        if job.state not in ACTIVE_STATES or job.cancel_reason:
+            return
+        job.cancel_reason = reason
+        job._cancelled.set()
+        metrics.count(f'export.{reason}')
+        if job.state == 'queued':
+            job.state = reason
+            job.finished = time.time()
+
+    def set_priority(self, job, priority):
+        """调整排队中任务的优先级"""
+        with self.lock:
+            if job.state == 'queued':
+                job.priority = priority
+
+    def pending(self):
+        """排队中和执行中的任务数"""
+        with self.lock:
+            return sum(1 for job in self.jobs if job.state in ACTIVE_STATES)
+
+    def clear_finished(self):
+        with self.lock:
+            self.jobs = [job for job in self.jobs if job.state in ACTIVE_STATES]
+
+    def _trim(self):
+        finished = [job for job in self.jobs if job.state not in ACTIVE_STATES]
+        for job in finished[:max(0, len(finished) - FINISHED_LIMIT)]:
+            self.jobs.remove(job)
+
+    def _next_job(self):
+        queued = [job for job in self.jobs if job.state == 'queued']
+        return min(queued, key=lambda job: (job.priority, job.id)) if queued else None
+
+    def _work(self):
+        while True:
+            with self.lock:
+                job = self._next_job()
+                while job is None:
+                    if self._closed:
+                        return
+                    self._wakeup.wait()
+                    job = self._next_job()
+                job.state = 'running'
+                job.started = time.time()
+
+            state = 'done'
+            try:
+                job.check()
+                job.result = job.run(job)
+                metrics.record(job.kind, time.time() - job.started)
+            except ExportCancelled:
+                state = job.cancel_reason
+            except Exception as e:
+                state = 'failed'
+                job.error = str(e)
+            finally:
+                job.cleanup()
+
+            with self.lock:
+                job.state = state
+                job.finished = time.time()
+                self._trim()
+
+    def shutdown(self, cancel=True, timeout=None):
+        """停止接收任务；cancel 为 True 时取消所有未完成的任务，然后等待工作线程退出
+        （timeout 为所有线程合计的最长等待秒数）"""
+        with self.lock:
+            self._closed = True
+            if cancel:
+                for job in self.jobs:
+                    self._cancel(job, 'cancelled')
+            self._wakeup.notify_all()
+        deadline = None if timeout is None else time.monotonic() + timeout
+        for thread in self._threads:
+            thread.join(None if deadline is None else max(0.0, deadline - time.monotonic()))
+
+
+def wallpaper_job(compositor, snapshot, priority=PRIORITY_NORMAL):
+    """保存壁纸任务：输出文件名与同步保存相同（原文件名_edit.扩展名）"""
+    file_path = build_output_path(snapshot['image_path'], snapshot['fmt'])
+
+    def run(job):
+        fmt = snapshot['fmt']
+        temp_path = job.temp_path(file_path)
+        if snapshot['animated'] and format_for_path(file_path) in ANIMATED_FORMATS:
+            # 动画：区域图层只合成一次，逐帧叠加后写出
+            layer = compositor.compose_layer(snapshot['image'].size, snapshot['regions'],
+                                             snapshot['scale'], snapshot['stats'])
+            job.check()
+            result = save_animated(snapshot['image_path'], layer, temp_path, snapshot['profile'],
+                                   fmt or format_for_path(file_path))
+        else:
+            image = compositor.compose(snapshot['image'], snapshot['regions'], snapshot['scale'],
+                                       snapshot['stats'])
+            job.check()
+            result = encode_image(image, temp_path, snapshot['profile'], fmt or format_for_path(file_path))
+        job.commit(temp_path, file_path)
+        result['path'] = file_path
+        return result
+
+    return ExportJob('save_wallpaper', os.path.basename(file_path), [file_path], run, priority)
+
+
+def targets_job(compositor, snapshot, targets, priority=PRIORITY_LOW):
+    """多目标导出任务：合成一次母版，再逐个裁剪/缩放编码"""
+    outputs = [target_output_path(snapshot['image_path'], target, snapshot['fmt'])[0] for target in targets]
+
+    def run(job):
+        master = compositor.compose(snapshot['image'], snapshot['regions'], snapshot['scale'],
+                                    snapshot['stats'])
+        job.check()
+        return export_targets(master, snapshot['image_path'], targets, snapshot['profile'],
+                              snapshot['fmt'], job=job)
+
+    name = f"{os.path.basename(snapshot['image_path'])} → {len(targets)} 个目标"
+    return ExportJob('export_multi_targets', name, outputs, run, priority)
@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+壁纸编辑器 - 合成结果黄金图像回归检查
+用固定的一组项目（合成壁纸 + 区域）渲染导出结果，与保存的黄金图像逐像素比较，
+超出容差时输出差异图；同时记录渲染耗时，便于放心地替换更快的合成实现
+
+用法:
+    python golden_images.py --update             # 在参考机器上生成/更新黄金图像
+    python golden_images.py                      # 检查当前实现
+    python golden_images.py --tolerance 2 --cases fills long_labels
+
+标签固定使用 Pillow 自带的字体（需要 Pillow 10.1+），不依赖系统字体；
+字形光栅化仍随 FreeType 版本变化，清单中记录了生成时的字体和版本。
+自带字体没有中日韩字形，中文标签画成缺字方框：语料检查长标签的换行、位置和颜色，
+不覆盖中文字形的渲染，换用系统中文字体后仍需人工查看导出结果。
+黄金图像保存为与源图的差值（区域之外全为 0），提交到仓库的体积很小
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import PIL
+from PIL import Image, features
+
+from benchmark import synthetic_regions, synthetic_wallpaper
+from region_layout import LuminanceStats
+from wallpaper_render import BUNDLED_FONT, Compositor, load_font
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+DIFF_DIR = "golden_diff"
+MANIFEST_NAME = "manifest.json"
+DEFAULT_TOLERANCE = 2  # 每个通道允许的最大差值
+GOLDEN_FONT = BUNDLED_FONT  # 固定的标签字体
+
+
+def _region(x, y, width, height, text, color, alpha=150, **style):
+    """语料中的区域（预览坐标）"""
+    region = {'x': x, 'y': y, 'width': width, 'height': height,
+              'name': text or '区域', 'text': text, 'color': color, 'alpha': alpha}
+    region.update(style)
+    return region
+
+
+def _fit(size, preview=(1200, 800)):
+    """与编辑器相同的适应窗口缩放比例"""
+    return min(preview[0] / size[0], preview[1] / size[1])
+
+
+# 固定语料：名称 -> (源图尺寸, 源图模式, 预览缩放比例, 区域列表)
+# 缩放比例特意包含不能整除的值，覆盖 int(x / scale) 取整
+# 源图只比预览窗口略大（upscale 除外），控制提交到仓库的黄金图像体积
+CORPUS = {
+    'template': ((1366, 768), 'RGB', _fit((1366, 768)), [
+        _region(15, 15, 176, 315, '待处理', '#FFD700'),
+        _region(206, 15, 176, 315, '挂起', '#90EE90'),
+        _region(397, 15, 176, 315, '处理中', '#CD853F'),
+        _region(15, 345, 270, 200, '参考', '#D3D3D3'),
+        _region(300, 345, 270, 200, '迭代', '#D3D3D3'),
+    ]),
+    'fills': ((1280, 720), 'RGB', _fit((1280, 720)), [
+        _region(20, 20, 300, 180, '线性渐变', '#3b82f6', 180, fill='linear', color2='#000000'),
+        _region(340, 20, 300, 180, '径向渐变', '#f59e0b', 200, fill='radial', color2='#7c3aed'),
+        _region(660, 20, 300, 180, '毛玻璃', '#ffffff', 60, fill='frosted', blur=12),
+        _region(20, 220, 300, 180, '圆角', '#10b981', 160, corner_radius=24),
+        _region(340, 220, 300, 180, '圆角毛玻璃', '#ffffff', 80, fill='frosted', blur=20,
+                corner_radius=16),
+        _region(660, 220, 300, 180, '圆角渐变', '#ef4444', 220, fill='linear',
+                color2='#fde68a', corner_radius=32),
+    ]),
+    'edge_clipping': ((1920, 1080), 'RGB', 0.6254, [
+        _region(0, 0, 120, 80, '左上', '#ef4444'),
+        _region(1150, 0, 120, 80, '越界', '#22c55e'),
+        _region(0, 595, 140, 80, '底边', '#3b82f6', fill='frosted', blur=8),
+        _region(1137, 603, 63, 41, '角', '#a855f7', 255, corner_radius=12),
+        _region(333, 333, 1, 1, '', '#000000', 255),
+    ]),
+    # 没有空格的长标签（按字符换行）和中英文混排；中文字形为缺字方框
+    'long_labels': ((1280, 800), 'RGB', _fit((1280, 800)), [
+        _region(20, 20, 360, 90, '本周需要完成的重要文档和会议纪要', '#000000', 0),
+        _region(20, 130, 360, 90, '设计稿、素材与参考资料（按项目归档）', '#ffffff', 255),
+        _region(400, 20, 90, 300, '临时下载文件夹——每周五清理一次', '#1e293b', 128),
+        _region(400, 340, 300, 40, 'Mixed 中英文 Label 123', '#fde68a', 100),
+    ]),
+    'rgba_source': ((1600, 1000), 'RGBA', _fit((1600, 1000)), [
+        _region(50, 50, 400, 250, '透明源图', '#3b82f6', 120),
+        _region(500, 300, 300, 200, '毛玻璃', '#ffffff', 50, fill='frosted', blur=10),
+    ]),
+    'upscale': ((800, 600), 'RGB', _fit((800, 600)), [
+        _region(100, 100, 400, 300, '放大预览', '#10b981', 140, corner_radius=20),
+        _region(550, 150, 200, 500, '径向', '#f43f5e', 160, fill='radial'),
+    ]),
+    'many_regions': ((1280, 720), 'RGB', _fit((1280, 720)),
+                     synthetic_regions(100, (1200, 675), seed=7)),
+    'icon_grid': ((1440, 900), 'RGB', _fit((1440, 900)), [
+        _region(20, 20, 530, 310, '', '#ffffff', 60, type='grid', rows=3, columns=5, gutter=7.5,
+                corner_radius=6, labels=['回收站', '此电脑', '', '文档', 'Chrome', '终端']),
+        _region(580, 20, 250, 250, '', '#0f172a', 90, type='grid', rows=2, columns=2, gutter=10,
+                fill='frosted', blur=10, corner_radius=12, labels=['设计', '', '', '归档']),
+    ]),
+}
+
+
+def corpus_source(size, mode):
+    """语料的源图（确定性生成）；RGBA 源图带有渐变透明度。
+    不加像素噪声：半透明区域会把噪声带进差值，黄金图像就无法压缩"""
+    image = synthetic_wallpaper(size, seed=size[0] * 31 + size[1], noise=0)
+    if mode == 'RGBA':
+        alpha = np.linspace(64, 255, size[0], dtype=np.float32)[None, :].repeat(size[1], axis=0)
+        image = image.convert('RGBA')
+        image.putalpha(Image.fromarray(alpha.astype(np.uint8), 'L'))
+    return image
+
+
+def render_case(name, repeat=1):
+    """渲染一个语料项目（与 save_wallpaper 相同的合成路径），返回 (图片, 中位耗时秒, 源图)"""
+    size, mode, scale, regions = CORPUS[name]
+    source = corpus_source(size, mode)
+    stats = LuminanceStats(source)
+    runs = []
+    output = None
+    for _ in range(repeat):
+        # 每次使用新的合成器，计入字体和贴图的冷启动开销
+        start = time.perf_counter()
+        output = Compositor(font_path=GOLDEN_FONT).compose(source, regions, scale, stats)
+        runs.append(time.perf_counter() - start)
+    return output, statistics.median(runs), source
+
+
+def golden_path(name):
+    """语料对应的黄金图像文件"""
+    return os.path.join(GOLDEN_DIR, f"{name}.delta.png")
+
+
+def save_golden(name, output, source):
+    """保存黄金图像：逐通道 (输出 - 源图) mod 256"""
+    delta = np.asarray(output, dtype=np.uint8) - np.asarray(source.convert(output.mode), dtype=np.uint8)
+    Image.fromarray(delta, output.mode).save(golden_path(name), optimize=True)
+
+
+def load_golden(name, source):
+    """读取黄金图像并加回源图，不存在时返回 None"""
+    try:
+        with Image.open(golden_path(name)) as delta:
+            delta.load()
+    except FileNotFoundError:
+        return None
+    base = np.asarray(source.convert(delta.mode), dtype=np.uint8)
+    return Image.fromarray(base + np.asarray(delta, dtype=np.uint8), delta.mode)
+
+
+def compare_images(actual, expected, tolerance):
+    """逐像素比较，返回 (超出容差的像素数, 最大通道差, 差异掩码)"""
+    if actual.size != expected.size or actual.mode != expected.mode:
+        return None, None, None
+    difference = np.abs(np.asarray(actual, dtype=np.int16) - np.asarray(expected, dtype=np.int16))
+    per_pixel = difference.max(axis=2)
+    mask = per_pixel > tolerance
+    return int(mask.sum()), int(per_pixel.max()), mask
+
+
+def diff_image(actual, mask):
+    """差异图：超出容差的像素标红，其余像素变暗"""
+    base = np.asarray(actual.convert('RGB'), dtype=np.uint8) // 3
+    base[mask] = (255, 0, 0)
+    return Image.fromarray(base, 'RGB')
+
+
+def font_identity():
+    """黄金图像使用的标签字体及 Pillow、FreeType 版本（字形光栅化依赖于它们）"""
+    font = load_font(font_path=GOLDEN_FONT)
+    return f"{' '.join(font.getname())} (Pillow {PIL.__version__}, FreeType {features.version('freetype2')})"
+
+
+def load_manifest():
+    try:
+        with open(os.path.join(GOLDEN_DIR, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'cases': {}}
+
+
+def update_goldens(names, repeat):
+    """重新生成黄金图像和清单"""
+    os.makedirs(GOLDEN_DIR, exist_ok=True)
+    manifest = load_manifest()
+    manifest['font'] = font_identity()
+    for name in names:
+        output, seconds, source = render_case(name, repeat)
+        save_golden(name, output, source)
+        manifest['cases'][name] = {'size': list(output.size), 'render_ms': round(seconds * 1000, 2)}
+        print(f"  💾 {name:<16} {output.size[0]}×{output.size[1]}  {seconds * 1000:8.1f} ms")
+    with open(os.path.join(GOLDEN_DIR, MANIFEST_NAME), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return True
+
+
+def check_goldens(names, repeat, tolerance, max_bad_pixels):
+    """检查所有语料，返回是否全部通过"""
+    manifest = load_manifest()
+    font = font_identity()
+    if manifest.get('font') and manifest['font'] != font:
+        print(f"⚠️  黄金图像使用的字体为 {manifest['font']}，当前为 {font}，标签像素可能不一致")
+
+    passed = True
+    for name in names:
+        if not os.path.exists(golden_path(name)):
+            print(f"  ⚠️ {name:<16} 缺少黄金图像，请先运行 --update")
+            passed = False
+            continue
+
+        output, seconds, source = render_case(name, repeat)
+        golden = load_golden(name, source)
+        bad, max_delta, mask = compare_images(output, golden, tolerance)
+
+        baseline_ms = manifest['cases'].get(name, {}).get('render_ms')
+        timing = f"{seconds * 1000:8.1f} ms"
+        if baseline_ms:
+            timing += f" ({seconds * 1000 / baseline_ms:.2f}x)"
+
+        if bad is None:
+            print(f"  ❌ {name:<16} 尺寸或模式不一致: {output.size} {output.mode} / "
+                  f"{golden.size} {golden.mode}")
+            passed = False
+        elif bad > max_bad_pixels:
+            os.makedirs(DIFF_DIR, exist_ok=True)
+            output.save(os.path.join(DIFF_DIR, f"{name}_actual.png"))
+            diff_image(output, mask).save(os.path.join(DIFF_DIR, f"{name}_diff.png"))
+            print(f"  ❌ {name:<16} {bad} 个像素超出容差（最大差值 {max_delta}）{timing}"
+                  f"  差异图: {os.path.join(DIFF_DIR, name + '_diff.png')}")
+            passed = False
+        else:
+            print(f"  ✅ {name:<16} 最大差值 {max_delta} {timing}")
+    return passed
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="合成结果黄金图像回归检查")
+    parser.add_argument('--update', action='store_true', help="重新生成黄金图像")
+    parser.add_argument('--cases', nargs='+', default=list(CORPUS), choices=list(CORPUS),
+                        help="只运行指定的语料")
+    parser.add_argument('--tolerance', type=int, default=DEFAULT_TOLERANCE,
+                        help="每个通道允许的最大差值")
+    parser.add_argument('--max-bad-pixels', type=int, default=0,
+                        help="允许超出容差的像素数")
+    parser.add_argument('--repeat', type=int, default=3, help="渲染次数（耗时取中位数）")
+    args = parser.parse_args()
+
+    print("=" * 50)
+    print("🖼️ 壁纸编辑器 - 黄金图像回归检查")
+    print("=" * 50)
+
+    if args.update:
+        update_goldens(args.cases, args.repeat)
+        print(f"\n🎉 黄金图像已更新: {GOLDEN_DIR}")
+        return 0
+    if check_goldens(args.cases, args.repeat, args.tolerance, args.max_bad_pixels):
+        print("\n✅ 全部通过")
+        return 0
+    print("\n❌ 存在差异")
+    return 1
+
+
+if __name__ == "__main__":
+    try:
+        sys.exit(main())
+    except KeyboardInterrupt:
+        print("\n👋 检查已取消")
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+壁纸编辑器 - 延迟导入
+启动时只登记模块，第一次访问属性时才真正执行导入，
+把 numpy、字体和对话框等启动用不到的模块挪到窗口出现之后
+"""
+
+import importlib
+import importlib.util
+import sys
+import types
+
+
+class LazyModule(types.ModuleType):
+    """占位模块：第一次访问属性时导入真正的模块并复制其属性，之后的访问不再经过 __getattr__。
+    不使用 importlib.util.LazyLoader：它在 Python 3.12 之前不是线程安全的，
+    渲染线程同时第一次访问时会读到只初始化了一半的模块"""
+
+    def __getattr__(self, attr):
+        module = importlib.import_module(self.__name__)  # 导入锁保证并发访问时只执行一次且等待完成
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
+def lazy_import(name):
+    """延迟导入模块：返回的模块对象在第一次访问属性时才加载（已导入时直接返回）"""
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    parent = name.rpartition('.')[0]
+    if parent:
+        importlib.import_module(parent)  # 子模块的查找依赖父包
+    if importlib.util.find_spec(name) is None:
+        raise ImportError(f"找不到模块: {name}", name=name)
+    return LazyModule(name)
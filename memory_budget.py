@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+壁纸编辑器 - 图像内存预算
+各级图像缓存（原图、预览金字塔、瓦片、覆盖层、文字贴图、模糊结果）和导出时的临时缓冲区
+都登记到这里，按类别统计占用；超出预算时按登记顺序从最容易重建的缓存开始淘汰，
+仍然放不下时由调用方改走分块路径。
+持有 Tk 对象（PhotoImage）的缓存只能在主线程淘汰：导出线程触发的检查跳过它们，
+记下待办，由主线程下次调用 enforce_deferred 时补做。
+设置环境变量 WALLPAPER_MEMORY_BUDGET（MB）可调整预算
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+DEFAULT_MEMORY_LIMIT = 2048 * 1024 * 1024  # 默认预算（字节）
+
+
+class MemoryBudget:
+    """全局图像内存预算：按类别统计，超出时淘汰缓存"""
+
+    def __init__(self, limit=DEFAULT_MEMORY_LIMIT):
+        self.limit = limit
+        self.categories = OrderedDict()  # 名称 -> (占用函数, 淘汰函数, 是否只能在主线程淘汰)，按淘汰优先级排列
+        self.transient = {}  # 名称 -> 正在使用的临时缓冲区字节数
+        self.evicted = {}  # 名称 -> 累计淘汰字节数
+        self.peak = 0
+        self.deferred = 0  # 非主线程的检查跳过主线程专属类别后仍缺少的字节数
+        self._lock = threading.RLock()
+
+    def register(self, name, usage, evict=None, main_thread_only=False):
+        """登记一个类别：usage() 返回当前占用，evict(字节数) 尽量释放并返回实际释放量；
+        main_thread_only 为 True 时只在主线程淘汰（缓存内容是 Tk 对象）"""
+        self.categories[name] = (usage, evict, main_thread_only)
+
+    def register_cache(self, name, cache, main_thread_only=False):
+        """登记一个按字节计量的 LRUCache，缓存放入新内容时会触发预算检查"""
+        cache.budget = self
+        self.register(name, lambda: cache.bytes, cache.evict, main_thread_only)
+
+    def usage(self):
+        """各类别当前占用（字节），包括临时缓冲区"""
+        usage = {name: category[0]() for name, category in self.categories.items()}
+        with self._lock:
+            for name, size in self.transient.items():
+                usage[name] = usage.get(name, 0) + size
+        return usage
+
+    def total(self):
+        return sum(self.usage().values())
+
+    def enforce(self, extra=0):
+        """淘汰缓存直到总占用加上 extra 不超过预算，返回是否已满足"""
+        main_thread = threading.current_thread() is threading.main_thread()
+        with self._lock:
+            total = self.total()
+            self.peak = max(self.peak, total)
+            over = total + extra - self.limit
+            skipped = False
+            for name, (usage, evict, main_thread_only) in self.categories.items():
+                if over <= 0:
+                    break
+                if main_thread_only and not main_thread:
+                    skipped = True
+                elif evict is not None:
+                    freed = evict(over)
+                    if freed:
+                        self.evicted[name] = self.evicted.get(name, 0) + freed
+                        over -= freed
+            if skipped and over > 0:
+                self.deferred = max(self.deferred, over)
+            return over <= 0
+
+    def enforce_deferred(self):
+        """主线程调用：补做导出线程跳过的淘汰，为下一次导出腾出当时缺少的空间"""
+        with self._lock:
+            deferred, self.deferred = self.deferred, 0
+        if deferred:
+            self.enforce(deferred)
+
+    def fits(self, nbytes):
+        """为即将分配的 nbytes 腾出空间，腾不出时返回 False（调用方应改走分块路径）"""
+        return self.enforce(nbytes)
+
+    @contextmanager
+    def reserve(self, name, nbytes):
+        """在 with 块内把一块临时缓冲区计入预算"""
+        with self._lock:
+            self.transient[name] = self.transient.get(name, 0) + nbytes
+            self.peak = max(self.peak, self.total())
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.transient[name] -= nbytes
+                if not self.transient[name]:
+                    del self.transient[name]
+
+    def report(self):
+        """预算、总占用、峰值和各类别占用（可直接序列化为JSON）"""
+        usage = self.usage()
+        return {
+            'limit_bytes': self.limit,
+            'total_bytes': sum(usage.values()),
+            'peak_bytes': self.peak,
+            'categories': usage,
+            'evicted_bytes': dict(self.evicted)
+        }
+
+
+def _configured_limit():
+    """从环境变量读取预算（MB），未设置或无效时使用默认值"""
+    try:
+        return int(os.environ['WALLPAPER_MEMORY_BUDGET']) * 1024 * 1024
+    except (KeyError, ValueError):
+        return DEFAULT_MEMORY_LIMIT
+
+
+# 全局预算实例
+memory_budget = MemoryBudget(_configured_limit())
@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+壁纸编辑器 - 性能统计
+热点路径的计时器和计数器；未启用时只多一次属性检查，几乎没有开销。
+设置环境变量 WALLPAPER_PERF=1 可在启动时即开始统计
+"""
+
+import functools
+import json
+import math
+import os
+import sys
+import threading
+import time
+from contextlib import nullcontext
+
+_NULL_TIMER = nullcontext()  # 未启用时共享的空计时器
+
+
+class _Timer:
+    """with 语句计时器"""
+
+    __slots__ = ('metrics', 'name', 'start')
+
+    def __init__(self, metrics, name):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.record(self.name, time.perf_counter() - self.start)
+
+
+class Metrics:
+    """计时器、计数器和缓存命中率的汇总"""
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.timers = {}  # 名称 -> [次数, 总耗时, 最大耗时, 最近一次耗时]（秒）
+        self.counters = {}
+        self.caches = {}  # 名称 -> 带 hits/misses 属性的缓存对象
+        self.reports = {}  # 名称 -> 返回可序列化数据的函数（如内存预算）
+        self._lock = threading.Lock()
+
+    def timer(self, name):
+        """计时上下文：with metrics.timer('save'): ..."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name)
+
+    def timed(self, name):
+        """计时装饰器，是否启用在每次调用时判断"""
+        def decorator(func):
+            @functools.wraps(func)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return func(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return func(*args, **kwargs)
+                finally:
+                    self.record(name, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def record(self, name, seconds):
+        """记录一次耗时"""
+        with self._lock:
+            stat = self.timers.get(name)
+            if stat is None:
+                stat = self.timers[name] = [0, 0.0, 0.0, 0.0]
+            stat[0] += 1
+            stat[1] += seconds
+            stat[2] = max(stat[2], seconds)
+            stat[3] = seconds
+
+    def count(self, name, amount=1):
+        """计数器累加"""
+        if self.enabled:
+            with self._lock:
+                self.counters[name] = self.counters.get(name, 0) + amount
+
+    def register_cache(self, name, cache):
+        """登记一个缓存，统计时读取它的 hits/misses"""
+        self.caches[name] = cache
+
+    def register_report(self, name, report):
+        """登记一个附加报告，统计时调用 report() 并写入快照"""
+        self.reports[name] = report
+
+    def reset(self):
+        """清空计时和计数（缓存登记保留）"""
+        with self._lock:
+            self.timers.clear()
+            self.counters.clear()
+
+    def snapshot(self):
+        """当前统计数据（可直接序列化为JSON）"""
+        with self._lock:
+            timers = {
+                name: {
+                    'count': count,
+                    'total_ms': round(total * 1000, 3),
+                    'mean_ms': round(total * 1000 / count, 3),
+                    'max_ms': round(peak * 1000, 3),
+                    'last_ms': round(last * 1000, 3)
+                }
+                for name, (count, total, peak, last) in self.timers.items()
+            }
+            counters = dict(self.counters)
+        caches = {}
+        for name, cache in self.caches.items():
+            total = cache.hits + cache.misses
+            caches[name] = {
+                'hits': cache.hits,
+                'misses': cache.misses,
+                'hit_rate': round(cache.hits / total, 4) if total else None
+            }
+        return {
+            'timestamp': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'python': sys.version.split()[0],
+            'platform': sys.platform,
+            'timers': timers,
+            'counters': counters,
+            'caches': caches,
+            'memory_bytes': memory_usage(),
+            **{name: report() for name, report in self.reports.items()}
+        }
+
+    def dump(self, file_path):
+        """把统计数据写入JSON文件，便于比较不同版本"""
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(self.snapshot(), f, ensure_ascii=False, indent=2)
+
+
+def percentile(sorted_values, fraction):
+    """已排序数据的分位数（最近秩法）"""
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def memory_usage():
+    """当前进程占用的物理内存（字节），无法获取时返回 None"""
+    if sys.platform == 'win32':
+        import ctypes
+        from ctypes import wintypes
+
+        class ProcessMemoryCounters(ctypes.Structure):
+            _fields_ = [('cb', wintypes.DWORD),
+                        ('PageFaultCount', wintypes.DWORD),
+                        ('PeakWorkingSetSize', ctypes.c_size_t),
+                        ('WorkingSetSize', ctypes.c_size_t),
+                        ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                        ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                        ('PagefileUsage', ctypes.c_size_t),
+                        ('PeakPagefileUsage', ctypes.c_size_t)]
+
+        counters = ProcessMemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        handle = ctypes.windll.kernel32.GetCurrentProcess()
+        if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+            return counters.WorkingSetSize
+        return None
+
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # 只能拿到峰值：macOS 单位为字节，其他系统为KB
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+# 全局统计实例
+metrics = Metrics(enabled=os.environ.get('WALLPAPER_PERF') == '1')
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+壁纸编辑器 - 解码像素缓存
+将解码后的RGBA像素以原始格式写入磁盘，再次打开时通过内存映射按需读取。
+缓存目录本身就是索引：文件名记录指纹和尺寸，修改时间记录最近访问，
+编辑器、渲染服务和监视进程共用同一目录时不会互相覆盖索引
+"""
+
+import hashlib
+import os
+import re
+import threading
+import time
+import weakref
+
+from PIL import Image
+
+from lazy_import import lazy_import
+
+mmap = lazy_import('mmap')  # 第一次打开壁纸时才加载
+
+DATA_NAME = re.compile(r'^([0-9a-f]{40})\.(\d+)x(\d+)\.rgba$')  # 指纹.宽x高.rgba
+LEGACY_NAMES = re.compile(r'^(?:[0-9a-f]{40}\.rgba|index\.json)$')  # 旧版本的数据文件和索引
+
+
+class PixelCache:
+    """磁盘上的解码像素缓存（内存映射 + LRU淘汰）"""
+
+    STRIP_ROWS = 256  # 分条写入，避免一次性 tobytes() 复制整张大图
+
+    def __init__(self, cache_dir=None, max_bytes=2 * 1024 ** 3):
+        if cache_dir is None:
+            cache_dir = os.path.join(os.getcwd(), "pixel_cache")
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes  # 缓存总大小上限（字节）
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._mapped = weakref.WeakValueDictionary()  # 仍被图片引用的映射，淘汰时跳过
+        self._index = self._scan()
+
+    def fingerprint(self, file_path):
+        """根据路径、大小和修改时间生成文件指纹"""
+        stat = os.stat(file_path)
+        raw = f"{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}"
+        return hashlib.sha1(raw.encode('utf-8')).hexdigest()
+
+    def open_image(self, file_path):
+        """打开图片：命中缓存时直接映射像素，否则解码后写入缓存"""
+        key = self.fingerprint(file_path)
+        with self._lock:
+            entry = self._index.get(key)
+            if entry is None:
+                # 其他进程可能已经写入
+                self._index = self._scan()
+                entry = self._index.get(key)
+            if entry is not None:
+                image = self._map_entry(key, entry)
+                if image is not None:
+                    self.hits += 1
+                    self._touch(key, entry)
+                    return image
+            self.misses += 1
+
+        # 缓存未命中：完整解码一次
+        decoded = Image.open(file_path)
+        decoded.load()
+        if decoded.mode != 'RGBA':
+            decoded = decoded.convert('RGBA')
+
+        with self._lock:
+            try:
+                entry = self._write_entry(key, decoded)
+            except OSError as e:
+                # 磁盘不可写时直接返回解码结果，不影响使用
+                print(f"像素缓存写入失败: {str(e)}")
+                return decoded
+            self._evict()
+            image = self._map_entry(key, entry)
+        return image if image is not None else decoded
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._index = self._scan()
+            for key in list(self._index):
+                self._remove_entry(key)
+
+    def total_bytes(self):
+        """当前缓存占用的字节数"""
+        return sum(entry['bytes'] for entry in self._index.values())
+
+    def _data_path(self, key, entry):
+        return os.path.join(self.cache_dir, f"{key}.{entry['width']}x{entry['height']}.rgba")
+
+    def _scan(self):
+        """扫描缓存目录重建索引：指纹 -> 尺寸、字节数和最近访问时间；顺便删除旧版本留下的文件"""
+        index = {}
+        try:
+            with os.scandir(self.cache_dir) as entries:
+                files = list(entries)
+        except OSError:
+            return index
+        for item in files:
+            match = DATA_NAME.match(item.name)
+            if match is None:
+                if LEGACY_NAMES.match(item.name):
+                    try:
+                        os.remove(item.path)
+                    except OSError:
+                        pass
+                continue
+            try:
+                stat = item.stat()
+            except OSError:
+                continue  # 刚被其他进程淘汰
+            width, height = int(match.group(2)), int(match.group(3))
+            index[match.group(1)] = {
+                'width': width,
+                'height': height,
+                'bytes': width * height * 4,
+                'atime': stat.st_mtime
+            }
+        return index
+
+    def _touch(self, key, entry):
+        """记录一次访问（文件修改时间即最近访问时间，其他进程淘汰时也能看到）"""
+        entry['atime'] = time.time()
+        try:
+            os.utime(self._data_path(key, entry), (entry['atime'], entry['atime']))
+        except OSError:
+            pass
+
+    def _map_entry(self, key, entry):
+        """将缓存文件映射为只读图片，页面在访问时才会被读入"""
+        try:
+            with open(self._data_path(key, entry), 'rb') as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            self._remove_entry(key)
+            return None
+        if len(mapped) != entry['bytes']:
+            mapped.close()
+            self._remove_entry(key)
+            return None
+        self._mapped[key] = mapped
+        return Image.frombuffer('RGBA', (entry['width'], entry['height']),
+                                mapped, 'raw', 'RGBA', 0, 1)
+
+    def _write_entry(self, key, image):
+        """分条写入原始RGBA像素，写完后再原子替换（临时文件按进程区分）"""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        width, height = image.size
+        entry = {
+            'width': width,
+            'height': height,
+            'bytes': width * height * 4,
+            'atime': time.time()
+        }
+        data_path = self._data_path(key, entry)
+        tmp_path = f"{data_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                for top in range(0, height, self.STRIP_ROWS):
+                    bottom = min(top + self.STRIP_ROWS, height)
+                    f.write(image.crop((0, top, width, bottom)).tobytes())
+            os.replace(tmp_path, data_path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._index[key] = entry
+        return entry
+
+    def _evict(self):
+        """按最近访问时间淘汰（包括其他进程写入的文件），直到总大小不超过上限"""
+        self._index = self._scan()
+        total = self.total_bytes()
+        for key in sorted(self._index, key=lambda k: self._index[k]['atime']):
+            if total <= self.max_bytes:
+                break
+            if key in self._mapped:
+                continue
+            total -= self._index[key]['bytes']
+            self._remove_entry(key)
+
+    def _remove_entry(self, key):
+        entry = self._index.pop(key, None)
+        if entry is None:
+            return
+        try:
+            os.remove(self._data_path(key, entry))
+        except OSError:
+            # Windows 下仍被映射的文件（包括其他进程映射的）无法删除，下次再清理
+            pass
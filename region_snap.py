@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+壁纸编辑器 - 吸附与对齐参考线
+拖拽开始时把其他区域的左/中/右、上/中/下边缘排序成数组，
+拖拽过程中用二分查找定位最近的边缘，区域再多每次查询也只需 O(log n)
+"""
+
+import bisect
+
+
+class SnapIndex:
+    """区域边缘的有序索引，可选叠加等间距图标网格"""
+
+    def __init__(self, rects, canvas_size, grid=None):
+        """rects 为 (x, y, width, height) 列表；grid 为 (单元宽, 单元高)，None 表示不吸附网格"""
+        canvas_width, canvas_height = canvas_size
+        x_edges = [0, canvas_width / 2, canvas_width]
+        y_edges = [0, canvas_height / 2, canvas_height]
+        for x, y, width, height in rects:
+            x_edges.extend((x, x + width / 2, x + width))
+            y_edges.extend((y, y + height / 2, y + height))
+        self.x_edges = sorted(x_edges)
+        self.y_edges = sorted(y_edges)
+        self.grid = grid
+
+    def nearest(self, edges, value):
+        """有序数组中离 value 最近的边缘，返回偏移量"""
+        index = bisect.bisect_left(edges, value)
+        best = None
+        for candidate in edges[max(index - 1, 0):index + 1]:
+            delta = candidate - value
+            if best is None or abs(delta) < abs(best):
+                best = delta
+        return best
+
+    def snap(self, axis, values, threshold):
+        """values 为移动对象在该轴上的候选位置（如左/中/右），
+        返回 (偏移量, 参考线位置)；吸附到网格时参考线为 None，没有吸附时返回 (0, None)"""
+        edges = self.x_edges if axis == 'x' else self.y_edges
+        step = self.grid and self.grid[0 if axis == 'x' else 1]
+        best, best_distance = (0, None), threshold
+        for value in values:
+            delta = self.nearest(edges, value)
+            if delta is not None and abs(delta) <= best_distance:
+                best, best_distance = (delta, value + delta), abs(delta)
+            if step:
+                delta = round(value / step) * step - value
+                if abs(delta) < best_distance:
+                    best, best_distance = (delta, None), abs(delta)
+        return best
@@ -0,0 +1,422 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+壁纸编辑器 - 参数化区域模板
+模板是可分享的JSON文件，用边距、间距、相对尺寸和锚点描述区域之间的约束，
+求解器按图片尺寸算出每个区域的位置；求解结果按 (模板, 宽, 高) 缓存，
+批量套用到大量不同分辨率的壁纸时每张图几乎没有额外开销
+
+模板格式:
+    {
+      "name": "看板",
+      "margin": {"left": "5%", "top": "10%"},          # 内容区边距，也可以是单个值
+      "gap": "2%",                                      # 区域间距（"after"/"before" 使用）
+      "regions": [
+        {"id": "todo", "name": "待处理", "color": "#FFD700",
+         "left": 0, "top": 0, "width": "15%", "height": "80%"},
+        {"id": "doing", "name": "处理中", "color": "#CD853F",
+         "left": {"after": "todo"}, "top": 0, "width": {"match": "todo", "factor": 2},
+         "height": {"ratio": 0.75}}
+      ]
+    }
+
+长度: 数字或 "40px" 为原图像素，"15%" 为图片宽（水平方向）或高（垂直方向）的百分比。
+水平方向在 left / width / right 中给出两个（垂直方向为 top / height / bottom），
+只给出尺寸时按 anchor（如 "center"、"bottom-right"）在内容区内定位:
+    left/top      长度（距内容区起点）、{"after": id} 紧接其后、{"align": id} 起点对齐
+    right/bottom  长度（距内容区终点）、{"before": id} 紧贴其前、{"align": id} 终点对齐
+    width/height  长度、{"match": id, "factor": 系数} 相对另一区域、{"ratio": 系数} 相对本区域另一方向
+区域的其他字段（text、alpha、fill、corner_radius、type、rows 等）原样带入区域，
+corner_radius、blur、gutter 按原图像素填写
+"""
+
+import copy
+import hashlib
+import json
+import os
+
+from wallpaper_render import LRUCache
+
+TEMPLATE_DIR = "templates"  # 用户模板目录（相对工作目录，与 auto_save 相同）
+TEMPLATE_VERSION = 1
+SCALED_STYLE_KEYS = ('corner_radius', 'blur', 'gutter')  # 按原图像素填写、换算到预览坐标的样式字段
+CONSTRAINT_KEYS = ('id', 'left', 'right', 'width', 'top', 'bottom', 'height', 'anchor')
+DEFAULT_STYLE = {'text': None, 'color': '#FFFFFF', 'alpha': 150}
+
+# 每个方向的 (起点, 尺寸, 终点) 字段
+AXES = {
+    'x': ('left', 'width', 'right'),
+    'y': ('top', 'height', 'bottom'),
+}
+
+LAYOUT_CACHE = LRUCache(max_entries=1024)  # (模板摘要, 宽, 高) -> 求解后的区域框
+
+# 内置看板模板：与原来硬编码的一键生成布局相同
+KANBAN_TEMPLATE = {
+    'name': '看板',
+    'version': TEMPLATE_VERSION,
+    'margin': {'left': '5%', 'top': '10%'},
+    'gap': '2%',
+    'regions': [
+        {'id': 'todo', 'name': '待处理', 'color': '#FFD700',
+         'left': 0, 'top': 0, 'width': '15%', 'height': '80%'},
+        {'id': 'pending', 'name': '挂起', 'color': '#90EE90',
+         'left': {'after': 'todo'}, 'top': 0, 'width': '30%', 'height': '15%'},
+        {'id': 'doing', 'name': '处理中', 'color': '#CD853F',
+         'left': {'align': 'pending'}, 'top': {'after': 'pending'}, 'width': '40%', 'height': '60%'},
+        {'id': 'reference', 'name': '参考', 'color': '#D3D3D3',
+         'left': {'after': 'doing'}, 'top': 0, 'width': '25%', 'height': '80%'},
+        {'id': 'iterate', 'name': '迭代', 'color': '#D3D3D3',
+         'left': {'align': 'doing'}, 'top': {'after': 'doing'}, 'width': '30%', 'height': '15%'},
+    ],
+}
+
+BUILTIN_TEMPLATES = (KANBAN_TEMPLATE,)
+
+
+class TemplateError(ValueError):
+    """模板格式错误或约束无法求解"""
+
+
+def parse_length(value, extent):
+    """长度换算为原图像素：数字或 "px" 为像素，"%" 为 extent 的百分比"""
+    if isinstance(value, bool):
+        raise TemplateError(f"无效的长度: {value!r}")
+    if isinstance(value, (int, float)):
+        return float(value)
+    if isinstance(value, str):
+        text = value.strip().lower()
+        try:
+            if text.endswith('%'):
+                return float(text[:-1]) * extent / 100
+            if text.endswith('px'):
+                text = text[:-2]
+            return float(text)
+        except ValueError:
+            pass
+    raise TemplateError(f"无效的长度: {value!r}")
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _is_id(value):
+    """区域 id 只能是字符串或整数（JSON 中的其他类型无法作为引用）"""
+    return isinstance(value, (str, int)) and not isinstance(value, bool)
+
+
+def _check_constraint(spec, key):
+    """检查一个位置/尺寸约束的字段类型，求解时才会用到的错误在加载时就报告"""
+    value = spec.get(key)
+    if value is None:
+        return
+    if not isinstance(value, dict):
+        parse_length(value, 100)
+        return
+    for name in ('after', 'align', 'before', 'match'):
+        if name in value and not _is_id(value[name]):
+            raise TemplateError(f"区域 {_label(spec)} 的 {key} 引用了无效的 id: {value[name]!r}")
+    for name in ('factor', 'ratio'):
+        if name in value and not _is_number(value[name]):
+            raise TemplateError(f"区域 {_label(spec)} 的 {key}.{name} 必须是数字: {value[name]!r}")
+    if 'offset' in value:
+        parse_length(value['offset'], 100)
+
+
+def _edges(value, names):
+    """边距/间距：单个值或按边给出的字典，返回 {边: 原始值}"""
+    if isinstance(value, dict):
+        unknown = set(value) - set(names)
+        if unknown:
+            raise TemplateError(f"未知的字段: {', '.join(sorted(unknown))}")
+        return {name: value.get(name, 0) for name in names}
+    return {name: value for name in names}
+
+
+def _anchor(anchor, axis):
+    """锚点在某个方向上的对齐方式：'start'、'center' 或 'end'"""
+    tokens = set(str(anchor or '').replace('_', '-').split('-'))
+    if tokens & ({'right'} if axis == 'x' else {'bottom'}):
+        return 'end'
+    if tokens & ({'left'} if axis == 'x' else {'top'}):
+        return 'start'
+    return 'center' if 'center' in tokens else 'start'
+
+
+def _label(spec):
+    """错误信息中区域的称呼"""
+    return str(spec.get('name') or spec.get('id') or '(未命名)')
+
+
+class _Solver:
+    """按依赖顺序求解一个模板在指定尺寸下的区域框（浮点原图像素）"""
+
+    def __init__(self, data, width, height):
+        self.size = {'x': width, 'y': height}
+        margin = _edges(data.get('margin', 0), ('left', 'top', 'right', 'bottom'))
+        gap = _edges(data.get('gap', 0), ('x', 'y'))
+        self.content = {
+            'x': (parse_length(margin['left'], width), width - parse_length(margin['right'], width)),
+            'y': (parse_length(margin['top'], height), height - parse_length(margin['bottom'], height)),
+        }
+        self.gap = {axis: parse_length(gap[axis], self.size[axis]) for axis in AXES}
+        self.specs = {}
+        for index, spec in enumerate(data['regions']):
+            self.specs[spec.get('id', index)] = spec
+        self.boxes = {}  # id -> {'x': (起点, 尺寸), 'y': (起点, 尺寸)}
+        self.resolving = set()  # 用于检测循环引用
+
+    def box(self, region_id):
+        """求解并返回区域框，依赖的区域先求解"""
+        if region_id in self.boxes:
+            return self.boxes[region_id]
+        if region_id not in self.specs:
+            raise TemplateError(f"引用了不存在的区域: {region_id}")
+        if region_id in self.resolving:
+            raise TemplateError(f"区域之间存在循环引用: {region_id}")
+        self.resolving.add(region_id)
+        spec = self.specs[region_id]
+        box = {}
+        # ratio 依赖另一方向的尺寸，先求不含 ratio 的方向
+        for axis in sorted(AXES, key=lambda axis: isinstance(spec.get(AXES[axis][1]), dict)
+                           and 'ratio' in spec[AXES[axis][1]]):
+            box[axis] = self.solve_axis(spec, axis, box)
+        self.resolving.discard(region_id)
+        self.boxes[region_id] = box
+        return box
+
+    def other(self, reference, axis):
+        """被引用区域在该方向上的 (起点, 尺寸)"""
+        return self.box(reference)[axis]
+
+    def solve_axis(self, spec, axis, box):
+        """由起点、尺寸、终点中的两个（或尺寸加锚点）求出该方向的 (起点, 尺寸)"""
+        start_key, size_key, end_key = AXES[axis]
+        given = [key for key in AXES[axis] if spec.get(key) is not None]
+        if len(given) == 3:
+            raise TemplateError(f"区域 {_label(spec)} 的 {'/'.join(given)} 约束过多")
+
+        start = self.start_edge(spec.get(start_key), axis)
+        size = self.extent(spec.get(size_key), axis, box)
+        end = self.end_edge(spec.get(end_key), axis)
+        if size is None:
+            if start is None or end is None:
+                raise TemplateError(f"区域 {_label(spec)} 缺少{size_key}")
+            size = end - start
+        elif start is None:
+            if end is not None:
+                start = end - size
+            else:
+                content_start, content_end = self.content[axis]
+                align = _anchor(spec.get('anchor'), axis)
+                if align == 'end':
+                    start = content_end - size
+                elif align == 'center':
+                    start = (content_start + content_end - size) / 2
+                else:
+                    start = content_start
+        if size < 0:
+            raise TemplateError(f"区域 {_label(spec)} 的{size_key}为负")
+        return start, size
+
+    def start_edge(self, value, axis):
+        if value is None:
+            return None
+        if isinstance(value, dict):
+            if 'after' in value:
+                start, size = self.other(value['after'], axis)
+                return start + size + self.gap[axis] + self.offset(value, axis)
+            if 'align' in value:
+                return self.other(value['align'], axis)[0] + self.offset(value, axis)
+            raise TemplateError(f"无效的起点约束: {value!r}")
+        return self.content[axis][0] + parse_length(value, self.size[axis])
+
+    def end_edge(self, value, axis):
+        if value is None:
+            return None
+        if isinstance(value, dict):
+            if 'before' in value:
+                return self.other(value['before'], axis)[0] - self.gap[axis] - self.offset(value, axis)
+            if 'align' in value:
+                start, size = self.other(value['align'], axis)
+                return start + size - self.offset(value, axis)
+            raise TemplateError(f"无效的终点约束: {value!r}")
+        return self.content[axis][1] - parse_length(value, self.size[axis])
+
+    def extent(self, value, axis, box):
+        if value is None:
+            return None
+        if isinstance(value, dict):
+            if 'match' in value:
+                return self.other(value['match'], axis)[1] * value.get('factor', 1)
+            if 'ratio' in value:
+                other_axis = 'y' if axis == 'x' else 'x'
+                if other_axis not in box:
+                    raise TemplateError("宽和高不能同时使用 ratio")
+                return box[other_axis][1] * value['ratio']
+            raise TemplateError(f"无效的尺寸约束: {value!r}")
+        return parse_length(value, self.size[axis])
+
+    def offset(self, value, axis):
+        return parse_length(value.get('offset', 0), self.size[axis])
+
+
+class RegionTemplate:
+    """一个参数化模板：声明式数据、内容摘要和按尺寸缓存的求解结果"""
+
+    def __init__(self, data, path=None):
+        if not isinstance(data, dict) or not isinstance(data.get('regions'), list) or not data['regions']:
+            raise TemplateError("模板缺少 regions 列表")
+        if not all(isinstance(spec, dict) for spec in data['regions']):
+            raise TemplateError("regions 中的每一项都必须是对象")
+        version = data.get('version', TEMPLATE_VERSION)
+        if not isinstance(version, int) or isinstance(version, bool):
+            raise TemplateError(f"无效的模板版本: {version!r}")
+        if version > TEMPLATE_VERSION:
+            raise TemplateError(f"模板版本过新: {version}")
+        if not isinstance(data.get('name', ''), str):
+            raise TemplateError(f"无效的模板名称: {data['name']!r}")
+        for spec in data['regions']:
+            if 'id' in spec and not _is_id(spec['id']):
+                raise TemplateError(f"无效的区域 id: {spec['id']!r}")
+            for key in AXES['x'] + AXES['y']:
+                _check_constraint(spec, key)
+            for key in SCALED_STYLE_KEYS:
+                if key in spec and not _is_number(spec[key]):
+                    raise TemplateError(f"区域 {_label(spec)} 的 {key} 必须是数字: {spec[key]!r}")
+        ids = [spec['id'] for spec in data['regions'] if 'id' in spec]
+        if len(ids) != len(set(ids)):
+            raise TemplateError("区域 id 重复")
+        self.data = data
+        self.path = path
+        self.name = data.get('name') or (os.path.splitext(os.path.basename(path))[0] if path else '模板')
+        content = json.dumps(data, sort_keys=True, ensure_ascii=False)
+        self.digest = hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def load(cls, path):
+        """从JSON文件加载模板"""
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except ValueError as e:
+            raise TemplateError(f"模板不是有效的JSON: {str(e)}")
+        return cls(data, path)
+
+    def save(self, path):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.data, f, ensure_ascii=False, indent=2)
+        self.path = path
+
+    def solve(self, width, height):
+        """求解指定图片尺寸（原图像素）下的区域框，返回 ((x, y, 宽, 高), ...)；结果按尺寸缓存"""
+        key = (self.digest, width, height)
+        boxes = LAYOUT_CACHE.get(key)
+        if boxes is None:
+            boxes = []
+            try:
+                solver = _Solver(self.data, width, height)
+                for index, spec in enumerate(self.data['regions']):
+                    box = solver.box(spec.get('id', index))
+                    (x, w), (y, h) = box['x'], box['y']
+                    boxes.append((int(round(x)), int(round(y)), int(round(w)), int(round(h))))
+            except TypeError as e:
+                raise TemplateError(f"模板字段类型错误: {str(e)}")
+            boxes = tuple(boxes)
+            LAYOUT_CACHE.put(key, boxes)
+        return boxes
+
+    def regions(self, width, height, scale=1):
+        """套用到指定尺寸的图片，返回新的区域列表（预览坐标，scale 为预览/原图）"""
+        regions = []
+        for spec, (x, y, w, h) in zip(self.data['regions'], self.solve(width, height)):
+            region = {key: copy.deepcopy(value) for key, value in spec.items() if key not in CONSTRAINT_KEYS}
+            for key, value in DEFAULT_STYLE.items():
+                region.setdefault(key, value)
+            region.setdefault('name', spec.get('id') or f"区域 {len(regions) + 1}")
+            if region['text'] is None:
+                region['text'] = '' if region.get('type') == 'grid' else region['name']
+            for key in SCALED_STYLE_KEYS:
+                if key in region:
+                    region[key] = region[key] * scale
+            if 'corner_radius' in region:
+                region['corner_radius'] = int(round(region['corner_radius']))
+            region.update(x=x * scale, y=y * scale, width=w * scale, height=h * scale)
+            regions.append(region)
+        return regions
+
+    def project(self, image_path, width, height):
+        """与项目文件相同格式的数据（原图坐标），供批量渲染使用"""
+        return {'regions': self.regions(width, height), 'image_path': image_path, 'scale': 1.0}
+
+    @classmethod
+    def from_regions(cls, name, regions, scale, image_size):
+        """把当前区域导出为模板：位置和尺寸记为图片尺寸的百分比，换到其他分辨率时按比例缩放"""
+        width, height = image_size
+        specs = []
+        for region in regions:
+            spec = {key: copy.deepcopy(value) for key, value in region.items()
+                    if key not in ('x', 'y', 'width', 'height')}
+            for key in SCALED_STYLE_KEYS:
+                if key in spec:
+                    spec[key] = round(spec[key] / scale, 2)
+            spec.update(left=_percent(region['x'] / scale, width), top=_percent(region['y'] / scale, height),
+                        width=_percent(region['width'] / scale, width),
+                        height=_percent(region['height'] / scale, height))
+            specs.append(spec)
+        return cls({'name': name, 'version': TEMPLATE_VERSION, 'regions': specs})
+
+
+def _percent(value, extent):
+    return f"{round(value * 100 / extent, 3):g}%"
+
+
+class TemplateLibrary:
+    """内置模板加上模板目录中的 *.json，文件修改后自动重新加载"""
+
+    def __init__(self, directory=None):
+        self.directory = directory or os.path.join(os.getcwd(), TEMPLATE_DIR)
+        self.builtin = [RegionTemplate(data) for data in BUILTIN_TEMPLATES]
+        self._loaded = {}  # 路径 -> (修改时间, 模板)
+
+    def templates(self):
+        """所有可用模板（内置在前）；无法解析的文件打印警告后跳过"""
+        templates = list(self.builtin)
+        try:
+            names = sorted(name for name in os.listdir(self.directory) if name.lower().endswith('.json'))
+        except OSError:
+            return templates
+        for name in names:
+            template = self.load(os.path.join(self.directory, name))
+            if template is not None:
+                templates.append(template)
+        return templates
+
+    def load(self, path):
+        try:
+            mtime = os.stat(path).st_mtime_ns
+            cached = self._loaded.get(path)
+            if cached is None or cached[0] != mtime:
+                cached = self._loaded[path] = (mtime, RegionTemplate.load(path))
+            return cached[1]
+        except (OSError, TemplateError, TypeError) as e:
+            print(f"⚠️  跳过模板 {os.path.basename(path)}: {str(e)}")
+            return None
+
+    def add(self, template, file_name=None):
+        """保存模板到模板目录，返回文件路径"""
+        os.makedirs(self.directory, exist_ok=True)
+        file_name = file_name or f"{template.name}.json"
+        path = os.path.join(self.directory, os.path.basename(file_name))
+        template.save(path)
+        return path
+
+    def find(self, name_or_path):
+        """按名称或文件路径查找模板"""
+        if os.path.isfile(name_or_path):
+            return RegionTemplate.load(name_or_path)
+        for template in self.templates():
+            if template.name == name_or_path:
+                return template
+        raise TemplateError(f"找不到模板: {name_or_path}")
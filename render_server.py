@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+壁纸编辑器 - 本地渲染服务
+常驻进程接收项目JSON（区域 + 壁纸路径），返回合成后的图片字节，供批量部署脚本调用。
+解码后的源图、亮度积分图、字体和文字贴图在请求之间保持热缓存，
+渲染在有界线程池中执行，超出排队上限的请求直接返回 503，等待超时返回 504
+
+接口:
+    POST /render?format=PNG&profile=balanced   请求体为项目JSON，返回图片
+    GET  /stats                                延迟分位数、吞吐量和缓存命中率
+    GET  /health                               存活检查
+
+用法:
+    python render_server.py --port 8765 --workers 4 --root D:/wallpapers
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeout
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from perf_metrics import percentile
+from pixel_cache import PixelCache
+from region_layout import LuminanceStats
+from wallpaper_render import (DEFAULT_PROFILE, ENCODER_PROFILES, FORMAT_EXTENSIONS, Compositor,
+                              LRUCache, encode_bytes, format_for_path, format_size, load_font)
+
+DEFAULT_PORT = 8765
+DEFAULT_QUEUE_LIMIT = 16  # 线程池之外允许排队的请求数
+MAX_BODY_BYTES = 16 * 1024 * 1024  # 项目JSON大小上限
+REQUEST_TIMEOUT = 120  # 单个渲染的最长等待时间（秒）
+LATENCY_WINDOW = 1000  # 统计分位数时保留的最近请求数
+THROUGHPUT_WINDOW = 60  # 近期吞吐量的统计窗口（秒）
+
+MIME_TYPES = {
+    'PNG': 'image/png',
+    'JPEG': 'image/jpeg',
+    'WEBP': 'image/webp',
+    'AVIF': 'image/avif',
+    'GIF': 'image/gif',
+}
+
+
+class ServiceBusy(Exception):
+    """排队已满"""
+
+
+class RenderTimeout(Exception):
+    """等待渲染超时（渲染仍在线程池中继续，完成前一直占用排队名额）"""
+
+
+def project_image_path(project):
+    """项目引用的壁纸路径（兼容请求字段、手动保存和自动保存三种写法）"""
+    return project.get('image') or project.get('image_path') or project.get('background_image_path')
+
+
+class RenderEngine:
+    """常驻渲染引擎：源图、亮度积分图和文字贴图在多次渲染之间复用"""
+
+    def __init__(self, cache_dir=None, max_sources=8):
+        self.pixel_cache = PixelCache(cache_dir)
+        self.sources = LRUCache(max_entries=max_sources)
+        self.sprite_cache = LRUCache(max_entries=1024)  # 所有源图共享文字贴图
+        load_font()  # 预热字体
+
+    def source(self, image_path):
+        """解码后的源图及其亮度积分图和合成器（毛玻璃缓存按源图区分）"""
+        key = self.pixel_cache.fingerprint(image_path)
+        entry = self.sources.get(key)
+        if entry is None:
+            image = self.pixel_cache.open_image(image_path)
+            entry = (image, LuminanceStats(image), Compositor(sprite_cache=self.sprite_cache))
+            self.sources.put(key, entry)
+        return entry
+
+    def compose(self, project):
+        """按项目合成原始尺寸的图片（与 save_wallpaper 相同的合成路径）"""
+        image_path = project_image_path(project)
+        if not image_path:
+            raise ValueError("项目缺少壁纸路径")
+        image, stats, compositor = self.source(image_path)
+        return compositor.compose(image, project.get('regions', []), project.get('scale', 1.0), stats)
+
+    def render(self, project, fmt=None, profile=DEFAULT_PROFILE):
+        """渲染并编码，返回 (字节, 格式)；未指定格式时沿用源图格式"""
+        fmt = fmt or format_for_path(project_image_path(project) or '') or 'PNG'
+        return encode_bytes(self.compose(project), fmt, profile), fmt
+
+
+class RenderService:
+    """有界线程池调度渲染请求，并统计延迟和吞吐量"""
+
+    def __init__(self, engine, workers=4, queue_limit=DEFAULT_QUEUE_LIMIT, root=None):
+        self.engine = engine
+        self.workers = workers
+        self.root = os.path.realpath(root) if root else None
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='render')
+        self._slots = threading.BoundedSemaphore(workers + queue_limit)
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.completed = 0
+        self.errors = 0
+        self.rejected = 0
+        self.timeouts = 0
+        self.in_flight = 0
+        self.bytes_out = 0
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+        self.finished_at = deque(maxlen=LATENCY_WINDOW)
+
+    def check_path(self, project):
+        """限制只能读取 root 目录下的壁纸"""
+        image_path = project_image_path(project)
+        if self.root and image_path:
+            real_path = os.path.realpath(image_path)
+            if os.path.commonpath([real_path, self.root]) != self.root:
+                raise PermissionError(f"不允许访问该路径: {image_path}")
+
+    def render(self, project, fmt=None, profile=DEFAULT_PROFILE):
+        """提交渲染并等待结果；排队已满时抛出 ServiceBusy，等待超时抛出 RenderTimeout。
+        排队名额在渲染真正结束时才释放，超时返回的请求不会让线程池积压超过上限"""
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise ServiceBusy()
+        start = time.perf_counter()
+        with self._lock:
+            self.in_flight += 1
+        try:
+            self.check_path(project)
+            future = self.executor.submit(self.engine.render, project, fmt, profile)
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            self._release()
+            raise
+        future.add_done_callback(self._release)
+
+        try:
+            data, fmt = future.result(REQUEST_TIMEOUT)
+        except FutureTimeout:
+            with self._lock:
+                self.timeouts += 1
+            raise RenderTimeout()
+        except Exception:
+            with self._lock:
+                self.errors += 1
+            raise
+
+        with self._lock:
+            self.completed += 1
+            self.bytes_out += len(data)
+            self.latencies.append(time.perf_counter() - start)
+            self.finished_at.append(time.time())
+        return data, fmt
+
+    def _release(self, future=None):
+        """渲染结束（或未能提交）时归还排队名额"""
+        with self._lock:
+            self.in_flight -= 1
+        self._slots.release()
+
+    def stats(self):
+        """统计数据：延迟分位数、吞吐量、排队情况和缓存命中率"""
+        now = time.time()
+        with self._lock:
+            latencies = sorted(self.latencies)
+            recent = sum(1 for finished in self.finished_at if now - finished <= THROUGHPUT_WINDOW)
+            uptime = now - self.started
+            stats = {
+                'uptime_seconds': round(uptime, 1),
+                'workers': self.workers,
+                'completed': self.completed,
+                'errors': self.errors,
+                'rejected': self.rejected,
+                'timeouts': self.timeouts,
+                'in_flight': self.in_flight,
+                'bytes_out': self.bytes_out,
+                'throughput_per_second': round(self.completed / uptime, 3) if uptime else 0,
+                'recent_throughput_per_second': round(recent / THROUGHPUT_WINDOW, 3),
+            }
+        stats['latency_ms'] = {
+            name: round(value * 1000, 2) if value is not None else None
+            for name, value in (('p50', percentile(latencies, 0.50)),
+                                ('p95', percentile(latencies, 0.95)),
+                                ('p99', percentile(latencies, 0.99)),
+                                ('max', latencies[-1] if latencies else None))
+        }
+        caches = {'sources': self.engine.sources, 'sprites': self.engine.sprite_cache,
+                  'pixel_cache': self.engine.pixel_cache}
+        stats['caches'] = {name: {'hits': cache.hits, 'misses': cache.misses}
+                           for name, cache in caches.items()}
+        return stats
+
+
+class RenderRequestHandler(BaseHTTPRequestHandler):
+    """HTTP 接口"""
+
+    server_version = "WallpaperRender/1.0"
+    verbose = False
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == '/stats':
+            self.send_json(200, self.server.service.stats())
+        elif path == '/health':
+            self.send_json(200, {'status': 'ok'})
+        else:
+            self.send_json(404, {'error': '未知接口'})
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        if url.path != '/render':
+            self.send_json(404, {'error': '未知接口'})
+            return
+
+        try:
+            length = int(self.headers.get('Content-Length') or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            self.send_json(400, {'error': '无效的 Content-Length'})
+            return
+        if length == 0:
+            self.send_json(400, {'error': '请求体为空'})
+            return
+        if length > MAX_BODY_BYTES:
+            self.send_json(413, {'error': f"请求体超过上限 {format_size(MAX_BODY_BYTES)}"})
+            return
+        try:
+            project = json.loads(self.rfile.read(length).decode('utf-8'))
+        except (UnicodeDecodeError, ValueError):
+            self.send_json(400, {'error': '请求体不是有效的JSON'})
+            return
+        if not isinstance(project, dict):
+            self.send_json(400, {'error': '请求体必须是JSON对象'})
+            return
+
+        # 格式和编码配置：查询参数优先，其次是请求体
+        query = parse_qs(url.query)
+        fmt = (query.get('format', [None])[0] or project.get('format') or '').upper() or None
+        profile = query.get('profile', [None])[0] or project.get('profile') or DEFAULT_PROFILE
+        if fmt == 'JPG':
+            fmt = 'JPEG'
+        if fmt and fmt not in FORMAT_EXTENSIONS:
+            self.send_json(400, {'error': f"不支持的格式: {fmt}"})
+            return
+        if profile not in ENCODER_PROFILES:
+            self.send_json(400, {'error': f"未知的编码配置: {profile}"})
+            return
+
+        start = time.perf_counter()
+        try:
+            data, fmt = self.server.service.render(project, fmt, profile)
+        except ServiceBusy:
+            self.send_json(503, {'error': '服务繁忙，请稍后重试'}, {'Retry-After': '1'})
+            return
+        except RenderTimeout:
+            self.send_json(504, {'error': f"渲染超过 {REQUEST_TIMEOUT} 秒未完成"})
+            return
+        except PermissionError as e:
+            self.send_json(403, {'error': str(e)})
+            return
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            self.send_json(400, {'error': f"渲染失败: {str(e)}"})
+            return
+        except Exception as e:
+            self.send_json(500, {'error': f"渲染失败: {str(e)}"})
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', MIME_TYPES.get(fmt, 'application/octet-stream'))
+        self.send_header('Content-Length', str(len(data)))
+        self.send_header('X-Render-Ms', f"{(time.perf_counter() - start) * 1000:.1f}")
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            super().log_message(format, *args)
+
+
+def create_server(host='127.0.0.1', port=DEFAULT_PORT, workers=4, queue_limit=DEFAULT_QUEUE_LIMIT,
+                  root=None, cache_dir=None):
+    """创建服务（未启动），便于脚本内嵌使用"""
+    server = ThreadingHTTPServer((host, port), RenderRequestHandler)
+    server.daemon_threads = True
+    server.service = RenderService(RenderEngine(cache_dir), workers, queue_limit, root)
+    return server
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="壁纸编辑器本地渲染服务")
+    parser.add_argument('--host', default='127.0.0.1', help="监听地址（默认只允许本机访问）")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help="监听端口")
+    parser.add_argument('--workers', type=int, default=min(4, os.cpu_count() or 1), help="渲染线程数")
+    parser.add_argument('--queue', type=int, default=DEFAULT_QUEUE_LIMIT, help="排队上限")
+    parser.add_argument('--root', default=None, help="只允许读取该目录下的壁纸")
+    parser.add_argument('--cache-dir', default=None, help="像素缓存目录")
+    parser.add_argument('--verbose', action='store_true', help="输出访问日志")
+    args = parser.parse_args()
+
+    RenderRequestHandler.verbose = args.verbose
+    server = create_server(args.host, args.port, args.workers, args.queue, args.root, args.cache_dir)
+    print(f"🚀 渲染服务已启动: http://{args.host}:{args.port}  (线程 {args.workers}, 排队上限 {args.queue})")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 渲染服务已停止")
+    finally:
+        server.server_close()
+        server.service.executor.shutdown(wait=False)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,92 @@
+import time
+STARTUP_BEGIN = time.perf_counter()  # 启动计时起点（导入之前）
+
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox, colorchooser
-from PIL import Image, ImageTk, ImageDraw, ImageFont
+from PIL import Image, ImageTk
+import argparse
+import copy
 import json
 import os
+from event_replay import EventRecorder
+from export_queue import ACTIVE_STATES, PRIORITY_HIGH, ExportQueue, targets_job, wallpaper_job
+from lazy_import import lazy_import
+from memory_budget import memory_budget
+from perf_metrics import metrics
+from pixel_cache import PixelCache
+from region_layout import auto_layout
+from region_snap import SnapIndex
+from region_templates import RegionTemplate, TemplateError, TemplateLibrary
+from wallpaper_render import (ENCODER_PROFILES, DEFAULT_PROFILE, EXPORT_PRESETS,
+                              Compositor, GRADIENT_CACHE, benchmark_profiles, format_for_path, format_size,
+                              grid_cell_at, grid_layout, hex_to_rgb, is_grid,
+                              LRUCache, scale_region,
+                              split_monitors, DEFAULT_BLUR_RADIUS, DEFAULT_GRADIENT_END)
+from workspace import Workspace
+
+# 对话框模块在第一次弹出时才加载
+filedialog = lazy_import('tkinter.filedialog')
+messagebox = lazy_import('tkinter.messagebox')
+colorchooser = lazy_import('tkinter.colorchooser')
+simpledialog = lazy_import('tkinter.simpledialog')
+
+IMPORT_SECONDS = time.perf_counter() - STARTUP_BEGIN  # 模块导入耗时
+
+def photo_bytes(photo):
+    """PhotoImage 占用的内存（Tk 按每像素4字节存储）"""
+    return photo.width() * photo.height() * 4
 
 class WallpaperEditor:
+    # 区域填充样式及其显示名称
+    FILL_LABELS = {'solid': '纯色', 'frosted': '毛玻璃', 'linear': '线性渐变', 'radial': '径向渐变'}
+    
+    # 画布视口
+    TILE_SIZE = 256  # 背景瓦片边长（屏幕像素）
+    TILE_CACHE_SIZE = 192  # 瓦片LRU缓存容量
+    ZOOM_STEP = 1.25  # 每次滚轮缩放的倍率
+    MAX_PIXEL_ZOOM = 8.0  # 最大放大到原图像素的8倍
+    HANDLE_SIZE = 8  # 调整大小手柄的屏幕像素尺寸
+    
+    # 区域编辑
+    MIN_REGION_WIDTH = 50  # 调整大小时的最小宽度
+    MIN_REGION_HEIGHT = 30  # 调整大小时的最小高度
+    HISTORY_LIMIT = 50  # 撤销步数上限
+    SNAP_DISTANCE = 6  # 吸附距离（屏幕像素）
+    DEFAULT_GRID_SIZE = (96, 96)  # 默认图标网格单元（原图像素）
+    WINDOW_TITLE = "壁纸区域编辑器"
+    EXPORT_WORKERS = 2  # 后台导出线程数（超出内存预算时合成自动分带）
+    EXPORT_CLOSE_TIMEOUT = 2  # 关闭窗口时等待导出线程退出的最长时间（秒）
+    EXPORT_POLL_INTERVAL = 250  # 导出状态刷新间隔（毫秒）
+    DEFAULT_GRID_GUTTER = 16  # 图标网格区域的默认单元格间距（原图像素）
+    HUD_INTERVAL = 500  # 性能面板刷新间隔（毫秒）
+    STARTUP_BUDGET = 0.8  # 启动预算：从导入到首帧显示（秒）
+    ALIGN_LABELS = {'left': '左对齐', 'hcenter': '水平居中', 'right': '右对齐',
+                    'top': '顶端对齐', 'vcenter': '垂直居中', 'bottom': '底端对齐'}
+    
     def __init__(self, root):
         self.root = root
-        self.root.title("壁纸区域编辑器")
+        self.root.title(self.WINDOW_TITLE)
         self.root.geometry("1200x800")
         
         # 数据存储
-        self.background_image = None
-        self.background_photo = None
+        self.zoom = 1.0  # 相对适应窗口大小的缩放倍数
+        self.tile_items = {}  # 当前画布上的瓦片：(缩放, 列, 行) -> (画布对象, PhotoImage)
         self.original_image_path = None  # 存储原始图片路径
         self.original_image = None  # 存储原始图片（未缩放）
+        self.source_animated = False  # 原始图片是否为多帧动画
+        self.wallpaper_source = None  # 当前壁纸的解码结果（含预览金字塔）
+        self.luminance_stats = None  # 原始图片亮度积分图，用于O(1)选择标签颜色
         self.regions = []  # 存储所有区域
-        self.selected_region = None
+        self.selected_region = None  # 主选区域（属性面板编辑的对象）
+        self.selected_regions = set()  # 所有选中区域的索引（多选）
+        self.selected_cell = None  # 主选区域为图标网格时选中的单元格（行优先序号）
+        self.history = []  # 撤销栈：每个条目是一次操作前的区域列表快照
+        self.edit_key = None  # 最近一次属性修改的 ((区域, 属性), 撤销记录)，连续修改合并为一条
+        self.band_start = None  # 框选起点
+        self.drag_snapshot = None  # 拖拽开始时的区域快照，释放时作为一条撤销记录
+        self.drag_start_regions = {}  # 拖拽开始时各选中区域的几何属性
+        self.drag_start_bounds = None  # 拖拽开始时选中区域的外框
+        self.snap_index = None  # 拖拽期间其他区域边缘的有序索引
+        self.grid_size = list(self.DEFAULT_GRID_SIZE)  # 图标网格单元（原图像素）
         self.drag_start = None
         self.is_dragging = False
         self.is_resizing = False
@@ -29,11 +99,52 @@ class WallpaperEditor:
         self.project_modified = False  # 项目是否已修改
         self.auto_save_path = None  # 自动保存文件路径
         
+        # 解码像素缓存（内存映射，重复打开大图时免去解码）
+        self.pixel_cache = PixelCache()
+        # 多壁纸工作区：每张壁纸独立的区域和撤销历史，解码结果按内存预算LRU缓存
+        self.workspace = Workspace(self.pixel_cache)
+        # 区域模板库：内置模板加上 templates 目录中的模板文件，求解结果按图片尺寸缓存
+        self.template_library = TemplateLibrary()
+        self.templates = {}  # 模板名称 -> RegionTemplate（下拉菜单中的选项）
+        # 导出合成器（字体和文字贴图缓存在多次导出间共享）
+        self.compositor = Compositor()
+        # 后台导出队列：保存时放入项目快照，编辑不必等待导出完成
+        self.export_queue = ExportQueue(self.EXPORT_WORKERS)
+        self.export_timer = None
+        self.export_window = None  # 导出队列窗口（非模态）
+        self.export_list = None
+        self.export_rows = []  # 队列窗口列表中每一行对应的任务
+        self.last_export_finished = 0  # 状态栏已报告的最近结束时间
+        self.last_export_line = None  # 状态栏显示的最近结束的导出
+        # 预览区域图层缓存（内容 -> PhotoImage），只有区域内容变化时才重新合成
+        self.preview_layers = LRUCache(max_entries=256, sizeof=lambda entry: photo_bytes(entry[0]))
+        # 背景瓦片缓存：只重采样可见瓦片，平移时复用
+        self.tile_cache = LRUCache(max_entries=self.TILE_CACHE_SIZE, sizeof=photo_bytes)
+        
+        # 性能统计：登记各级缓存，性能面板（F3）显示命中率
+        self.hud_timer = None
+        # 输入事件录制（F9），录制文件用 event_replay.py 回放测量交互延迟
+        self.event_recorder = EventRecorder(self)
+        metrics.register_cache('pixel_cache', self.pixel_cache)
+        metrics.register_cache('workspace', self.workspace.sources)
+        metrics.register_cache('preview_layers', self.preview_layers)
+        metrics.register_cache('tiles', self.tile_cache)
+        metrics.register_cache('sprites', self.compositor.sprite_cache)
+        metrics.register_cache('blur', self.compositor.blur_cache)
+        
+        # 内存预算：按淘汰顺序登记各级图像缓存（最容易重建的在前）；导出超出预算时自动分带合成。
+        # 图层和瓦片缓存保存的是 PhotoImage，只能在主线程淘汰
+        memory_budget.register_cache('blur', self.compositor.blur_cache)
+        memory_budget.register_cache('gradients', GRADIENT_CACHE)
+        memory_budget.register_cache('sprites', self.compositor.sprite_cache)
+        memory_budget.register_cache('overlays', self.preview_layers, main_thread_only=True)
+        memory_budget.register_cache('tiles', self.tile_cache, main_thread_only=True)
+        self.workspace.register_budget(memory_budget)
+        metrics.register_report('memory_budget', memory_budget.report)
+        
         self.setup_ui()
         
-        # 启动自动保存
-        if self.auto_save_enabled:
-            self.start_auto_save()
+        # 自动保存定时器在项目第一次修改时才启动（见 mark_project_modified）
         
     def setup_ui(self):
         # 设置现代化样式
@@ -65,9 +176,25 @@ class WallpaperEditor:
         # 现代化按钮
         self.create_modern_button(file_card, "📂 打开壁纸", self.load_wallpaper, '#3b82f6')
         self.create_modern_button(file_card, "💾 保存壁纸", self.save_wallpaper, '#10b981')
+        
+        # 工作区：已打开的壁纸（Ctrl+Tab 切换）
+        self.document_var = tk.StringVar(value="")
+        self.document_menu = self.create_modern_option(file_card, "工作区", self.document_var, [""])
+        self.create_modern_button(file_card, "❎ 关闭当前壁纸", self.close_document, '#64748b')
         self.create_modern_button(file_card, "💾 保存项目", self.save_project, '#8b5cf6')
         self.create_modern_button(file_card, "📂 加载项目", self.load_project, '#f59e0b')
         
+        # 导出编码设置
+        self.profile_var = tk.StringVar(value=ENCODER_PROFILES[DEFAULT_PROFILE]['label'])
+        self.format_var = tk.StringVar(value="原格式")
+        self.create_modern_option(file_card, "编码配置",
+                                  self.profile_var, [p['label'] for p in ENCODER_PROFILES.values()])
+        self.create_modern_option(file_card, "输出格式",
+                                  self.format_var, ["原格式", "PNG", "JPEG", "WebP", "AVIF", "GIF"])
+        self.create_modern_button(file_card, "📊 编码对比", self.compare_encoders, '#3b82f6')
+        self.create_modern_button(file_card, "🖥️ 多目标导出", self.open_multi_export_dialog, '#10b981')
+        self.create_modern_button(file_card, "📈 导出性能数据", self.dump_metrics, '#64748b')
+        
         # 自动保存状态 - 现代化设计
         auto_save_frame = tk.Frame(file_card, bg='#ffffff')
         auto_save_frame.pack(fill=tk.X, pady=(10, 0))
@@ -96,9 +223,40 @@ class WallpaperEditor:
         region_card = self.create_modern_card(control_frame, "🎯 区域操作", 15)
         
         self.create_modern_button(region_card, "➕ 添加区域", self.add_region, '#3b82f6')
+        self.create_modern_button(region_card, "▦ 添加图标网格", self.add_grid_region, '#3b82f6')
+        self.template_var = tk.StringVar(value="")
+        self.template_menu = self.create_modern_option(region_card, "模板", self.template_var, [""])
+        self.template_menu['menu'].config(postcommand=self.update_template_menu)  # 展开时重新扫描模板目录
+        self.update_template_menu()
         self.create_modern_button(region_card, "⚡ 一键生成模板", self.generate_template_regions, '#8b5cf6')
+        self.create_modern_button(region_card, "📥 导入模板", self.import_template, '#8b5cf6')
+        self.create_modern_button(region_card, "📤 当前区域存为模板", self.save_as_template, '#8b5cf6')
+        self.create_modern_button(region_card, "🧭 智能布局", self.generate_auto_layout_regions, '#10b981')
         self.create_modern_button(region_card, "🗑️ 删除选中区域", self.delete_region, '#ef4444')
         self.create_modern_button(region_card, "🧹 清除所有区域", self.clear_regions, '#f59e0b')
+        self.create_modern_button(region_card, "↩️ 撤销 (Ctrl+Z)", self.undo, '#64748b')
+        
+        # 多选对齐与分布（Shift+点击或在空白处框选多个区域）
+        self.align_var = tk.StringVar(value=self.ALIGN_LABELS['left'])
+        self.create_modern_option(region_card, "对齐", self.align_var,
+                                  list(self.ALIGN_LABELS.values()), self.align_selected)
+        self.create_modern_button(region_card, "↔️ 水平等距分布",
+                                  lambda: self.distribute_selected('x'), '#3b82f6')
+        self.create_modern_button(region_card, "↕️ 垂直等距分布",
+                                  lambda: self.distribute_selected('y'), '#3b82f6')
+        
+        # 吸附：其他区域边缘/中心线，以及可配置的图标网格
+        snap_frame = tk.Frame(region_card, bg='#ffffff')
+        snap_frame.pack(fill=tk.X, pady=(10, 0))
+        self.snap_var = tk.BooleanVar(value=True)
+        self.grid_var = tk.BooleanVar(value=False)
+        for text, var, command in (("🧲 吸附对齐", self.snap_var, None),
+                                   ("▦ 网格吸附", self.grid_var, self.draw_grid)):
+            tk.Checkbutton(snap_frame, text=text, variable=var, command=command,
+                           font=('Microsoft YaHei UI', 10),
+                           bg='#ffffff', fg='#374151',
+                           selectcolor='#3b82f6', activebackground='#ffffff').pack(side=tk.LEFT)
+        self.create_modern_button(region_card, "▦ 网格设置", self.configure_grid, '#64748b')
         
         # 区域属性卡片
         self.attr_card = self.create_modern_card(control_frame, "⚙️ 区域属性", 15)
@@ -118,6 +276,18 @@ class WallpaperEditor:
         # 现代化颜色选择
         self.color_button = self.create_modern_color_picker(self.attr_card)
         
+        # 填充样式：纯色 / 毛玻璃 / 渐变
+        self.fill_var = tk.StringVar(value=self.FILL_LABELS['solid'])
+        self.blur_var = tk.IntVar(value=DEFAULT_BLUR_RADIUS)
+        self.corner_var = tk.IntVar(value=0)
+        self.create_modern_option(self.attr_card, "填充样式", self.fill_var,
+                                  list(self.FILL_LABELS.values()), self.update_region_fill)
+        self.blur_scale = self.create_modern_slider(self.attr_card, "模糊半径", self.blur_var,
+                                                    self.update_region_blur, 2, 40)
+        self.corner_scale = self.create_modern_slider(self.attr_card, "圆角半径", self.corner_var,
+                                                      self.update_region_corner, 0, 40)
+        self.create_modern_button(self.attr_card, "🎨 渐变终止色", self.choose_gradient_color, '#8b5cf6')
+        
         # 右侧画布区域 - 现代化设计
         canvas_frame = tk.Frame(main_frame, bg='#f8fafc')
         canvas_frame.pack(side=tk.RIGHT, fill=tk.BOTH, expand=True, padx=(0, 20), pady=20)
@@ -133,15 +303,47 @@ class WallpaperEditor:
                                relief='flat', bd=2, highlightthickness=0)
         self.canvas.pack(fill=tk.BOTH, expand=True)
         
+        # 状态栏：后台导出的进度和结果（点击按钮打开导出队列），也显示事件录制等操作的结果
+        export_bar = tk.Frame(canvas_frame, bg='#f8fafc')
+        export_bar.pack(fill=tk.X, pady=(8, 0))
+        self.export_status_var = tk.StringVar(value="📤 没有进行中的导出")
+        tk.Label(export_bar, textvariable=self.export_status_var, anchor=tk.W,
+                 font=('Microsoft YaHei UI', 9), bg='#f8fafc', fg='#475569').pack(side=tk.LEFT, fill=tk.X, expand=True)
+        tk.Button(export_bar, text="📋 导出队列", command=self.open_export_window,
+                  font=('Microsoft YaHei UI', 9), bg='#e2e8f0', fg='#1e293b', relief='flat', bd=0,
+                  cursor='hand2', padx=10, pady=2).pack(side=tk.RIGHT)
+        
         # 绑定事件
         self.canvas.bind('<Button-1>', self.on_canvas_click)
         self.canvas.bind('<B1-Motion>', self.on_canvas_drag)
         self.canvas.bind('<ButtonRelease-1>', self.on_canvas_release)
         self.canvas.bind('<Motion>', self.on_canvas_motion)
         
+        # 缩放（滚轮）和平移（中键拖拽）
+        self.canvas.bind('<MouseWheel>', self.on_canvas_wheel)
+        self.canvas.bind('<Button-4>', self.on_canvas_wheel)
+        self.canvas.bind('<Button-5>', self.on_canvas_wheel)
+        self.canvas.bind('<ButtonPress-2>', self.on_pan_start)
+        self.canvas.bind('<B2-Motion>', self.on_pan_drag)
+        
+        # 撤销
+        self.root.bind('<Control-z>', self.undo)
+        
+        # 切换工作区中的壁纸
+        self.root.bind('<Control-Tab>', lambda event: self.cycle_document(1))
+        
+        # 性能面板
+        self.root.bind('<F3>', self.toggle_hud)
+        
+        # 输入事件录制
+        self.root.bind('<F9>', self.toggle_recording)
+        
         # 绑定窗口大小变化事件
         self.root.bind('<Configure>', self.on_window_resize)
         
+        # 关闭窗口时处理未完成的导出
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
         # 初始化属性面板状态
         self.update_attribute_panel()
     
@@ -236,7 +438,7 @@ class WallpaperEditor:
         
         return entry
     
-    def create_modern_slider(self, parent, label_text, var, callback):
+    def create_modern_slider(self, parent, label_text, var, callback, from_=0, to=255):
         """创建现代化滑块"""
         # 标签
         label = tk.Label(parent, text=f"{label_text}:", 
@@ -249,7 +451,7 @@ class WallpaperEditor:
         slider_frame.pack(fill=tk.X, pady=(0, 5))
         
         # 滑块
-        scale = tk.Scale(slider_frame, from_=0, to=255, variable=var, 
+        scale = tk.Scale(slider_frame, from_=from_, to=to, variable=var, 
                         orient=tk.HORIZONTAL, command=callback,
                         bg='#ffffff', fg='#1e293b', 
                         activebackground='#3b82f6',
@@ -260,6 +462,27 @@ class WallpaperEditor:
         
         return scale
     
+    def create_modern_option(self, parent, label_text, var, options, command=None):
+        """创建现代化下拉选择"""
+        # 选择容器
+        option_frame = tk.Frame(parent, bg='#ffffff')
+        option_frame.pack(fill=tk.X, pady=(6, 0))
+        
+        # 标签
+        label = tk.Label(option_frame, text=f"{label_text}:", 
+                        font=('Microsoft YaHei UI', 9),
+                        bg='#ffffff', fg='#374151')
+        label.pack(side=tk.LEFT)
+        
+        # 下拉菜单
+        option_menu = tk.OptionMenu(option_frame, var, *options, command=command)
+        option_menu.config(font=('Microsoft YaHei UI', 9),
+                           bg='#ffffff', fg='#1e293b', relief='flat', bd=0,
+                           activebackground='#e2e8f0', highlightthickness=0)
+        option_menu.pack(side=tk.RIGHT, fill=tk.X, expand=True)
+        
+        return option_menu
+    
     def create_modern_color_picker(self, parent):
         """创建现代化颜色选择器"""
         # 标签
@@ -304,20 +527,109 @@ class WallpaperEditor:
         """加载壁纸"""
         file_path = filedialog.askopenfilename(
             title="🖼️ 选择壁纸",
-            filetypes=[("图片文件", "*.jpg *.jpeg *.png *.bmp *.gif")]
+            filetypes=[("图片文件", "*.jpg *.jpeg *.png *.bmp *.gif *.webp")]
         )
         if file_path:
             try:
-                self.original_image = Image.open(file_path)  # 保存原始图片
-                self.background_image = self.original_image.copy()  # 工作副本
-                self.original_image_path = file_path  # 存储原始文件路径
-                # 调整图片大小以适应窗口
-                self.resize_image_to_fit()
-                self.display_image()
-                self.clear_regions()  # 清除之前的区域
+                # 加入工作区：之前的壁纸连同区域和撤销历史保留，可随时切换回去
+                with metrics.timer('load_wallpaper'):
+                    self.stash_document()
+                    self.activate_document(self.workspace.open(file_path))
+                self.update_document_menu()
             except Exception as e:
                 messagebox.showerror("错误", f"无法加载图片: {str(e)}")
     
+    def stash_document(self):
+        """把当前的编辑状态存回工作区中的文档"""
+        document = self.workspace.active
+        if document is None:
+            return
+        document.regions = self.regions
+        document.history = self.history
+        document.selected_regions = set(self.selected_regions)
+        document.selected_region = self.selected_region
+        document.zoom = self.zoom
+        document.scale = self.scale
+        document.view = (self.canvas.xview()[0], self.canvas.yview()[0])
+    
+    def activate_document(self, document):
+        """切换到工作区中的文档：解码结果来自LRU，区域、选择和撤销历史按文档恢复"""
+        with metrics.timer('switch_wallpaper'):
+            # 原图来自像素缓存的只读映射；动画源（GIF/APNG/WebP）保存时逐帧处理，预览使用第一帧
+            source = self.workspace.source(document.path)
+            self.workspace.active = document
+            self.wallpaper_source = source
+            self.original_image = source.image
+            self.original_image_path = document.path
+            self.source_animated = source.animated
+            self.luminance_stats = source.stats
+            
+            # 新图片从适应窗口的缩放开始；窗口大小变化过时，把区域和撤销记录换算到当前预览坐标
+            self.zoom = document.zoom
+            self.resize_image_to_fit()
+            if document.scale and abs(self.scale / document.scale - 1) > 1e-6:
+                for regions in [document.regions] + document.history:
+                    self.rescale_regions(regions, self.scale / document.scale)
+            document.scale = self.scale
+            
+            self.regions = document.regions
+            self.history = document.history
+            self.selected_regions = set(document.selected_regions)
+            self.selected_region = document.selected_region
+            self.canvas.config(scrollregion=(0, 0, self.image_width * self.zoom,
+                                             self.image_height * self.zoom))
+            self.canvas.xview_moveto(document.view[0])
+            self.canvas.yview_moveto(document.view[1])
+            self.display_image()
+            self.update_attribute_panel()
+    
+    def switch_document(self, document):
+        """从工作区菜单切换壁纸"""
+        if document is not self.workspace.active:
+            self.stash_document()
+            self.activate_document(document)
+        self.update_document_menu()
+    
+    def cycle_document(self, step):
+        """按打开顺序切换到下一张壁纸"""
+        if len(self.workspace.documents) > 1:
+            self.switch_document(self.workspace.neighbor(self.workspace.active, step))
+        return "break"
+    
+    def close_document(self):
+        """关闭当前壁纸，切换到工作区中的其他壁纸"""
+        document = self.workspace.active
+        if document is None:
+            return
+        self.workspace.close(document)
+        following = self.workspace.neighbor(document)
+        if following is not None:
+            self.activate_document(following)
+        else:
+            self.wallpaper_source = None
+            self.original_image = None
+            self.original_image_path = None
+            self.luminance_stats = None
+            self.regions = []
+            self.history = []
+            self.selected_regions = set()
+            self.selected_region = None
+            self.canvas.delete("all")
+            self.tile_items = {}
+            self.update_attribute_panel()
+        self.update_document_menu()
+    
+    def update_document_menu(self):
+        """刷新工作区菜单中的壁纸列表"""
+        menu = self.document_menu['menu']
+        menu.delete(0, 'end')
+        for document in self.workspace.documents.values():
+            menu.add_command(label=document.name,
+                             command=lambda document=document: self.switch_document(document))
+        active = self.workspace.active
+        self.document_var.set(active.name if active else "")
+    
+    @metrics.timed('resize_image_to_fit')
     def resize_image_to_fit(self):
         """调整图片大小以适应画布"""
         if not self.original_image:
@@ -340,19 +652,118 @@ class WallpaperEditor:
         new_width = int(img_width * self.scale)
         new_height = int(img_height * self.scale)
         
-        # 从原始图片重新缩放
-        self.background_image = self.original_image.resize((new_width, new_height), Image.Resampling.LANCZOS)
+        # 不再整张缩放原图，背景由可见瓦片按需生成
         self.image_width = new_width
         self.image_height = new_height
     
     def display_image(self):
         """显示图片"""
-        if self.background_image:
-            self.background_photo = ImageTk.PhotoImage(self.background_image)
+        if self.original_image:
             self.canvas.delete("all")
-            self.canvas.create_image(0, 0, anchor=tk.NW, image=self.background_photo)
+            self.tile_items = {}
+            self.canvas.config(scrollregion=(0, 0, self.image_width * self.zoom,
+                                             self.image_height * self.zoom))
+            self.update_tiles()
+            self.draw_grid()
             self.redraw_regions()
     
+    @metrics.timed('update_tiles')
+    def update_tiles(self):
+        """只为当前视口内可见的瓦片生成 PhotoImage，移出视口的瓦片从画布上移除"""
+        if not self.original_image:
+            return
+        
+        tile = self.TILE_SIZE
+        content_width = int(self.image_width * self.zoom)
+        content_height = int(self.image_height * self.zoom)
+        left = max(0, int(self.canvas.canvasx(0)))
+        top = max(0, int(self.canvas.canvasy(0)))
+        right = min(content_width, int(self.canvas.canvasx(max(self.canvas.winfo_width(), 1))) + 1)
+        bottom = min(content_height, int(self.canvas.canvasy(max(self.canvas.winfo_height(), 1))) + 1)
+        
+        visible = set()
+        for row in range(top // tile, (max(bottom, top + 1) - 1) // tile + 1):
+            for column in range(left // tile, (max(right, left + 1) - 1) // tile + 1):
+                visible.add((self.zoom, column, row))
+        
+        # 移除不可见的瓦片（PhotoImage 仍留在LRU缓存中，平移回来时复用）
+        for key in list(self.tile_items):
+            if key not in visible:
+                self.canvas.delete(self.tile_items.pop(key)[0])
+        
+        for key in visible:
+            if key in self.tile_items:
+                continue
+            # 缓存键包含壁纸路径和预览比例，切换壁纸或窗口大小变化后旧瓦片由LRU自然淘汰
+            cache_key = (self.original_image_path, self.scale) + key
+            photo = self.tile_cache.get(cache_key)
+            if photo is None:
+                photo = self.render_tile(key[1], key[2], content_width, content_height)
+                self.tile_cache.put(cache_key, photo)
+            item = self.canvas.create_image(key[1] * tile, key[2] * tile, anchor=tk.NW,
+                                            image=photo, tags="tile")
+            self.tile_items[key] = (item, photo)
+        
+        # 瓦片始终位于区域下方
+        self.canvas.tag_lower("tile")
+    
+    @metrics.timed('render_tile')
+    def render_tile(self, column, row, content_width, content_height):
+        """从预览金字塔中合适的一级重采样一个瓦片（只读取瓦片对应的范围）"""
+        tile = self.TILE_SIZE
+        display_scale = self.scale * self.zoom
+        level, factor = self.workspace.preview_level(self.wallpaper_source, display_scale)
+        left = column * tile
+        top = row * tile
+        right = min(left + tile, content_width)
+        bottom = min(top + tile, content_height)
+        box = (left / display_scale / factor, top / display_scale / factor,
+               min(right / display_scale / factor, level.width),
+               min(bottom / display_scale / factor, level.height))
+        image = level.resize((right - left, bottom - top), Image.Resampling.LANCZOS,
+                             box=box, reducing_gap=2.0)
+        return ImageTk.PhotoImage(image)
+    
+    def event_to_image(self, event):
+        """将画布事件坐标换算为区域坐标（适应窗口时的预览坐标，浮点数）。
+        按显示比例对齐到最近的原图像素，放大后可以逐像素定位，而不是受限于预览像素的步长"""
+        display_scale = self.scale * self.zoom
+        return (round(self.canvas.canvasx(event.x) / display_scale) * self.scale,
+                round(self.canvas.canvasy(event.y) / display_scale) * self.scale)
+    
+    def on_canvas_wheel(self, event):
+        """滚轮缩放，保持鼠标下的位置不动"""
+        if not self.original_image:
+            return
+        
+        zoom_in = event.num == 4 or getattr(event, 'delta', 0) > 0
+        max_zoom = self.MAX_PIXEL_ZOOM / self.scale
+        new_zoom = self.zoom * self.ZOOM_STEP if zoom_in else self.zoom / self.ZOOM_STEP
+        new_zoom = max(1.0, min(new_zoom, max_zoom))
+        if new_zoom == self.zoom:
+            return
+        
+        # 缩放前鼠标所指的区域坐标
+        image_x = self.canvas.canvasx(event.x) / self.zoom
+        image_y = self.canvas.canvasy(event.y) / self.zoom
+        self.zoom = new_zoom
+        
+        content_width = self.image_width * self.zoom
+        content_height = self.image_height * self.zoom
+        self.canvas.config(scrollregion=(0, 0, content_width, content_height))
+        self.canvas.xview_moveto(max(0, image_x * self.zoom - event.x) / content_width)
+        self.canvas.yview_moveto(max(0, image_y * self.zoom - event.y) / content_height)
+        self.display_image()
+    
+    def on_pan_start(self, event):
+        """中键按下：记录平移起点"""
+        self.canvas.scan_mark(event.x, event.y)
+    
+    def on_pan_drag(self, event):
+        """中键拖拽平移，只补充新露出的瓦片"""
+        self.canvas.scan_dragto(event.x, event.y, gain=1)
+        self.update_tiles()
+    
     def on_window_resize(self, event):
         """窗口大小变化时的处理"""
         # 只有当窗口大小真正改变时才重新调整图片
@@ -368,7 +779,7 @@ class WallpaperEditor:
     
     def add_region(self):
         """添加新区域"""
-        if not self.background_image:
+        if not self.original_image:
             messagebox.showwarning("警告", "请先加载壁纸")
             return
             
@@ -383,362 +794,721 @@ class WallpaperEditor:
             'color': '#FF6B6B',
             'alpha': 128
         }
+        self.record_history()
+        self.regions.append(region)
+        self.select_region(len(self.regions) - 1)
+        # 标记项目已修改，触发自动保存
+        self.mark_project_modified()
+    
+    def add_grid_region(self):
+        """添加图标网格区域：单元格大小取网格设置，整个网格作为一个区域存储和绘制"""
+        if not self.original_image:
+            messagebox.showwarning("警告", "请先加载壁纸")
+            return
+        
+        rows = simpledialog.askinteger("▦ 图标网格", "行数:", parent=self.root,
+                                       initialvalue=4, minvalue=1, maxvalue=100)
+        if not rows:
+            return
+        columns = simpledialog.askinteger("▦ 图标网格", "列数:", parent=self.root,
+                                          initialvalue=6, minvalue=1, maxvalue=100)
+        if not columns:
+            return
+        
+        # 单元格和间距按原图像素设置，换算到预览坐标
+        cell_width = self.grid_size[0] * self.scale
+        cell_height = self.grid_size[1] * self.scale
+        gutter = self.DEFAULT_GRID_GUTTER * self.scale
+        region = {
+            'type': 'grid',
+            'x': 20,
+            'y': 20,
+            'width': columns * cell_width + (columns - 1) * gutter,
+            'height': rows * cell_height + (rows - 1) * gutter,
+            'rows': rows,
+            'columns': columns,
+            'gutter': gutter,
+            'labels': [],
+            'name': f"图标网格 {len(self.regions) + 1}",
+            'text': "",
+            'color': '#FFFFFF',
+            'alpha': 60,
+            'corner_radius': int(round(8 * self.scale))
+        }
+        self.record_history()
         self.regions.append(region)
-        self.redraw_regions()
         self.select_region(len(self.regions) - 1)
         # 标记项目已修改，触发自动保存
         self.mark_project_modified()
     
     def delete_region(self):
-        """删除选中的区域"""
-        if self.selected_region is not None:
-            del self.regions[self.selected_region]
-            self.selected_region = None
-            self.update_attribute_panel()
-            self.redraw_regions()
+        """删除选中的区域（多选时一起删除）"""
+        if self.selected_regions:
+            self.record_history()
+            self.regions = [region for i, region in enumerate(self.regions)
+                            if i not in self.selected_regions]
+            self.set_selection([])
             # 标记项目已修改，触发自动保存
             self.mark_project_modified()
     
     def clear_regions(self):
         """清除所有区域"""
+        if self.regions:
+            self.record_history()
         self.regions = []
-        self.selected_region = None
-        self.update_attribute_panel()
-        self.redraw_regions()
+        self.set_selection([])
         # 标记项目已修改，触发自动保存
         self.mark_project_modified()
     
+    def update_template_menu(self):
+        """刷新模板下拉菜单（内置模板和模板目录中的文件）"""
+        self.templates = {template.name: template for template in self.template_library.templates()}
+        menu = self.template_menu['menu']
+        menu.delete(0, 'end')
+        for name in self.templates:
+            menu.add_command(label=name, command=lambda name=name: self.template_var.set(name))
+        if self.template_var.get() not in self.templates:
+            self.template_var.set(next(iter(self.templates), ""))
+    
     def generate_template_regions(self):
-        """一键生成模板区域"""
-        if not self.background_image:
+        """一键生成模板区域：按当前壁纸尺寸求解选中的模板"""
+        if not self.original_image:
             messagebox.showwarning("警告", "请先加载壁纸")
             return
         
+        template = self.templates.get(self.template_var.get())
+        if template is None:
+            messagebox.showwarning("警告", "请先选择模板")
+            return
+        try:
+            template_regions = template.regions(*self.original_image.size, self.scale)
+        except TemplateError as e:
+            messagebox.showerror("错误", f"模板无法套用: {str(e)}")
+            return
+        
         # 清除现有区域
         self.clear_regions()
         
-        # 获取图片尺寸
-        img_width = self.image_width
-        img_height = self.image_height
-        
-        # 根据图片尺寸计算区域大小和位置
-        # 左侧竖条区域 (待处理)
-        left_width = int(img_width * 0.15)  # 15%宽度
-        left_height = int(img_height * 0.8)  # 80%高度
-        left_x = int(img_width * 0.05)  # 5%左边距
-        left_y = int(img_height * 0.1)  # 10%上边距
-        
-        # 顶部绿色区域 (挂起)
-        top_width = int(img_width * 0.3)  # 30%宽度
-        top_height = int(img_height * 0.15)  # 15%高度
-        top_x = left_x + left_width + int(img_width * 0.02)  # 2%间距
-        top_y = int(img_height * 0.1)  # 10%上边距
-        
-        # 中间主区域 (处理中)
-        main_width = int(img_width * 0.4)  # 40%宽度
-        main_height = int(img_height * 0.6)  # 60%高度
-        main_x = left_x + left_width + int(img_width * 0.02)  # 2%间距
-        main_y = top_y + top_height + int(img_height * 0.02)  # 2%间距
-        
-        # 右侧参考区域
-        right_width = int(img_width * 0.25)  # 25%宽度
-        right_height = int(img_height * 0.8)  # 80%高度
-        right_x = main_x + main_width + int(img_width * 0.02)  # 2%间距
-        right_y = int(img_height * 0.1)  # 10%上边距
-        
-        # 底部区域 (迭代)
-        bottom_width = int(img_width * 0.3)  # 30%宽度
-        bottom_height = int(img_height * 0.15)  # 15%高度
-        bottom_x = main_x
-        bottom_y = main_y + main_height + int(img_height * 0.02)  # 2%间距
-        
-        # 创建模板区域
-        template_regions = [
-            {
-                'x': left_x,
-                'y': left_y,
-                'width': left_width,
-                'height': left_height,
-                'name': '待处理',
-                'text': '待处理',
-                'color': '#FFD700',  # 金黄色
-                'alpha': 150
-            },
-            {
-                'x': top_x,
-                'y': top_y,
-                'width': top_width,
-                'height': top_height,
-                'name': '挂起',
-                'text': '挂起',
-                'color': '#90EE90',  # 浅绿色
-                'alpha': 150
-            },
-            {
-                'x': main_x,
-                'y': main_y,
-                'width': main_width,
-                'height': main_height,
-                'name': '处理中',
-                'text': '处理中',
-                'color': '#CD853F',  # 棕色
-                'alpha': 150
-            },
-            {
-                'x': right_x,
-                'y': right_y,
-                'width': right_width,
-                'height': right_height,
-                'name': '参考',
-                'text': '参考',
-                'color': '#D3D3D3',  # 浅灰色
-                'alpha': 150
-            },
-            {
-                'x': bottom_x,
-                'y': bottom_y,
-                'width': bottom_width,
-                'height': bottom_height,
-                'name': '迭代',
-                'text': '迭代',
-                'color': '#D3D3D3',  # 浅灰色
-                'alpha': 150
-            }
-        ]
-        
         # 添加所有模板区域
         self.regions = template_regions
         self.redraw_regions()
         # 标记项目已修改，触发自动保存
         self.mark_project_modified()
     
+    def import_template(self):
+        """导入他人分享的模板文件到模板目录"""
+        file_path = filedialog.askopenfilename(
+            title="导入模板",
+            filetypes=[("JSON文件", "*.json")]
+        )
+        if not file_path:
+            return
+        
+        try:
+            template = RegionTemplate.load(file_path)
+            if self.original_image:
+                template.solve(*self.original_image.size)  # 先按当前壁纸检查约束能否求解
+            self.template_library.add(template, os.path.basename(file_path))
+        except (OSError, TemplateError) as e:
+            messagebox.showerror("错误", f"导入模板失败: {str(e)}")
+            return
+        self.update_template_menu()
+        self.template_var.set(template.name)
+    
+    def save_as_template(self):
+        """把当前区域存为模板（位置和尺寸按图片百分比记录），可以分享给其他人"""
+        if not self.regions or not self.original_image:
+            messagebox.showwarning("警告", "没有可保存的区域")
+            return
+        
+        name = simpledialog.askstring("📤 存为模板", "模板名称:", parent=self.root)
+        if not name:
+            return
+        template = RegionTemplate.from_regions(name, self.regions, self.scale, self.original_image.size)
+        try:
+            file_path = self.template_library.add(template)
+        except OSError as e:
+            messagebox.showerror("错误", f"保存模板失败: {str(e)}")
+            return
+        self.update_template_menu()
+        self.template_var.set(template.name)
+        messagebox.showinfo("✅ 保存成功", f"🎉 模板已保存到: {file_path}")
+    
+    def generate_auto_layout_regions(self):
+        """根据画面分析自动布局：把区域放在细节最少的位置，避免遮挡主体"""
+        if not self.original_image:
+            messagebox.showwarning("警告", "请先加载壁纸")
+            return
+        
+        count = simpledialog.askinteger("🧭 智能布局", "区域数量:", parent=self.root,
+                                        initialvalue=5, minvalue=1, maxvalue=20)
+        if not count:
+            return
+        
+        rects = auto_layout(self.original_image, (self.image_width, self.image_height), count)
+        if not rects:
+            messagebox.showwarning("警告", "没有找到合适的空白位置")
+            return
+        
+        # 前五个区域沿用模板的名称和颜色
+        presets = [('待处理', '#FFD700'), ('挂起', '#90EE90'), ('处理中', '#CD853F'),
+                   ('参考', '#D3D3D3'), ('迭代', '#D3D3D3')]
+        self.clear_regions()
+        for i, (x, y, width, height) in enumerate(rects):
+            name, color = presets[i] if i < len(presets) else (f"区域 {i + 1}", '#FF6B6B')
+            self.regions.append({
+                'x': x,
+                'y': y,
+                'width': width,
+                'height': height,
+                'name': name,
+                'text': name,
+                'color': color,
+                'alpha': 150
+            })
+        self.redraw_regions()
+        # 标记项目已修改，触发自动保存
+        self.mark_project_modified()
+    
     def on_canvas_click(self, event):
-        """画布点击事件"""
-        if not self.background_image:
+        """画布点击事件：点击选择，Shift+点击加减选，空白处开始框选"""
+        if not self.original_image:
             return
             
-        x, y = event.x, event.y
+        x, y = self.event_to_image(event)
+        additive = bool(event.state & 0x0001)  # 按住 Shift
+        self.drag_start = (x, y)
+        
+        # 多选时先检查整组外框的调整手柄
+        if len(self.selected_regions) > 1 and not additive:
+            resize_handle = self.hit_handle(self.selection_bounds(), x, y)
+            if resize_handle:
+                self.begin_transform(resize_handle)
+                return
         
         # 检查是否点击了区域
         clicked_region = None
-        resize_handle = None
-        
         for i, region in enumerate(self.regions):
             if (region['x'] <= x <= region['x'] + region['width'] and
                 region['y'] <= y <= region['y'] + region['height']):
                 clicked_region = i
-                
-                # 检查是否点击了调整大小的手柄
-                handle_size = 8
-                if (region['x'] + region['width'] - handle_size <= x <= region['x'] + region['width'] and
-                    region['y'] + region['height'] - handle_size <= y <= region['y'] + region['height']):
-                    resize_handle = 'se'  # 右下角
-                elif (region['x'] <= x <= region['x'] + handle_size and
-                      region['y'] <= y <= region['y'] + handle_size):
-                    resize_handle = 'nw'  # 左上角
-                elif (region['x'] + region['width'] - handle_size <= x <= region['x'] + region['width'] and
-                      region['y'] <= y <= region['y'] + handle_size):
-                    resize_handle = 'ne'  # 右上角
-                elif (region['x'] <= x <= region['x'] + handle_size and
-                      region['y'] + region['height'] - handle_size <= y <= region['y'] + region['height']):
-                    resize_handle = 'sw'  # 左下角
                 break
         
-        if clicked_region is not None:
-            self.select_region(clicked_region)
-            if resize_handle:
-                self.is_resizing = True
-                self.resize_handle = resize_handle
-                self.drag_start = (x, y)
-                # 保存拖拽开始时的区域状态
-                self.drag_start_region = {
-                    'x': self.regions[clicked_region]['x'],
-                    'y': self.regions[clicked_region]['y'],
-                    'width': self.regions[clicked_region]['width'],
-                    'height': self.regions[clicked_region]['height']
-                }
-            else:
-                self.is_dragging = True
-                self.drag_start = (x - self.regions[clicked_region]['x'], y - self.regions[clicked_region]['y'])
+        if clicked_region is None:
+            # 空白处：开始框选
+            if not additive:
+                self.set_selection([])
+            self.band_start = (x, y)
+            return
+        
+        if additive:
+            # Shift+点击：切换该区域的选中状态
+            selection = self.selected_regions ^ {clicked_region}
+            self.set_selection(selection, clicked_region if clicked_region in selection else None)
+            return
+        
+        if clicked_region in self.selected_regions:
+            # 点击已选中的区域：保留多选，整组一起拖动
+            self.set_selection(self.selected_regions, clicked_region)
         else:
-            self.selected_region = None
+            self.select_region(clicked_region)
+        
+        # 图标网格：算术求出点击的单元格，属性面板的文字编辑该单元格的标签
+        region = self.regions[clicked_region]
+        cell = grid_cell_at(region, x, y) if is_grid(region) else None
+        if cell != self.selected_cell:
+            self.selected_cell = cell
             self.update_attribute_panel()
             self.redraw_regions()
+        
+        # 单选时检查是否点击了区域的调整大小手柄
+        resize_handle = None
+        if len(self.selected_regions) == 1:
+            resize_handle = self.hit_handle(self.selection_bounds(), x, y)
+        self.begin_transform(resize_handle)
+    
+    def begin_transform(self, resize_handle=None):
+        """记录拖拽开始时的状态：移动或调整大小期间只修改几何属性，释放时统一提交"""
+        self.drag_snapshot = copy.deepcopy(self.regions)
+        self.drag_start_regions = {i: self.region_geometry(self.regions[i]) for i in self.selected_regions}
+        self.drag_start_bounds = self.selection_bounds()
+        self.snap_index = self.build_snap_index()
+        if resize_handle:
+            self.is_resizing = True
+            self.resize_handle = resize_handle
+        else:
+            self.is_dragging = True
     
     def on_canvas_drag(self, event):
-        """画布拖拽事件"""
-        if self.selected_region is None:
+        """画布拖拽事件：框选、整组移动或整组调整大小，每个事件只重绘一次"""
+        if not self.original_image:
             return
             
-        x, y = event.x, event.y
-        region = self.regions[self.selected_region]
+        x, y = self.event_to_image(event)
+        
+        if self.band_start:
+            # 更新框选矩形（显示坐标）
+            self.canvas.delete("band")
+            self.canvas.create_rectangle(
+                self.band_start[0] * self.zoom, self.band_start[1] * self.zoom,
+                x * self.zoom, y * self.zoom,
+                outline='#3b82f6', dash=(4, 2), width=1, tags="band"
+            )
+            return
         
-        if self.is_dragging and self.drag_start:
-            # 拖拽移动区域
-            new_x = x - self.drag_start[0]
-            new_y = y - self.drag_start[1]
-            
-            # 限制在画布范围内
-            new_x = max(0, min(new_x, self.image_width - region['width']))
-            new_y = max(0, min(new_y, self.image_height - region['height']))
-            
-            region['x'] = new_x
-            region['y'] = new_y
+        if not self.drag_start_regions or not self.drag_start:
+            return
+        
+        threshold = self.SNAP_DISTANCE / self.zoom
+        guide_x = guide_y = None
+        
+        if self.is_dragging:
+            # 整组移动：外框的左/中/右、上/中/下吸附到最近的边缘，再限制在画布范围内
+            left, top, right, bottom = self.drag_start_bounds
+            dx = x - self.drag_start[0]
+            dy = y - self.drag_start[1]
+            if self.snap_index:
+                snap_x, guide_x = self.snap_index.snap(
+                    'x', (left + dx, (left + right) / 2 + dx, right + dx), threshold)
+                snap_y, guide_y = self.snap_index.snap(
+                    'y', (top + dy, (top + bottom) / 2 + dy, bottom + dy), threshold)
+                dx += snap_x
+                dy += snap_y
+            dx = max(-left, min(dx, self.image_width - right))
+            dy = max(-top, min(dy, self.image_height - bottom))
+            for i, start in self.drag_start_regions.items():
+                self.regions[i]['x'] = start['x'] + dx
+                self.regions[i]['y'] = start['y'] + dy
             self.redraw_regions()
             
-        elif self.is_resizing and self.drag_start and self.resize_handle:
-            # 调整区域大小 - 使用绝对位置计算
-            start_x, start_y = self.drag_start
-            start_region = self.drag_start_region  # 拖拽开始时的区域状态
-            
-            if self.resize_handle == 'se':  # 右下角
-                new_width = max(50, x - start_region['x'])
-                new_height = max(30, y - start_region['y'])
-                region['width'] = min(new_width, self.image_width - region['x'])
-                region['height'] = min(new_height, self.image_height - region['y'])
-                
-            elif self.resize_handle == 'nw':  # 左上角
-                new_width = max(50, start_region['x'] + start_region['width'] - x)
-                new_height = max(30, start_region['y'] + start_region['height'] - y)
-                new_x = x
-                new_y = y
-                
-                if new_x >= 0 and new_y >= 0:
-                    region['x'] = new_x
-                    region['y'] = new_y
-                    region['width'] = new_width
-                    region['height'] = new_height
-                    
-            elif self.resize_handle == 'ne':  # 右上角
-                new_width = max(50, x - start_region['x'])
-                new_height = max(30, start_region['y'] + start_region['height'] - y)
-                new_y = y
-                
-                if new_y >= 0 and new_width <= self.image_width - region['x']:
-                    region['y'] = new_y
-                    region['width'] = new_width
-                    region['height'] = new_height
-                    
-            elif self.resize_handle == 'sw':  # 左下角
-                new_width = max(50, start_region['x'] + start_region['width'] - x)
-                new_height = max(30, y - start_region['y'])
-                new_x = x
-                
-                if new_x >= 0 and new_height <= self.image_height - region['y']:
-                    region['x'] = new_x
-                    region['width'] = new_width
-                    region['height'] = new_height
-            
+        elif self.is_resizing and self.resize_handle:
+            # 调整大小：只吸附正在移动的边
+            if self.snap_index:
+                snap_x, guide_x = self.snap_index.snap('x', (x,), threshold)
+                snap_y, guide_y = self.snap_index.snap('y', (y,), threshold)
+                x += snap_x
+                y += snap_y
+            self.resize_selection(x, y)
             self.redraw_regions()
+        
+        self.draw_guides(guide_x, guide_y)
+    
+    def resize_selection(self, x, y):
+        """按手柄调整大小：固定对角，多选时各区域随外框按比例缩放"""
+        left, top, right, bottom = self.drag_start_bounds
+        x = max(0, min(x, self.image_width))
+        y = max(0, min(y, self.image_height))
+        
+        if 'w' in self.resize_handle:
+            new_left, new_right = max(0, min(x, right - self.MIN_REGION_WIDTH)), right
+        else:
+            new_left, new_right = left, min(self.image_width, max(x, left + self.MIN_REGION_WIDTH))
+        if 'n' in self.resize_handle:
+            new_top, new_bottom = max(0, min(y, bottom - self.MIN_REGION_HEIGHT)), bottom
+        else:
+            new_top, new_bottom = top, min(self.image_height, max(y, top + self.MIN_REGION_HEIGHT))
+        
+        scale_x = (new_right - new_left) / max(right - left, 1)
+        scale_y = (new_bottom - new_top) / max(bottom - top, 1)
+        for i, start in self.drag_start_regions.items():
+            region = self.regions[i]
+            region['x'] = new_left + (start['x'] - left) * scale_x
+            region['y'] = new_top + (start['y'] - top) * scale_y
+            region['width'] = max(self.scale, start['width'] * scale_x)
+            region['height'] = max(self.scale, start['height'] * scale_y)
     
     def on_canvas_release(self, event):
         """画布释放事件"""
-        # 如果进行了拖拽或调整大小操作，标记项目已修改
-        if self.is_dragging or self.is_resizing:
+        if self.band_start:
+            # 结束框选：选中与框选矩形相交的区域
+            x, y = self.event_to_image(event)
+            left, right = sorted((self.band_start[0], x))
+            top, bottom = sorted((self.band_start[1], y))
+            hits = {i for i, region in enumerate(self.regions)
+                    if region['x'] < right and region['x'] + region['width'] > left and
+                    region['y'] < bottom and region['y'] + region['height'] > top}
+            self.band_start = None
+            self.canvas.delete("band")
+            if bool(event.state & 0x0001):
+                hits |= self.selected_regions
+            self.set_selection(hits)
+            return
+        
+        # 整个拖拽只产生一条撤销记录和一次自动保存标记
+        if (self.is_dragging or self.is_resizing) and self.regions != self.drag_snapshot:
+            self.record_history(self.drag_snapshot)
             self.mark_project_modified()
             
         self.is_dragging = False
         self.is_resizing = False
         self.drag_start = None
         self.resize_handle = None
+        self.drag_snapshot = None
+        self.drag_start_regions = {}
+        self.drag_start_bounds = None
+        self.snap_index = None
+        self.canvas.delete("guide")
     
     def on_canvas_motion(self, event):
         """画布鼠标移动事件"""
-        if not self.background_image:
+        if not self.original_image:
             return
             
-        x, y = event.x, event.y
+        x, y = self.event_to_image(event)
         
         # 检查鼠标是否在调整大小手柄上
         cursor = 'crosshair'
-        if self.selected_region is not None:
-            region = self.regions[self.selected_region]
-            handle_size = 8
-            
-            # 检查是否在调整大小手柄上
-            if (region['x'] + region['width'] - handle_size <= x <= region['x'] + region['width'] and
-                region['y'] + region['height'] - handle_size <= y <= region['y'] + region['height']):
-                cursor = 'sizing'  # 右下角
-            elif (region['x'] <= x <= region['x'] + handle_size and
-                  region['y'] <= y <= region['y'] + handle_size):
-                cursor = 'sizing'  # 左上角
-            elif (region['x'] + region['width'] - handle_size <= x <= region['x'] + region['width'] and
-                  region['y'] <= y <= region['y'] + handle_size):
-                cursor = 'sizing'  # 右上角
-            elif (region['x'] <= x <= region['x'] + handle_size and
-                  region['y'] + region['height'] - handle_size <= y <= region['y'] + region['height']):
-                cursor = 'sizing'  # 左下角
+        if self.selected_regions:
+            if self.hit_handle(self.selection_bounds(), x, y):
+                cursor = 'sizing'
             else:
                 cursor = 'fleur'  # 移动光标
         
         self.canvas.config(cursor=cursor)
     
-    def select_region(self, index):
-        """选择区域"""
-        self.selected_region = index
+    def build_snap_index(self):
+        """拖拽开始时建立吸附索引（未选中区域的边缘 + 网格），未启用吸附时返回 None"""
+        snap, grid = self.snap_var.get(), self.grid_var.get()
+        if not (snap or grid):
+            return None
+        rects = []
+        if snap:
+            rects = [(region['x'], region['y'], region['width'], region['height'])
+                     for i, region in enumerate(self.regions) if i not in self.selected_regions]
+        grid_size = (self.grid_size[0] * self.scale, self.grid_size[1] * self.scale) if grid else None
+        return SnapIndex(rects, (self.image_width, self.image_height), grid_size)
+    
+    def draw_guides(self, guide_x, guide_y):
+        """绘制吸附参考线（显示坐标，贯穿整个画布）"""
+        self.canvas.delete("guide")
+        width = self.image_width * self.zoom
+        height = self.image_height * self.zoom
+        if guide_x is not None:
+            self.canvas.create_line(guide_x * self.zoom, 0, guide_x * self.zoom, height,
+                                    fill='#ec4899', dash=(4, 2), tags="guide")
+        if guide_y is not None:
+            self.canvas.create_line(0, guide_y * self.zoom, width, guide_y * self.zoom,
+                                    fill='#ec4899', dash=(4, 2), tags="guide")
+    
+    def draw_grid(self):
+        """绘制图标网格（位于背景之上、区域之下）"""
+        self.canvas.delete("grid")
+        if not self.original_image or not self.grid_var.get():
+            return
+        step_x = self.grid_size[0] * self.scale * self.zoom
+        step_y = self.grid_size[1] * self.scale * self.zoom
+        if min(step_x, step_y) < 4:
+            return  # 网格过密时不绘制，吸附仍然有效
+        width = self.image_width * self.zoom
+        height = self.image_height * self.zoom
+        x = step_x
+        while x < width:
+            self.canvas.create_line(x, 0, x, height, fill='#ffffff', dash=(2, 4), tags="grid")
+            x += step_x
+        y = step_y
+        while y < height:
+            self.canvas.create_line(0, y, width, y, fill='#ffffff', dash=(2, 4), tags="grid")
+            y += step_y
+        self.canvas.tag_raise("grid", "tile")
+    
+    def configure_grid(self):
+        """设置图标网格单元大小（原图像素）"""
+        width = simpledialog.askinteger("▦ 网格设置", "网格单元宽度（原图像素）:", parent=self.root,
+                                        initialvalue=self.grid_size[0], minvalue=8, maxvalue=4096)
+        if not width:
+            return
+        height = simpledialog.askinteger("▦ 网格设置", "网格单元高度（原图像素）:", parent=self.root,
+                                         initialvalue=self.grid_size[1], minvalue=8, maxvalue=4096)
+        if not height:
+            return
+        self.grid_size = [width, height]
+        self.grid_var.set(True)
+        self.draw_grid()
+    
+    def hit_handle(self, bounds, x, y):
+        """返回坐标所在的调整手柄（'se'/'nw'/'ne'/'sw'），不在手柄上时返回 None"""
+        left, top, right, bottom = bounds
+        if not (left <= x <= right and top <= y <= bottom):
+            return None
+        handle_size = self.HANDLE_SIZE / self.zoom  # 手柄保持固定的屏幕尺寸
+        near_left = x <= left + handle_size
+        near_right = x >= right - handle_size
+        near_top = y <= top + handle_size
+        near_bottom = y >= bottom - handle_size
+        if near_right and near_bottom:
+            return 'se'  # 右下角
+        if near_left and near_top:
+            return 'nw'  # 左上角
+        if near_right and near_top:
+            return 'ne'  # 右上角
+        if near_left and near_bottom:
+            return 'sw'  # 左下角
+        return None
+    
+    def region_geometry(self, region):
+        """区域的几何属性"""
+        return {key: region[key] for key in ('x', 'y', 'width', 'height')}
+    
+    def selection_bounds(self, indices=None):
+        """选中区域的外框 (left, top, right, bottom)"""
+        regions = [self.regions[i] for i in (self.selected_regions if indices is None else indices)]
+        return (min(region['x'] for region in regions),
+                min(region['y'] for region in regions),
+                max(region['x'] + region['width'] for region in regions),
+                max(region['y'] + region['height'] for region in regions))
+    
+    def set_selection(self, indices, primary=None):
+        """设置选中区域集合，primary 为属性面板编辑的主选区域"""
+        self.selected_regions = set(indices)
+        if primary is None and self.selected_region in self.selected_regions:
+            primary = self.selected_region
+        if primary is None and self.selected_regions:
+            primary = max(self.selected_regions)
+        if primary != self.selected_region:
+            self.selected_cell = None
+        self.selected_region = primary
         self.update_attribute_panel()
         self.redraw_regions()
     
+    def apply_geometry(self, updates):
+        """批量更新区域几何属性：一条撤销记录、一次重绘、一次自动保存标记"""
+        changed = {i: geometry for i, geometry in updates.items()
+                   if any(self.regions[i][key] != value for key, value in geometry.items())}
+        if not changed:
+            return
+        self.record_history()
+        for i, geometry in changed.items():
+            self.regions[i].update(geometry)
+        self.redraw_regions()
+        self.mark_project_modified()
+    
+    def align_selected(self, label=None):
+        """对齐选中区域：多选时以整组外框为基准，单选时以画布为基准"""
+        if not self.selected_regions:
+            messagebox.showwarning("警告", "请先选择区域")
+            return
+        mode = next(key for key, value in self.ALIGN_LABELS.items() if value == self.align_var.get())
+        if len(self.selected_regions) > 1:
+            left, top, right, bottom = self.selection_bounds()
+        else:
+            left, top, right, bottom = 0, 0, self.image_width, self.image_height
+        
+        updates = {}
+        for i in self.selected_regions:
+            region = self.regions[i]
+            if mode == 'left':
+                updates[i] = {'x': left}
+            elif mode == 'hcenter':
+                updates[i] = {'x': (left + right - region['width']) / 2}
+            elif mode == 'right':
+                updates[i] = {'x': right - region['width']}
+            elif mode == 'top':
+                updates[i] = {'y': top}
+            elif mode == 'vcenter':
+                updates[i] = {'y': (top + bottom - region['height']) / 2}
+            else:
+                updates[i] = {'y': bottom - region['height']}
+        self.apply_geometry(updates)
+    
+    def distribute_selected(self, axis):
+        """在整组外框内等间距分布选中区域（axis 为 'x' 或 'y'）"""
+        if len(self.selected_regions) < 3:
+            messagebox.showwarning("警告", "至少选择三个区域才能等距分布")
+            return
+        size_key = 'width' if axis == 'x' else 'height'
+        ordered = sorted(self.selected_regions, key=lambda i: self.regions[i][axis])
+        start = self.regions[ordered[0]][axis]
+        end = max(self.regions[i][axis] + self.regions[i][size_key] for i in ordered)
+        gap = (end - start - sum(self.regions[i][size_key] for i in ordered)) / (len(ordered) - 1)
+        
+        updates = {}
+        position = start
+        for i in ordered:
+            updates[i] = {axis: position}
+            position += self.regions[i][size_key] + gap
+        self.apply_geometry(updates)
+    
+    def record_history(self, snapshot=None):
+        """记录一条撤销记录（默认为当前区域列表的快照）"""
+        self.history.append(copy.deepcopy(self.regions) if snapshot is None else snapshot)
+        del self.history[:-self.HISTORY_LIMIT]
+    
+    def record_edit(self, field):
+        """属性修改前记录撤销：连续修改同一区域的同一属性（逐键输入、拖动滑块）只记录一条，
+        中间有其他操作或撤销后重新开始"""
+        key = (self.selected_region, field)
+        last = self.edit_key
+        if last is None or last[0] != key or not self.history or self.history[-1] is not last[1]:
+            self.record_history()
+            self.edit_key = (key, self.history[-1])
+    
+    def undo(self, event=None):
+        """撤销上一次区域操作"""
+        if not self.history:
+            return
+        self.regions = self.history.pop()
+        self.set_selection(i for i in self.selected_regions if i < len(self.regions))
+        # 标记项目已修改，触发自动保存
+        self.mark_project_modified()
+    
+    def select_region(self, index):
+        """选择区域"""
+        self.set_selection([index], index)
+    
     def update_attribute_panel(self):
         """更新属性面板"""
         if self.selected_region is not None and self.selected_region < len(self.regions):
             region = self.regions[self.selected_region]
             self.name_var.set(region['name'])
-            self.text_var.set(region['text'])
+            self.text_var.set(self.region_text(region))
             self.alpha_var.set(region['alpha'])
+            self.fill_var.set(self.FILL_LABELS[region.get('fill', 'solid')])
+            self.blur_var.set(region.get('blur', DEFAULT_BLUR_RADIUS))
+            self.corner_var.set(region.get('corner_radius', 0))
         else:
             self.name_var.set("")
             self.text_var.set("")
             self.alpha_var.set(128)
+            self.fill_var.set(self.FILL_LABELS['solid'])
+            self.blur_var.set(DEFAULT_BLUR_RADIUS)
+            self.corner_var.set(0)
     
     def update_region_name(self, event=None):
         """更新区域名称"""
         if self.selected_region is not None:
-            self.regions[self.selected_region]['name'] = self.name_var.get()
+            name = self.name_var.get()
+            if name == self.regions[self.selected_region]['name']:
+                return
+            self.record_edit('name')
+            self.regions[self.selected_region]['name'] = name
             # 标记项目已修改，触发自动保存
             self.mark_project_modified()
     
     def update_region_text(self, event=None):
         """更新区域文字"""
         if self.selected_region is not None:
-            self.regions[self.selected_region]['text'] = self.text_var.get()
+            region = self.regions[self.selected_region]
+            text = self.text_var.get()
+            cell = self.grid_cell(region)
+            if text == self.region_text(region) or (cell is None and is_grid(region)):
+                return
+            self.record_edit(('text', cell))
+            if cell is not None:
+                labels = region.setdefault('labels', [])
+                labels.extend([""] * (cell + 1 - len(labels)))
+                labels[cell] = text
+            else:
+                region['text'] = text
             self.redraw_regions()
             # 标记项目已修改，触发自动保存
             self.mark_project_modified()
     
+    def grid_cell(self, region):
+        """主选区域为图标网格时当前选中的单元格（已失效时返回 None）"""
+        if not is_grid(region) or self.selected_cell is None:
+            return None
+        if self.selected_cell >= region.get('rows', 1) * region.get('columns', 1):
+            return None
+        return self.selected_cell
+    
+    def region_text(self, region):
+        """属性面板显示的文字：普通区域为区域文字，图标网格为选中单元格的标签"""
+        if not is_grid(region):
+            return region['text']
+        cell = self.grid_cell(region)
+        labels = region.get('labels', [])
+        return labels[cell] if cell is not None and cell < len(labels) else ""
+    
     def update_region_alpha(self, event=None):
         """更新区域透明度"""
         if self.selected_region is not None:
-            self.regions[self.selected_region]['alpha'] = self.alpha_var.get()
+            alpha = self.alpha_var.get()
+            if alpha == self.regions[self.selected_region]['alpha']:
+                return
+            self.record_edit('alpha')
+            self.regions[self.selected_region]['alpha'] = alpha
+            self.redraw_regions()
+            # 标记项目已修改，触发自动保存
+            self.mark_project_modified()
+    
+    def update_region_fill(self, label=None):
+        """更新区域填充样式"""
+        if self.selected_region is not None:
+            fill = next(key for key, value in self.FILL_LABELS.items() if value == self.fill_var.get())
+            if fill == self.regions[self.selected_region].get('fill', 'solid'):
+                return
+            self.record_history()
+            self.regions[self.selected_region]['fill'] = fill
             self.redraw_regions()
             # 标记项目已修改，触发自动保存
             self.mark_project_modified()
     
+    def update_region_blur(self, event=None):
+        """更新毛玻璃模糊半径"""
+        if self.selected_region is not None:
+            blur = self.blur_var.get()
+            if blur == self.regions[self.selected_region].get('blur', DEFAULT_BLUR_RADIUS):
+                return
+            self.record_edit('blur')
+            self.regions[self.selected_region]['blur'] = blur
+            if self.regions[self.selected_region].get('fill') == 'frosted':
+                self.redraw_regions()
+            # 标记项目已修改，触发自动保存
+            self.mark_project_modified()
+    
+    def update_region_corner(self, event=None):
+        """更新区域圆角半径"""
+        if self.selected_region is not None:
+            corner_radius = self.corner_var.get()
+            if corner_radius == self.regions[self.selected_region].get('corner_radius', 0):
+                return
+            self.record_edit('corner_radius')
+            self.regions[self.selected_region]['corner_radius'] = corner_radius
+            self.redraw_regions()
+            # 标记项目已修改，触发自动保存
+            self.mark_project_modified()
+    
+    def choose_gradient_color(self):
+        """选择渐变终止色"""
+        if self.selected_region is not None:
+            region = self.regions[self.selected_region]
+            color = colorchooser.askcolor(color=region.get('color2', DEFAULT_GRADIENT_END),
+                                          title="选择渐变终止色")
+            if color[1]:  # 如果用户选择了颜色
+                self.record_history()
+                region['color2'] = color[1]
+                self.redraw_regions()
+                # 标记项目已修改，触发自动保存
+                self.mark_project_modified()
+    
     def choose_color(self):
         """选择颜色"""
         if self.selected_region is not None:
             color = colorchooser.askcolor(title="选择区域颜色")
             if color[1]:  # 如果用户选择了颜色
+                self.record_history()
                 self.regions[self.selected_region]['color'] = color[1]
                 self.redraw_regions()
                 # 标记项目已修改，触发自动保存
                 self.mark_project_modified()
     
+    @metrics.timed('redraw_regions')
     def redraw_regions(self):
         """重绘所有区域"""
-        if not self.background_image:
+        if not self.original_image:
             return
             
         # 清除之前的区域绘制
         self.canvas.delete("region")
         
+        # 本次绘制用到的图片引用，防止被垃圾回收
+        self.overlay_images = []
+        
         for i, region in enumerate(self.regions):
-            # 创建半透明覆盖层
-            overlay = Image.new('RGBA', (region['width'], region['height']), 
-                              (*self.hex_to_rgb(region['color']), region['alpha']))
-            
-            # 创建覆盖层图片
-            overlay_photo = ImageTk.PhotoImage(overlay)
+            # 区域图层由导出合成器渲染（覆盖层 + 标签贴图），按内容缓存
+            region = self.view_region(region)
+            overlay_photo = self.region_preview_photo(region, self.scale * self.zoom)
+            self.overlay_images.append(overlay_photo)
             
             # 在画布上绘制区域
             region_id = self.canvas.create_image(
@@ -748,195 +1518,398 @@ class WallpaperEditor:
                 tags="region"
             )
             
-            # 保存图片引用防止被垃圾回收
-            if not hasattr(self, 'overlay_images'):
-                self.overlay_images = []
-            self.overlay_images.append(overlay_photo)
+            # 如果是选中区域，绘制边框（主选区域加粗）
+            if i in self.selected_regions:
+                self.canvas.create_rectangle(
+                    region['x'], region['y'],
+                    region['x'] + region['width'], region['y'] + region['height'],
+                    outline='yellow', width=3 if i == self.selected_region else 2, tags="region"
+                )
             
-            # 绘制区域文字（左上角位置）
-            if region['text']:
-                # 检查文字长度，如果太长则截断显示
-                display_text = region['text']
-                if len(display_text) > 20:  # 如果文字超过20个字符，截断显示
-                    display_text = display_text[:17] + "..."
-                
-                text_id = self.canvas.create_text(
-                    region['x'] + 3,  # 置顶显示，留3像素边距
-                    region['y'] + 3,  # 置顶显示，留3像素边距
-                    text=display_text,
-                    fill='white',
-                    font=('Arial', 9, 'bold'),  # 使用更小但加粗的字体
-                    tags="region",
-                    anchor='nw'  # 左对齐
+            # 图标网格中正在编辑标签的单元格
+            if i == self.selected_region and self.grid_cell(region) is not None:
+                cell, offsets = grid_layout(region)
+                dx, dy = offsets[self.selected_cell]
+                self.canvas.create_rectangle(
+                    region['x'] + dx, region['y'] + dy,
+                    region['x'] + dx + cell[0], region['y'] + dy + cell[1],
+                    outline='#22d3ee', width=2, tags="region"
                 )
+        
+        # 选中区域的调整大小手柄：单选在区域四角，多选在整组外框四角
+        if self.selected_regions:
+            left, top, right, bottom = (round(v * self.zoom) for v in self.selection_bounds())
+            if len(self.selected_regions) > 1:
+                self.canvas.create_rectangle(left, top, right, bottom, outline='yellow',
+                                             dash=(6, 3), width=1, tags="region")
             
-            # 如果是选中区域，绘制边框和调整大小手柄
-            if i == self.selected_region:
-                # 绘制边框
+            handle_size = self.HANDLE_SIZE
+            # 四个角的手柄
+            handles = [
+                (left - handle_size//2, top - handle_size//2, 'nw'),  # 左上角
+                (right - handle_size//2, top - handle_size//2, 'ne'),  # 右上角
+                (left - handle_size//2, bottom - handle_size//2, 'sw'),  # 左下角
+                (right - handle_size//2, bottom - handle_size//2, 'se')  # 右下角
+            ]
+            
+            for handle_x, handle_y, handle_type in handles:
                 self.canvas.create_rectangle(
-                    region['x'], region['y'],
-                    region['x'] + region['width'], region['y'] + region['height'],
-                    outline='yellow', width=3, tags="region"
+                    handle_x, handle_y,
+                    handle_x + handle_size, handle_y + handle_size,
+                    fill='yellow', outline='black', width=1, tags="region"
                 )
-                
-                # 绘制调整大小手柄
-                handle_size = 8
-                # 四个角的手柄
-                handles = [
-                    (region['x'] - handle_size//2, region['y'] - handle_size//2, 'nw'),  # 左上角
-                    (region['x'] + region['width'] - handle_size//2, region['y'] - handle_size//2, 'ne'),  # 右上角
-                    (region['x'] - handle_size//2, region['y'] + region['height'] - handle_size//2, 'sw'),  # 左下角
-                    (region['x'] + region['width'] - handle_size//2, region['y'] + region['height'] - handle_size//2, 'se')  # 右下角
-                ]
-                
-                for handle_x, handle_y, handle_type in handles:
-                    self.canvas.create_rectangle(
-                        handle_x, handle_y,
-                        handle_x + handle_size, handle_y + handle_size,
-                        fill='yellow', outline='black', width=1, tags="region"
-                    )
+    
+    def view_region(self, region):
+        """区域在当前缩放下的显示坐标（几何属性乘以缩放倍数，取整到屏幕像素）"""
+        view = dict(region)
+        for key in ('x', 'y', 'width', 'height'):
+            view[key] = int(round(region[key] * self.zoom))
+        view['corner_radius'] = region.get('corner_radius', 0) * self.zoom
+        view['blur'] = region.get('blur', DEFAULT_BLUR_RADIUS) * self.zoom
+        if 'gutter' in region:
+            view['gutter'] = region['gutter'] * self.zoom
+        return view
+    
+    def region_preview_photo(self, region, scale):
+        """用导出合成器渲染区域的预览图层：覆盖层按显示尺寸生成，标签使用与导出相同的
+        原始尺寸贴图再缩小；内容不变时直接复用缓存的 PhotoImage（移动区域无需重新合成）"""
+        original = scale_region(region, scale)
+        labels = self.compositor.region_labels(original, self.original_image.size, self.luminance_stats)
+        
+        # 缓存条目持有 sprite 引用，因此 id(sprite) 在条目存活期间不会被复用
+        key = (region['width'], region['height'], region['color'], region['alpha'],
+               region.get('fill', 'solid'), region.get('color2'), region.get('corner_radius', 0),
+               region.get('blur'), scale,
+               tuple((id(sprite), position[0] - original['x'], position[1] - original['y'])
+                     for sprite, position in labels))
+        if is_grid(region):
+            key += (region['rows'], region['columns'], region['gutter'])
+        if region.get('fill') == 'frosted':
+            key += (region['x'], region['y'])
+        cached = self.preview_layers.get(key)
+        if cached is not None:
+            return cached[0]
+        
+        layer = self.compositor.preview_layer(self.original_image, region, scale, labels=labels)
+        photo = ImageTk.PhotoImage(layer)
+        self.preview_layers.put(key, (photo, labels))
+        return photo
     
     def hex_to_rgb(self, hex_color):
         """将十六进制颜色转换为RGB"""
-        hex_color = hex_color.lstrip('#')
-        return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+        return hex_to_rgb(hex_color)
+    
+    @metrics.timed('compose_output_image')
+    def compose_output_image(self):
+        """在原始尺寸上合成所有区域，返回输出图片"""
+        return self.compositor.compose(self.original_image, self.regions, self.scale,
+                                       self.luminance_stats)
     
     def save_wallpaper(self):
-        """保存壁纸"""
+        """保存壁纸：项目快照放入后台导出队列，同一输出的旧导出被取代"""
         if not self.original_image or not self.regions:
             messagebox.showwarning("警告", "没有可保存的内容")
             return
-            
-        # 使用原始图片创建输出图片
-        output_image = self.original_image.copy().convert('RGBA')
-        
-        # 绘制所有区域
-        for region in self.regions:
-            # 计算原始图片中的坐标和尺寸
-            original_x = int(region['x'] / self.scale)
-            original_y = int(region['y'] / self.scale)
-            original_width = int(region['width'] / self.scale)
-            original_height = int(region['height'] / self.scale)
-            
-            # 创建区域覆盖层
-            overlay = Image.new('RGBA', (original_width, original_height), 
-                              (*self.hex_to_rgb(region['color']), region['alpha']))
-            
-            # 将覆盖层粘贴到输出图片上
-            output_image.paste(overlay, (original_x, original_y), overlay)
-            
-            # 添加文字
-            if region['text']:
-                try:
-                    # 尝试使用支持中文的字体，使用更小的字体大小
-                    import platform
-                    system = platform.system()
-                    if system == "Windows":
-                        # Windows系统使用微软雅黑
-                        font = ImageFont.truetype("msyh.ttc", 14)
-                    elif system == "Darwin":  # macOS
-                        # macOS系统使用苹方字体
-                        font = ImageFont.truetype("/System/Library/Fonts/PingFang.ttc", 14)
-                    else:  # Linux
-                        # Linux系统尝试使用文泉驿字体
-                        font = ImageFont.truetype("/usr/share/fonts/truetype/wqy/wqy-microhei.ttc", 14)
-                except:
-                    try:
-                        # 备用方案：尝试其他常见中文字体
-                        font = ImageFont.truetype("simhei.ttf", 14)
-                    except:
-                        # 最后使用默认字体
-                        font = ImageFont.load_default()
-                
-                # 创建文字图片（使用原始尺寸）
-                text_img = Image.new('RGBA', (original_width, original_height), (0, 0, 0, 0))
-                draw = ImageDraw.Draw(text_img)
-                
-                # 获取文字边界框
-                bbox = draw.textbbox((0, 0), region['text'], font=font)
-                text_width = bbox[2] - bbox[0]
-                text_height = bbox[3] - bbox[1]
-                
-                # 计算文字位置（置顶显示，留3像素边距）
-                text_x = 3
-                text_y = 3
-                
-                # 检查文字是否超出区域边界
-                max_width = original_width - 6  # 留出6px边距（置顶显示）
-                max_height = original_height - 6  # 留出6px边距
-                
-                # 如果文字超出边界，进行自动换行
-                if text_width > max_width or text_height > max_height:
-                    # 计算每行最大字符数
-                    char_width = text_width / len(region['text']) if region['text'] else 1
-                    max_chars_per_line = int(max_width / char_width) if char_width > 0 else 1
-                    
-                    # 分行处理
-                    lines = []
-                    current_line = ""
-                    for char in region['text']:
-                        if len(current_line) >= max_chars_per_line:
-                            lines.append(current_line)
-                            current_line = char
-                        else:
-                            current_line += char
-                    if current_line:
-                        lines.append(current_line)
-                    
-                    # 绘制多行文字
-                    line_height = text_height + 2  # 行间距
-                    for i, line in enumerate(lines):
-                        if text_y + i * line_height + text_height <= max_height:
-                            # 先绘制阴影
-                            draw.text((text_x + 1, text_y + i * line_height + 1), line, fill=(0, 0, 0, 180), font=font)
-                            # 再绘制主文字
-                            draw.text((text_x, text_y + i * line_height), line, fill=(255, 255, 255, 255), font=font)
-                        else:
-                            # 如果还有更多行但空间不够，显示省略号
-                            if i < len(lines) - 1:
-                                # 省略号也添加阴影
-                                draw.text((text_x + 1, text_y + i * line_height + 1), "...", fill=(0, 0, 0, 180), font=font)
-                                draw.text((text_x, text_y + i * line_height), "...", fill=(255, 255, 255, 255), font=font)
-                            break
-                else:
-                    # 文字不超出边界，正常绘制
-                    # 先绘制阴影效果（黑色，偏移1像素）
-                    draw.text((text_x + 1, text_y + 1), region['text'], fill=(0, 0, 0, 180), font=font)
-                    # 再绘制主文字（白色）
-                    draw.text((text_x, text_y), region['text'], fill=(255, 255, 255, 255), font=font)
-                
-                # 将文字粘贴到输出图片上（使用原始坐标）
-                output_image.paste(text_img, (original_x, original_y), text_img)
         
         # 自动生成文件名
         if not self.original_image_path:
             messagebox.showwarning("警告", "请先加载壁纸")
             return
-            
-        # 获取原文件路径和扩展名
-        import os
-        original_dir = os.path.dirname(self.original_image_path)
-        original_name = os.path.splitext(os.path.basename(self.original_image_path))[0]
-        original_ext = os.path.splitext(self.original_image_path)[1]
         
-        # 生成新文件名：原文件名 + edit + 原扩展名
-        new_filename = f"{original_name}_edit{original_ext}"
-        file_path = os.path.join(original_dir, new_filename)
+        # 输出文件名：原文件名 + edit + 扩展名（可选择输出格式）
+        self.submit_export(wallpaper_job(self.compositor, self.export_snapshot()))
+    
+    def export_snapshot(self):
+        """导出用的项目快照：区域深拷贝，源图和亮度积分图只读，可在线程间共享"""
+        return {
+            'image': self.original_image,
+            'stats': self.luminance_stats,
+            'image_path': self.original_image_path,
+            'animated': self.source_animated,
+            'regions': copy.deepcopy(self.regions),
+            'scale': self.scale,
+            'fmt': self.get_selected_format(),
+            'profile': self.get_selected_profile()
+        }
+    
+    def submit_export(self, job):
+        """提交导出任务并开始刷新状态"""
+        self.export_queue.submit(job)
+        self.poll_exports()
+    
+    def poll_exports(self):
+        """刷新导出状态栏和队列窗口；有未完成的导出或队列窗口打开时继续定时刷新"""
+        if self.export_timer:
+            self.root.after_cancel(self.export_timer)
+            self.export_timer = None
+        # 导出线程超出预算时跳过的 PhotoImage 缓存在这里淘汰
+        memory_budget.enforce_deferred()
+        
+        with self.export_queue.lock:
+            jobs = list(self.export_queue.jobs)
+            lines = [job.describe() for job in jobs]
+        active = [job for job in jobs if job.state in ACTIVE_STATES]
+        
+        # 状态栏：进行中的数量，以及最近结束的一个任务的结果
+        finished = [job for job in jobs if job.finished and job.finished > self.last_export_finished]
+        if finished:
+            latest = max(finished, key=lambda job: job.finished)
+            self.last_export_finished = latest.finished
+            self.last_export_line = latest.describe()
+        status = f"📤 {len(active)} 个导出进行中" if active else "📤 没有进行中的导出"
+        if self.last_export_line:
+            status += f"　|　最近: {self.last_export_line}"
+        self.export_status_var.set(status)
+        
+        if self.export_window is not None:
+            self.export_rows = jobs
+            self.export_list.delete(0, tk.END)
+            for line in lines:
+                self.export_list.insert(tk.END, line)
+        
+        if active or self.export_window is not None:
+            self.export_timer = self.root.after(self.EXPORT_POLL_INTERVAL, self.poll_exports)
+    
+    def open_export_window(self):
+        """打开导出队列窗口（非模态，导出期间可以继续编辑）"""
+        if self.export_window is not None:
+            self.export_window.lift()
+            return
         
+        window = tk.Toplevel(self.root)
+        window.title("📋 导出队列")
+        window.configure(bg='#ffffff')
+        window.geometry("560x320")
+        window.protocol("WM_DELETE_WINDOW", self.close_export_window)
+        self.export_window = window
+        
+        content = self.create_modern_card(window, "📤 后台导出", 0)
+        self.export_list = tk.Listbox(content, font=('Microsoft YaHei UI', 9), height=10,
+                                      relief='flat', bd=1, highlightthickness=0,
+                                      selectbackground='#3b82f6')
+        self.export_list.pack(fill=tk.BOTH, expand=True)
+        
+        button_frame = tk.Frame(window, bg='#ffffff')
+        button_frame.pack(fill=tk.X, padx=12, pady=(0, 12))
+        for text, command, color in (("⛔ 取消", self.cancel_selected_export, '#ef4444'),
+                                     ("⏫ 优先导出", self.prioritize_selected_export, '#3b82f6'),
+                                     ("🧹 清除已结束", self.clear_finished_exports, '#64748b')):
+            tk.Button(button_frame, text=text, command=command, font=('Microsoft YaHei UI', 9),
+                      bg=color, fg='white', relief='flat', bd=0, cursor='hand2',
+                      padx=12, pady=4).pack(side=tk.LEFT, padx=(0, 6))
+        self.poll_exports()
+    
+    def close_export_window(self):
+        self.export_window.destroy()
+        self.export_window = None
+        self.export_list = None
+    
+    def selected_export(self):
+        """队列窗口中选中的任务"""
+        selection = self.export_list.curselection() if self.export_list else ()
+        if not selection or selection[0] >= len(self.export_rows):
+            return None
+        return self.export_rows[selection[0]]
+    
+    def cancel_selected_export(self):
+        job = self.selected_export()
+        if job is not None:
+            self.export_queue.cancel(job)
+            self.poll_exports()
+    
+    def prioritize_selected_export(self):
+        job = self.selected_export()
+        if job is not None:
+            self.export_queue.set_priority(job, PRIORITY_HIGH)
+            self.poll_exports()
+    
+    def clear_finished_exports(self):
+        self.export_queue.clear_finished()
+        self.poll_exports()
+    
+    def on_close(self):
+        """关闭窗口：有未完成的导出时确认，退出前取消它们。
+        取消只在步骤之间检查，正在编码的大图可能还要很久，所以只短暂等待工作线程；
+        它们是守护线程，随进程退出，输出文件只在任务完成时才替换，不会留下半截结果"""
+        pending = self.export_queue.pending()
+        if pending and not messagebox.askyesno(
+                "导出未完成", f"还有 {pending} 个导出未完成，退出将取消这些导出。\n确定退出吗？"):
+            return
+        self.export_queue.shutdown(cancel=True, timeout=self.EXPORT_CLOSE_TIMEOUT)
+        self.root.destroy()
+    
+    def get_selected_profile(self):
+        """获取当前选择的编码配置"""
+        label = self.profile_var.get()
+        for name, profile in ENCODER_PROFILES.items():
+            if profile['label'] == label:
+                return name
+        return DEFAULT_PROFILE
+    
+    def get_selected_format(self):
+        """获取当前选择的输出格式，保持原格式时返回None"""
+        fmt = self.format_var.get()
+        if fmt == "原格式":
+            return None
+        return fmt.upper()
+    
+    def open_multi_export_dialog(self):
+        """打开多目标导出对话框：选择分辨率预设和显示器拆分"""
+        if not self.original_image or not self.regions:
+            messagebox.showwarning("警告", "没有可保存的内容")
+            return
+        
+        dialog = tk.Toplevel(self.root)
+        dialog.title("🖥️ 多目标导出")
+        dialog.configure(bg='#ffffff')
+        dialog.transient(self.root)
+        
+        content = self.create_modern_card(dialog, "📐 分辨率预设", 0)
+        preset_vars = {}
+        for name, (width, height) in EXPORT_PRESETS.items():
+            var = tk.BooleanVar(value=False)
+            tk.Checkbutton(content, text=f"{name} ({width}×{height})", variable=var,
+                           font=('Microsoft YaHei UI', 10), bg='#ffffff', fg='#374151',
+                           activebackground='#ffffff').pack(anchor=tk.W)
+            preset_vars[name] = var
+        
+        split_card = self.create_modern_card(dialog, "🖥️ 显示器拆分", 0)
+        split_frame = tk.Frame(split_card, bg='#ffffff')
+        split_frame.pack(fill=tk.X)
+        tk.Label(split_frame, text="横向显示器数量 (1为不拆分):",
+                 font=('Microsoft YaHei UI', 10), bg='#ffffff', fg='#374151').pack(side=tk.LEFT)
+        columns_var = tk.IntVar(value=1)
+        tk.Spinbox(split_frame, from_=1, to=8, width=4, textvariable=columns_var,
+                   font=('Microsoft YaHei UI', 10)).pack(side=tk.RIGHT)
+        
+        def on_export():
+            targets = [{'name': name, 'size': list(EXPORT_PRESETS[name])}
+                       for name, var in preset_vars.items() if var.get()]
+            try:
+                columns = int(columns_var.get())
+            except (tk.TclError, ValueError):
+                columns = 1
+            if columns > 1:
+                targets.extend(split_monitors(*self.original_image.size, columns))
+            if not targets:
+                messagebox.showwarning("警告", "请至少选择一个导出目标", parent=dialog)
+                return
+            dialog.destroy()
+            self.export_multi_targets(targets)
+        
+        button_frame = tk.Frame(dialog, bg='#ffffff')
+        button_frame.pack(fill=tk.X, padx=12, pady=12)
+        self.create_modern_button(button_frame, "💾 开始导出", on_export, '#10b981')
+    
+    def export_multi_targets(self, targets):
+        """后台合成一次，再裁剪/缩放出所有导出目标（批量导出优先级较低）"""
+        self.submit_export(targets_job(self.compositor, self.export_snapshot(), targets))
+    
+    def toggle_recording(self, event=None):
+        """开始/停止录制输入事件，停止时选择保存位置"""
+        if self.event_recorder.recording:
+            recording = self.event_recorder.stop()
+            self.root.title(self.WINDOW_TITLE)
+            file_path = filedialog.asksaveasfilename(
+                title="保存事件录制",
+                defaultextension=".json",
+                filetypes=[("JSON文件", "*.json")]
+            )
+            if file_path:
+                try:
+                    self.event_recorder.save(file_path)
+                    self.export_status_var.set(
+                        f"🎬 已录制 {len(recording['events'])} 个事件: {os.path.basename(file_path)}")
+                except OSError as e:
+                    messagebox.showerror("错误", f"保存录制失败: {str(e)}")
+            return
+        
+        if not self.original_image:
+            messagebox.showwarning("警告", "请先加载壁纸")
+            return
+        self.event_recorder.start()
+        self.root.title(f"{self.WINDOW_TITLE} - ⏺ 录制中（F9 停止）")
+    
+    def toggle_hud(self, event=None):
+        """显示/隐藏性能面板（打开时自动启用统计）"""
+        if self.hud_timer:
+            self.root.after_cancel(self.hud_timer)
+            self.hud_timer = None
+            self.canvas.delete("hud")
+            return
+        metrics.enabled = True
+        self.update_hud()
+    
+    def update_hud(self):
+        """刷新画布左上角的性能面板：帧时间、重绘次数、缓存命中率和内存"""
+        stats = metrics.snapshot()
+        redraw = stats['timers'].get('redraw_regions', {})
+        tiles = stats['timers'].get('update_tiles', {})
+        lines = [
+            f"帧时间  {redraw.get('last_ms', 0):.1f} ms (平均 {redraw.get('mean_ms', 0):.1f}, 最大 {redraw.get('max_ms', 0):.1f})",
+            f"瓦片    {tiles.get('last_ms', 0):.1f} ms, 生成 {stats['timers'].get('render_tile', {}).get('count', 0)} 块",
+            f"重绘    {redraw.get('count', 0)} 次"
+        ]
+        first_frame = stats['timers'].get('startup.first_frame')
+        if first_frame:
+            status = "" if first_frame['last_ms'] <= self.STARTUP_BUDGET * 1000 else " ⚠️ 超出预算"
+            lines.append(f"启动    导入 {stats['timers']['startup.import']['last_ms']:.0f} ms, "
+                         f"首帧 {first_frame['last_ms']:.0f} ms (预算 {self.STARTUP_BUDGET * 1000:.0f}){status}")
+        for name, cache in stats['caches'].items():
+            rate = '—' if cache['hit_rate'] is None else f"{cache['hit_rate'] * 100:.0f}%"
+            lines.append(f"{name:<15} 命中 {rate} ({cache['hits']}/{cache['hits'] + cache['misses']})")
+        if stats['memory_bytes'] is not None:
+            lines.append(f"内存    {format_size(stats['memory_bytes'])}")
+        budget = stats['memory_budget']
+        lines.append(f"图像预算 {format_size(budget['total_bytes'])} / {format_size(budget['limit_bytes'])}"
+                     f" (峰值 {format_size(budget['peak_bytes'])})")
+        for name, size in budget['categories'].items():
+            lines.append(f"  {name:<13} {format_size(size)}")
+        
+        # 固定在可见区域左上角（平移/缩放后仍然可见）
+        self.canvas.delete("hud")
+        x = self.canvas.canvasx(8)
+        y = self.canvas.canvasy(8)
+        text = self.canvas.create_text(x + 6, y + 4, anchor=tk.NW, text="\n".join(lines),
+                                       font=('Consolas', 9), fill='#f8fafc', tags="hud")
+        self.canvas.create_rectangle(self.canvas.bbox(text), fill='#1e293b', outline='',
+                                     tags="hud")
+        self.canvas.tag_raise(text)
+        self.hud_timer = self.root.after(self.HUD_INTERVAL, self.update_hud)
+    
+    def dump_metrics(self):
+        """把性能统计导出为JSON，用于比较不同版本"""
+        if not metrics.enabled:
+            messagebox.showwarning("警告", "性能统计未启用：按 F3 打开性能面板，或设置环境变量 WALLPAPER_PERF=1")
+            return
+        file_path = filedialog.asksaveasfilename(
+            title="导出性能数据",
+            defaultextension=".json",
+            filetypes=[("JSON文件", "*.json")]
+        )
+        if file_path:
+            try:
+                metrics.dump(file_path)
+                messagebox.showinfo("✅ 导出成功", f"🎉 性能数据已保存到: {file_path}")
+            except Exception as e:
+                messagebox.showerror("错误", f"导出失败: {str(e)}")
+    
+    def compare_encoders(self):
+        """按所有编码配置试编码，对比耗时和文件大小"""
+        if not self.original_image or not self.regions:
+            messagebox.showwarning("警告", "没有可保存的内容")
+            return
+        
+        fmt = self.get_selected_format() or format_for_path(self.original_image_path) or 'PNG'
         try:
-            if file_path.lower().endswith('.jpg') or file_path.lower().endswith('.jpeg'):
-                # JPEG不支持透明度，转换为RGB，使用最高质量保存
-                output_image = output_image.convert('RGB')
-                output_image.save(file_path, 'JPEG', quality=100)
-            elif file_path.lower().endswith('.png'):
-                # PNG格式无损保存，不进行任何压缩
-                output_image.save(file_path, 'PNG', compress_level=0)
-            else:
-                # 其他格式使用默认设置
-                output_image.save(file_path)
-            messagebox.showinfo("✅ 保存成功", f"🎉 壁纸保存成功！\n📁 保存位置: {file_path}")
+            results = benchmark_profiles(self.compose_output_image(), fmt)
         except Exception as e:
-            messagebox.showerror("错误", f"保存失败: {str(e)}")
+            messagebox.showerror("错误", f"编码对比失败: {str(e)}")
+            return
+        
+        lines = [f"{ENCODER_PROFILES[r['profile']]['label']}: {r['seconds']:.2f} 秒, {format_size(r['bytes'])}"
+                 for r in results]
+        messagebox.showinfo("📊 编码对比", f"输出格式: {fmt}\n\n" + "\n".join(lines))
     
     def save_project(self):
         """保存项目"""
@@ -954,7 +1927,8 @@ class WallpaperEditor:
             try:
                 project_data = {
                     'regions': self.regions,
-                    'image_path': getattr(self, 'original_image_path', '')
+                    'image_path': getattr(self, 'original_image_path', ''),
+                    'scale': getattr(self, 'scale', 1.0)  # 区域为预览坐标，无界面渲染时据此换算
                 }
                 with open(file_path, 'w', encoding='utf-8') as f:
                     json.dump(project_data, f, ensure_ascii=False, indent=2)
@@ -975,13 +1949,28 @@ class WallpaperEditor:
                     project_data = json.load(f)
                 
                 self.regions = project_data.get('regions', [])
-                self.selected_region = None
-                self.update_attribute_panel()
-                self.redraw_regions()
+                # 项目保存时的预览比例与当前不同时，把区域换算到当前预览坐标
+                if self.original_image and project_data.get('scale'):
+                    ratio = self.scale / project_data['scale']
+                    if abs(ratio - 1) > 1e-6:
+                        self.rescale_regions(self.regions, ratio)
+                self.history = []
+                self.set_selection([])
                 messagebox.showinfo("✅ 加载成功", f"🎉 项目已加载: {file_path}")
             except Exception as e:
                 messagebox.showerror("错误", f"加载失败: {str(e)}")
     
+    def rescale_regions(self, regions, ratio):
+        """把区域换算到另一个预览比例（原地修改，几何属性保持浮点以免损失精度）"""
+        for region in regions:
+            for key in ('x', 'y', 'width', 'height'):
+                region[key] = region[key] * ratio
+            for key in ('corner_radius', 'blur'):
+                if key in region:
+                    region[key] = int(round(region[key] * ratio))
+            if 'gutter' in region:
+                region['gutter'] = region['gutter'] * ratio
+    
     def toggle_auto_save(self):
         """切换自动保存状态"""
         self.auto_save_enabled = self.auto_save_var.get()
@@ -1015,6 +2004,7 @@ class WallpaperEditor:
         if self.auto_save_enabled:
             self.auto_save_timer = self.root.after(self.auto_save_interval, self.auto_save_loop)
     
+    @metrics.timed('perform_auto_save')
     def perform_auto_save(self):
         """执行自动保存"""
         try:
@@ -1026,10 +2016,13 @@ class WallpaperEditor:
                     os.makedirs(auto_save_dir)
                 self.auto_save_path = os.path.join(auto_save_dir, "auto_save.json")
             
-            # 保存项目数据
+            # 保存项目数据（当前壁纸，以及工作区中所有打开的壁纸）
+            self.stash_document()
             project_data = {
                 'regions': self.regions,
-                'background_image_path': self.original_image_path
+                'background_image_path': self.original_image_path,
+                'scale': getattr(self, 'scale', 1.0),
+                'documents': [document.project_data() for document in self.workspace.documents.values()]
             }
             
             with open(self.auto_save_path, 'w', encoding='utf-8') as f:
@@ -1057,9 +2050,26 @@ class WallpaperEditor:
         if self.auto_save_enabled and not self.auto_save_timer:
             self.start_auto_save()
 
+def report_startup(root, probe=False):
+    """首帧显示后把启动耗时记入性能统计（性能面板中与启动预算一起显示）；
+    probe 为 True 时以JSON输出耗时并退出，供基准测试测量真实的首帧时间"""
+    root.update_idletasks()
+    first_frame = time.perf_counter() - STARTUP_BEGIN
+    metrics.record('startup.import', IMPORT_SECONDS)
+    metrics.record('startup.first_frame', first_frame)
+    if probe:
+        print(json.dumps({'import': IMPORT_SECONDS, 'first_frame': first_frame,
+                          'budget': WallpaperEditor.STARTUP_BUDGET}))
+        root.destroy()
+
 def main():
+    parser = argparse.ArgumentParser(description="壁纸区域编辑器")
+    parser.add_argument('--startup-probe', action='store_true',
+                        help="首帧显示后输出启动耗时（JSON）并退出")
+    args = parser.parse_args()
     root = tk.Tk()
     app = WallpaperEditor(root)
+    root.after_idle(report_startup, root, args.startup_probe)
     root.mainloop()
 
 if __name__ == "__main__":
@@ -0,0 +1,1077 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+壁纸编辑器 - 渲染与编码
+不依赖界面的导出逻辑：区域合成、编码配置、多目标导出与编码耗时统计
+"""
+
+import functools
+import io
+import itertools
+import os
+import platform
+import threading
+import time
+import weakref
+import zlib
+from collections import OrderedDict
+
+from PIL import Image, features
+
+from lazy_import import lazy_import
+from memory_budget import memory_budget
+from perf_metrics import metrics
+from region_layout import LuminanceStats
+
+# 只有合成和渲染标签时才用到，推迟到第一次使用时加载
+np = lazy_import('numpy')
+ImageDraw = lazy_import('PIL.ImageDraw')
+ImageFont = lazy_import('PIL.ImageFont')
+# 只有导出、毛玻璃和动画路径才用到
+ImageChops = lazy_import('PIL.ImageChops')
+ImageFilter = lazy_import('PIL.ImageFilter')
+ImageSequence = lazy_import('PIL.ImageSequence')
+futures = lazy_import('concurrent.futures')
+
+LABEL_FONT_SIZE = 14  # 导出时标签文字的字号（原始像素）
+BUNDLED_FONT = 'pillow:default'  # 作为 font_path 时使用 Pillow 自带的字体（与系统无关，需要 Pillow 10.1+）
+COORD_EPSILON = 1e-6  # 浮点预览坐标换算到原图像素时容许的舍入误差
+
+# 编码配置：在编码速度和文件大小之间取舍
+# PNG 的 compress_type 对应 zlib 压缩策略（Pillow 不支持直接指定行过滤器）
+ENCODER_PROFILES = {
+    'fast': {
+        'label': '快速',
+        'PNG': {'compress_level': 1, 'compress_type': zlib.Z_RLE},
+        'JPEG': {'quality': 92, 'subsampling': 2, 'optimize': False, 'progressive': False},
+        'WEBP': {'quality': 85, 'method': 0},
+        'AVIF': {'quality': 75, 'speed': 10},
+        'GIF': {'optimize': False},
+    },
+    'balanced': {
+        'label': '均衡',
+        'PNG': {'compress_level': 6},
+        'JPEG': {'quality': 95, 'subsampling': 0, 'optimize': True, 'progressive': False},
+        'WEBP': {'quality': 90, 'method': 4},
+        'AVIF': {'quality': 80, 'speed': 6},
+        'GIF': {'optimize': False},
+    },
+    'smallest': {
+        'label': '最小体积',
+        'PNG': {'compress_level': 9, 'compress_type': zlib.Z_FILTERED, 'optimize': True},
+        'JPEG': {'quality': 88, 'subsampling': 2, 'optimize': True, 'progressive': True},
+        'WEBP': {'quality': 80, 'method': 6},
+        'AVIF': {'quality': 65, 'speed': 4},
+        'GIF': {'optimize': True},
+    },
+}
+
+DEFAULT_PROFILE = 'balanced'
+
+# 扩展名与编码格式的对应关系
+OUTPUT_FORMATS = {
+    '.png': 'PNG',
+    '.jpg': 'JPEG',
+    '.jpeg': 'JPEG',
+    '.webp': 'WEBP',
+    '.avif': 'AVIF',
+    '.gif': 'GIF',
+}
+
+FORMAT_EXTENSIONS = {
+    'PNG': '.png',
+    'JPEG': '.jpg',
+    'WEBP': '.webp',
+    'AVIF': '.avif',
+    'GIF': '.gif',
+}
+
+# 支持输出动画的格式（PNG 输出为 APNG）
+ANIMATED_FORMATS = {'GIF', 'PNG', 'WEBP'}
+
+
+def format_for_path(file_path):
+    """根据扩展名判断编码格式，未知格式返回None"""
+    return OUTPUT_FORMATS.get(os.path.splitext(file_path)[1].lower())
+
+
+def format_available(fmt):
+    """检查当前Pillow是否支持该编码格式"""
+    if fmt == 'WEBP':
+        return features.check('webp')
+    if fmt == 'AVIF':
+        return features.check('avif')
+    return True
+
+
+def build_output_path(source_path, fmt=None, suffix="_edit"):
+    """生成输出文件名：原文件名 + edit + 扩展名（可指定新格式）"""
+    source_dir = os.path.dirname(source_path)
+    source_name, source_ext = os.path.splitext(os.path.basename(source_path))
+    ext = FORMAT_EXTENSIONS.get(fmt, source_ext) if fmt else source_ext
+    return os.path.join(source_dir, f"{source_name}{suffix}{ext}")
+
+
+def encoder_options(fmt, profile=DEFAULT_PROFILE):
+    """获取某个配置下指定格式的编码参数"""
+    return dict(ENCODER_PROFILES[profile].get(fmt, {}))
+
+
+def _prepare_for_format(image, fmt):
+    """JPEG不支持透明度，需要转换为RGB"""
+    if fmt == 'JPEG' and image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+
+def encode_image(image, file_path, profile=DEFAULT_PROFILE, fmt=None):
+    """按配置编码并写入文件，返回格式、耗时和文件大小"""
+    fmt = fmt or format_for_path(file_path)
+    if fmt and not format_available(fmt):
+        raise ValueError(f"当前环境不支持 {fmt} 编码")
+
+    start = time.perf_counter()
+    if fmt:
+        _prepare_for_format(image, fmt).save(file_path, fmt, **encoder_options(fmt, profile))
+    else:
+        # 其他格式使用默认设置
+        image.save(file_path)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'path': file_path,
+        'format': fmt or os.path.splitext(file_path)[1].lstrip('.').upper(),
+        'profile': profile,
+        'seconds': elapsed,
+        'bytes': os.path.getsize(file_path),
+    }
+
+
+def encode_bytes(image, fmt, profile=DEFAULT_PROFILE):
+    """按配置编码到内存，返回字节串"""
+    if not format_available(fmt):
+        raise ValueError(f"当前环境不支持 {fmt} 编码")
+    buffer = io.BytesIO()
+    _prepare_for_format(image, fmt).save(buffer, fmt, **encoder_options(fmt, profile))
+    return buffer.getvalue()
+
+
+def _encode_to_memory(image, fmt, profile):
+    start = time.perf_counter()
+    buffer = io.BytesIO()
+    image.save(buffer, fmt, **encoder_options(fmt, profile))
+    return {
+        'format': fmt,
+        'profile': profile,
+        'seconds': time.perf_counter() - start,
+        'bytes': buffer.tell(),
+    }
+
+
+def benchmark_profiles(image, fmt, profiles=None, max_workers=None):
+    """在内存中并行按各配置编码，统计耗时和输出大小"""
+    if not format_available(fmt):
+        raise ValueError(f"当前环境不支持 {fmt} 编码")
+    profiles = list(profiles or ENCODER_PROFILES)
+    prepared = _prepare_for_format(image, fmt)
+    # Pillow编码时会释放GIL，线程池即可并行；
+    # save() 会在图片对象上记录编码参数，每个线程使用独立副本
+    with futures.ThreadPoolExecutor(max_workers=max_workers or len(profiles)) as pool:
+        return list(pool.map(lambda profile: _encode_to_memory(prepared.copy(), fmt, profile), profiles))
+
+
+def format_size(num_bytes):
+    """将字节数格式化为易读的字符串"""
+    for unit in ('B', 'KB', 'MB'):
+        if num_bytes < 1024:
+            return f"{num_bytes:.1f} {unit}" if unit != 'B' else f"{num_bytes} B"
+        num_bytes /= 1024
+    return f"{num_bytes:.1f} GB"
+
+
+def hex_to_rgb(hex_color):
+    """将十六进制颜色转换为RGB"""
+    hex_color = hex_color.lstrip('#')
+    return tuple(int(hex_color[i:i+2], 16) for i in (0, 2, 4))
+
+
+@functools.lru_cache(maxsize=None)
+def load_font(size=LABEL_FONT_SIZE, font_path=None):
+    """加载支持中文的字体，结果按字号缓存；指定 font_path 时只加载该字体"""
+    if font_path == BUNDLED_FONT:
+        return ImageFont.load_default(size)
+    if font_path:
+        return ImageFont.truetype(font_path, size)
+    try:
+        # 尝试使用支持中文的字体
+        system = platform.system()
+        if system == "Windows":
+            # Windows系统使用微软雅黑
+            return ImageFont.truetype("msyh.ttc", size)
+        elif system == "Darwin":  # macOS
+            # macOS系统使用苹方字体
+            return ImageFont.truetype("/System/Library/Fonts/PingFang.ttc", size)
+        else:  # Linux
+            # Linux系统尝试使用文泉驿字体
+            return ImageFont.truetype("/usr/share/fonts/truetype/wqy/wqy-microhei.ttc", size)
+    except OSError:
+        try:
+            # 备用方案：尝试其他常见中文字体
+            return ImageFont.truetype("simhei.ttf", size)
+        except OSError:
+            # 最后使用默认字体
+            return ImageFont.load_default()
+
+
+def scale_region(region, scale):
+    """将预览坐标下的区域换算到原始图片坐标。
+    编辑器中的预览坐标是对齐到原图像素的浮点数，换算时容许除法的舍入误差"""
+    scaled = dict(region)
+    scaled['x'] = int(region['x'] / scale + COORD_EPSILON)
+    scaled['y'] = int(region['y'] / scale + COORD_EPSILON)
+    scaled['width'] = int(region['width'] / scale + COORD_EPSILON)
+    scaled['height'] = int(region['height'] / scale + COORD_EPSILON)
+    if 'blur' in region:
+        scaled['blur'] = region['blur'] / scale
+    if 'corner_radius' in region:
+        scaled['corner_radius'] = int(region['corner_radius'] / scale)
+    if 'gutter' in region:
+        scaled['gutter'] = region['gutter'] / scale
+    return scaled
+
+
+def is_grid(region):
+    """是否为图标网格区域"""
+    return region.get('type') == 'grid'
+
+
+def _grid_pitch(region):
+    """网格的列数、行数和单元格步距（单元格宽高 + 间距，浮点）"""
+    columns = max(1, int(region.get('columns', 1)))
+    rows = max(1, int(region.get('rows', 1)))
+    gutter = region.get('gutter', 0)
+    return columns, rows, (region['width'] + gutter) / columns, (region['height'] + gutter) / rows
+
+
+def grid_layout(region):
+    """网格区域的单元格尺寸和各单元格相对区域左上角的偏移（行优先）。
+    单元格尺寸由区域尺寸、行列数和间距推出，缩放和调整大小后保持一致"""
+    columns, rows, pitch_x, pitch_y = _grid_pitch(region)
+    gutter = region.get('gutter', 0)
+    cell = (max(1, int(pitch_x - gutter)), max(1, int(pitch_y - gutter)))
+    offsets = [(int(round(column * pitch_x)), int(round(row * pitch_y)))
+               for row in range(rows) for column in range(columns)]
+    return cell, offsets
+
+
+def grid_cell_at(region, x, y):
+    """点 (x, y) 所在单元格的序号（行优先），落在间距中或区域外时返回 None（算术命中测试）"""
+    columns, rows, pitch_x, pitch_y = _grid_pitch(region)
+    gutter = region.get('gutter', 0)
+    column = int((x - region['x']) // pitch_x)
+    row = int((y - region['y']) // pitch_y)
+    if not (0 <= column < columns and 0 <= row < rows):
+        return None
+    if (x - region['x'] - column * pitch_x > pitch_x - gutter or
+            y - region['y'] - row * pitch_y > pitch_y - gutter):
+        return None
+    return row * columns + column
+
+
+class LRUCache:
+    """线程安全的LRU缓存（标签文字贴图、毛玻璃模糊结果等）；
+    提供 sizeof 时同时按 max_bytes 淘汰（最近放入的一项总会保留），
+    登记到内存预算后放入新内容时还会触发全局预算检查。
+    被淘汰的内容在释放锁之后才丢弃：PhotoImage 析构时会调用 Tk"""
+
+    def __init__(self, max_entries=256, max_bytes=None, sizeof=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof
+        self.budget = None  # 登记的 MemoryBudget
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._sprites = OrderedDict()
+        self._sizes = {}
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            sprite = self._sprites.get(key)
+            if sprite is None:
+                self.misses += 1
+                return None
+            self._sprites.move_to_end(key)
+            self.hits += 1
+            return sprite
+
+    def put(self, key, sprite):
+        """放入或更新一项（同一键再次放入时重新计算占用）"""
+        size = self.sizeof(sprite) if self.sizeof else 0
+        dropped = []
+        with self._lock:
+            self.bytes += size - self._sizes.get(key, 0)
+            self._sizes[key] = size
+            dropped.append(self._sprites.get(key))
+            self._sprites[key] = sprite
+            self._sprites.move_to_end(key)
+            while len(self._sprites) > self.max_entries or (
+                    self.max_bytes is not None and self.bytes > self.max_bytes and len(self._sprites) > 1):
+                evicted, value = self._sprites.popitem(last=False)
+                self.bytes -= self._sizes.pop(evicted)
+                dropped.append(value)
+        del dropped
+        if self.budget is not None and size:
+            self.budget.enforce()
+
+    def evict(self, amount):
+        """从最久未用的一端淘汰，直到释放 amount 字节或缓存为空，返回实际释放量"""
+        freed = 0
+        dropped = []
+        with self._lock:
+            while self._sprites and freed < amount:
+                evicted, value = self._sprites.popitem(last=False)
+                size = self._sizes.pop(evicted)
+                self.bytes -= size
+                freed += size
+                dropped.append(value)
+        del dropped
+        return freed
+
+    def update_size(self, key):
+        """条目内容原地变化后重新计算占用（不改变最近使用顺序，也不触发淘汰）"""
+        with self._lock:
+            if key in self._sprites and self.sizeof:
+                size = self.sizeof(self._sprites[key])
+                self.bytes += size - self._sizes[key]
+                self._sizes[key] = size
+
+    def values(self):
+        """当前缓存内容的快照（不影响最近使用顺序）"""
+        with self._lock:
+            return list(self._sprites.values())
+
+    def discard(self, key):
+        with self._lock:
+            value = self._sprites.pop(key, None)
+            if value is not None:
+                self.bytes -= self._sizes.pop(key)
+        del value
+
+    def clear(self):
+        with self._lock:
+            dropped, self._sprites = self._sprites, OrderedDict()
+            self._sizes = {}
+            self.bytes = 0
+        del dropped
+
+
+def image_bytes(image):
+    """图片像素占用的内存（字节）"""
+    return image.width * image.height * len(image.getbands())
+
+
+# 标签样式：(文字颜色, 阴影颜色)，均为RGBA
+LIGHT_LABEL = ((255, 255, 255, 255), (0, 0, 0, 180))
+LIGHT_LABEL_STRONG = ((255, 255, 255, 255), (0, 0, 0, 230))
+DARK_LABEL = ((33, 33, 33, 255), (255, 255, 255, 160))
+DARK_LABEL_STRONG = ((33, 33, 33, 255), (255, 255, 255, 220))
+DEFAULT_LABEL_STYLE = LIGHT_LABEL
+
+LABEL_BRIGHTNESS_THRESHOLD = 0.6  # 合成后平均亮度高于此值时使用深色文字
+LABEL_BUSY_STDDEV = 0.15  # 背景亮度标准差高于此值时加重阴影
+
+
+def label_style(mean, variance, color, alpha):
+    """根据标签下方源图的亮度统计和区域颜色，选择文字颜色和阴影"""
+    weight = alpha / 255
+    red, green, blue = hex_to_rgb(color)
+    color_luminance = (0.299 * red + 0.587 * green + 0.114 * blue) / 255
+    # 半透明覆盖层合成后的亮度均值和标准差
+    composited_mean = (1 - weight) * mean + weight * color_luminance
+    composited_stddev = (1 - weight) * variance ** 0.5
+    busy = composited_stddev > LABEL_BUSY_STDDEV
+    if composited_mean > LABEL_BRIGHTNESS_THRESHOLD:
+        return DARK_LABEL_STRONG if busy else DARK_LABEL
+    return LIGHT_LABEL_STRONG if busy else LIGHT_LABEL
+
+
+GRADIENT_FILLS = ('linear', 'radial')
+DEFAULT_GRADIENT_END = '#000000'  # 渐变终止色默认值
+
+
+@functools.lru_cache(maxsize=256)
+def rounded_mask(size, radius):
+    """带抗锯齿的圆角遮罩（L模式），按尺寸和半径缓存；只计算一个角再翻转复制到四角"""
+    width, height = size
+    radius = max(0, min(radius, width // 2, height // 2))
+    mask = Image.new('L', size, 255)
+    if radius == 0:
+        return mask
+
+    # 每个像素中心到圆心的距离，边缘按覆盖比例做抗锯齿
+    coords = np.arange(radius, dtype=np.float64) + 0.5
+    distance = np.hypot(radius - coords[None, :], radius - coords[:, None])
+    coverage = np.clip(radius - distance + 0.5, 0.0, 1.0)
+    corner = Image.fromarray((coverage * 255 + 0.5).astype(np.uint8), 'L')
+
+    mask.paste(corner, (0, 0))
+    mask.paste(corner.transpose(Image.Transpose.FLIP_LEFT_RIGHT), (width - radius, 0))
+    mask.paste(corner.transpose(Image.Transpose.FLIP_TOP_BOTTOM), (0, height - radius))
+    mask.paste(corner.transpose(Image.Transpose.ROTATE_180), (width - radius, height - radius))
+    return mask
+
+
+GRADIENT_CACHE = LRUCache(max_entries=64, sizeof=image_bytes)  # 整块渐变填充，按尺寸和颜色缓存
+
+
+def gradient_fill(size, start_color, end_color, kind='linear'):
+    """向量化生成渐变填充（RGBA）：linear 为自上而下，radial 为由中心向外"""
+    key = (size, start_color, end_color, kind)
+    gradient = GRADIENT_CACHE.get(key)
+    if gradient is None:
+        gradient = gradient_rows(size, start_color, end_color, kind)
+        GRADIENT_CACHE.put(key, gradient)
+    return gradient
+
+
+def gradient_rows(size, start_color, end_color, kind='linear', rows=None):
+    """渐变填充中 rows=(top, bottom) 范围内的行（不缓存，供分带合成使用）；
+    逐通道计算，临时数组只有每像素十几个字节"""
+    width, height = size
+    top, bottom = rows or (0, height)
+    start = np.asarray(start_color, dtype=np.float64)
+    delta = np.asarray(end_color, dtype=np.float64) - start
+    if kind == 'radial':
+        xs = (np.arange(width, dtype=np.float64) + 0.5) / width * 2 - 1
+        ys = (np.arange(top, bottom, dtype=np.float64) + 0.5) / height * 2 - 1
+        t = np.clip(np.hypot(xs[None, :], ys[:, None]), 0.0, 1.0)
+        pixels = np.empty((bottom - top, width, 4), dtype=np.uint8)
+        for channel in range(4):
+            pixels[..., channel] = start[channel] + delta[channel] * t + 0.5
+    else:
+        # 线性渐变每行颜色相同，只计算一列再横向展开
+        t = np.linspace(0.0, 1.0, height)[top:bottom]
+        colors = (start + delta * t[:, None] + 0.5).astype(np.uint8)
+        pixels = np.ascontiguousarray(np.broadcast_to(colors[:, None, :], (bottom - top, width, 4)))
+    return Image.fromarray(pixels, 'RGBA')
+
+
+DEFAULT_BLUR_RADIUS = 12  # 毛玻璃默认模糊半径（预览像素）
+BLUR_WORKING_RADIUS = 4  # 缩小后实际执行的模糊半径
+BLUR_PASSES = 3  # 多次盒式模糊近似高斯模糊
+
+
+def blur_region(source, box, radius):
+    """下采样-盒式模糊-(调用方)上采样：只处理区域及其外扩边距，返回低分辨率模糊图和区域在其中的位置"""
+    x, y, width, height = box
+    pad = 2 * radius
+    left = max(0, x - pad)
+    top = max(0, y - pad)
+    right = min(source.width, x + width + pad)
+    bottom = min(source.height, y + height + pad)
+    crop = source.crop((left, top, right, bottom)).convert('RGB')
+
+    # 缩小后模糊半径只剩几个像素，代价与原始半径无关
+    factor = max(1, radius // BLUR_WORKING_RADIUS)
+    small = crop.reduce(factor) if factor > 1 else crop
+    for _ in range(BLUR_PASSES):
+        small = small.filter(ImageFilter.BoxBlur(radius / factor))
+
+    # 区域在低分辨率图中的位置（浮点坐标，供 resize 的 box 参数使用）
+    scale_x = small.width / crop.width
+    scale_y = small.height / crop.height
+    inner_box = ((x - left) * scale_x, (y - top) * scale_y,
+                 (x - left + width) * scale_x, (y - top + height) * scale_y)
+    return small, inner_box
+
+
+def rgb_to_hex(rgb):
+    """将RGB(A)颜色转换为十六进制字符串"""
+    return '#{:02x}{:02x}{:02x}'.format(*rgb[:3])
+
+
+def sprite_bytes(entry):
+    """文字贴图缓存条目 (贴图, 偏移) 的内存占用"""
+    return image_bytes(entry[0]) if entry[0] is not None else 0
+
+
+def blur_bytes(entry):
+    """模糊缓存条目 (低分辨率模糊图, 区域位置) 的内存占用"""
+    return image_bytes(entry[0])
+
+
+_source_tokens = itertools.count(1)  # 模糊缓存键中的源图标识
+BAND_HEIGHT = 256  # 分带合成时每条水平带的高度（原始像素）
+GRADIENT_BYTES_PER_PIXEL = 24  # 渐变计算时临时数组的每像素开销（估计值）
+
+
+class Compositor:
+    """在原始尺寸上合成区域覆盖层和标签文字"""
+
+    def __init__(self, font_size=LABEL_FONT_SIZE, sprite_cache=None, blur_cache=None, font_path=None):
+        self.font_size = font_size
+        self.font_path = font_path  # 固定标签字体（黄金图像用），None 时按系统选择
+        self.sprite_cache = sprite_cache or LRUCache(sizeof=sprite_bytes)
+        self.blur_cache = blur_cache or LRUCache(max_entries=64, sizeof=blur_bytes)
+        self._source_keys = {}  # id(源图) -> (弱引用, 源图标识)，模糊缓存按源图标识区分
+        self._source_lock = threading.Lock()
+
+    def compose(self, source, regions, scale=1.0, stats=None):
+        """合成所有区域，regions 为预览坐标，scale 为预览缩放比例，
+        stats 为源图的 LuminanceStats（用于选择标签颜色，未提供时现场计算）。
+        输出图和最大的区域覆盖层超出内存预算时改为分带合成，结果相同"""
+        output_bytes = source.width * source.height * 4
+        if not memory_budget.fits(output_bytes + self.peak_overlay_bytes(regions, scale)):
+            return self.compose_banded(source, regions, scale, stats)
+
+        with memory_budget.reserve('export', output_bytes):
+            # 使用原始图片创建输出图片（只复制一次）
+            if source.mode == 'RGBA':
+                output_image = source.copy()
+            else:
+                output_image = source.convert('RGBA')
+
+            if stats is None and any(region['text'] for region in regions):
+                stats = LuminanceStats(source)
+            for region in regions:
+                self.draw_region(output_image, scale_region(region, scale), stats, source)
+        return output_image
+
+    def compose_banded(self, source, regions, scale=1.0, stats=None, band_height=BAND_HEIGHT):
+        """低内存合成：逐条水平带绘制区域，覆盖层、渐变、遮罩和毛玻璃只生成与当前带相交的部分"""
+        metrics.count('compose_banded')
+        output_bytes = source.width * source.height * 4
+        with memory_budget.reserve('export', output_bytes):
+            if source.mode == 'RGBA':
+                output_image = source.copy()
+            else:
+                output_image = source.convert('RGBA')
+
+            if stats is None and any(region['text'] for region in regions):
+                stats = LuminanceStats(source)
+            regions = [scale_region(region, scale) for region in regions]
+            # 各条带互不重叠，带内按原顺序绘制区域，叠加结果与整幅合成一致
+            for top in range(0, output_image.height, band_height):
+                rows = (top, min(top + band_height, output_image.height))
+                for region in regions:
+                    if region['y'] < rows[1] and region['y'] + region['height'] > rows[0]:
+                        self.draw_region(output_image, region, stats, source, rows)
+        return output_image
+
+    def peak_overlay_bytes(self, regions, scale=1.0):
+        """整幅合成时最大的单个区域临时开销（覆盖层、毛玻璃图块和渐变计算）"""
+        peak = 0
+        for region in regions:
+            pixels = int(region['width'] / scale) * int(region['height'] / scale)
+            per_pixel = 8  # 覆盖层 + 圆角/毛玻璃图块
+            if region.get('fill') in GRADIENT_FILLS:
+                per_pixel += GRADIENT_BYTES_PER_PIXEL
+            peak = max(peak, pixels * per_pixel)
+        return peak
+
+    def compose_layer(self, size, regions, scale=1.0, stats=None):
+        """把所有区域合成为一张透明图层，供动画的每一帧复用"""
+        layer = Image.new('RGBA', size, (0, 0, 0, 0))
+        for region in regions:
+            region = scale_region(region, scale)
+            overlay = self.grid_overlay(region) if is_grid(region) else self.region_overlay(region)
+            self.composite_clipped(layer, overlay, (region['x'], region['y']))
+            for sprite, position in self.region_labels(region, size, stats):
+                self.composite_clipped(layer, sprite, position)
+        return layer
+
+    def preview_layer(self, source, region, scale, sprite=None, sprite_position=None, labels=None):
+        """区域的预览图层（预览坐标）：覆盖层按预览尺寸生成，毛玻璃共用导出的低分辨率模糊结果，
+        标签使用 region_label 返回的原始尺寸贴图再缩小；labels 为 region_labels 返回的全部标签"""
+        original = scale_region(region, scale)
+
+        # 创建半透明覆盖层（纯色/渐变/圆角，与导出共用遮罩和渐变缓存；网格只生成一个单元格再平铺）
+        layer = self.grid_overlay(region) if is_grid(region) else self.region_overlay(region)
+
+        # 毛玻璃：与导出共用同一份低分辨率模糊结果，只按预览尺寸放大
+        if region.get('fill') == 'frosted':
+            patch = self.frosted_patch(
+                source,
+                (original['x'], original['y'], original['width'], original['height']),
+                region.get('blur', DEFAULT_BLUR_RADIUS) / scale,
+                (region['width'], region['height'])).convert('RGBA')
+            if is_grid(region):
+                patch.putalpha(self.grid_mask(region))
+            elif region.get('corner_radius'):
+                patch.putalpha(rounded_mask((region['width'], region['height']),
+                                            int(region['corner_radius'])))
+            layer = Image.alpha_composite(patch, layer)
+
+        # 标签：把导出尺寸的贴图缩放到预览比例
+        if labels is None:
+            labels = [(sprite, sprite_position)] if sprite is not None else []
+        if labels:
+            # 覆盖层可能来自渐变缓存，合成前先复制
+            layer = layer.copy()
+        for sprite, sprite_position in labels:
+            size = (max(1, round(sprite.width * scale)), max(1, round(sprite.height * scale)))
+            small = sprite.resize(size, Image.Resampling.LANCZOS)
+            offset = (round((sprite_position[0] - original['x']) * scale),
+                      round((sprite_position[1] - original['y']) * scale))
+            self.composite_clipped(layer, small, offset)
+        return layer
+
+    def composite_clipped(self, layer, image, position):
+        """alpha_composite 要求源图完全落在目标内，这里先裁剪到图层范围"""
+        left = max(0, position[0])
+        top = max(0, position[1])
+        right = min(layer.width, position[0] + image.width)
+        bottom = min(layer.height, position[1] + image.height)
+        if right <= left or bottom <= top:
+            return
+        source_box = (left - position[0], top - position[1],
+                      right - position[0], bottom - position[1])
+        layer.alpha_composite(image, (left, top), source_box)
+
+    def draw_region(self, output_image, region, stats=None, source=None, rows=None):
+        """在输出图片上绘制一个区域（原始坐标），毛玻璃样式需要提供源图；
+        rows=(top, bottom) 时只绘制落在这些行内的部分"""
+        size = (region['width'], region['height'])
+        window = None
+        if rows is not None:
+            # 区域内需要绘制的行（相对区域顶部）
+            window = (max(rows[0] - region['y'], 0), min(rows[1] - region['y'], region['height']))
+            if window[0] >= window[1]:
+                return
+        position = (region['x'], region['y'] + (window[0] if window else 0))
+        corner_radius = int(region.get('corner_radius', 0))
+
+        # 毛玻璃：先铺上模糊后的背景（圆角时按同一遮罩裁剪，网格只铺在单元格内）
+        if region.get('fill') == 'frosted' and source is not None:
+            patch = self.frosted_patch(source, (region['x'], region['y'], *size),
+                                       region.get('blur', DEFAULT_BLUR_RADIUS), window=window)
+            if is_grid(region):
+                mask = self.grid_mask(region, window)
+            else:
+                mask = rounded_mask(size, corner_radius) if corner_radius else None
+                if mask is not None and window:
+                    mask = mask.crop((0, window[0], size[0], window[1]))
+            output_image.paste(patch, position, mask)
+
+        # 创建区域覆盖层并粘贴到输出图片上（网格的所有单元格合成一个图层，只粘贴一次）
+        if is_grid(region):
+            overlay = self.grid_overlay(region, window)
+        else:
+            overlay = self.region_overlay(region, window)
+        output_image.paste(overlay, position, overlay)
+
+        # 添加文字
+        for sprite, sprite_position in self.region_labels(region, output_image.size, stats):
+            if rows is not None:
+                # 只取贴图落在当前行范围内的部分
+                top = max(rows[0], sprite_position[1])
+                bottom = min(rows[1], sprite_position[1] + sprite.height)
+                if top >= bottom:
+                    continue
+                sprite = sprite.crop((0, top - sprite_position[1], sprite.width, bottom - sprite_position[1]))
+                sprite_position = (sprite_position[0], top)
+            output_image.paste(sprite, sprite_position, sprite)
+
+    def grid_overlay(self, region, window=None):
+        """网格覆盖层：只生成一个单元格位图，平铺到各单元格位置（window 同 region_overlay）"""
+        cell, offsets = grid_layout(region)
+        cell_overlay = self.region_overlay(dict(region, width=cell[0], height=cell[1]))
+        return self.tile_cells(cell_overlay, region, offsets, window)
+
+    def grid_mask(self, region, window=None):
+        """网格的单元格遮罩（L模式），毛玻璃背景按它裁剪"""
+        cell, offsets = grid_layout(region)
+        corner_radius = int(region.get('corner_radius', 0))
+        cell_mask = rounded_mask(cell, corner_radius) if corner_radius else Image.new('L', cell, 255)
+        return self.tile_cells(cell_mask, region, offsets, window)
+
+    def tile_cells(self, cell_image, region, offsets, window=None):
+        """把单元格位图平铺到区域大小的透明图层上；window=(top, bottom) 时只生成这些行"""
+        top, bottom = window or (0, region['height'])
+        layer = Image.new(cell_image.mode, (region['width'], bottom - top), 0)
+        for dx, dy in offsets:
+            if dy < bottom and dy + cell_image.height > top:
+                layer.paste(cell_image, (dx, dy - top))
+        return layer
+
+    def region_labels(self, region, image_size, stats=None):
+        """区域的全部标签贴图及位置：普通区域至多一个，网格区域每个有标签的单元格一个"""
+        if not is_grid(region):
+            if not region['text']:
+                return []
+            sprite, position = self.region_label(region, image_size, stats)
+            return [(sprite, position)] if sprite is not None else []
+
+        labels = []
+        cell, offsets = grid_layout(region)
+        for (dx, dy), text in zip(offsets, region.get('labels', [])):
+            if not text:
+                continue
+            # 相同文字、相同单元格尺寸的贴图在缓存中共享
+            cell_region = {'x': region['x'] + dx, 'y': region['y'] + dy, 'width': cell[0],
+                           'height': cell[1], 'text': text, 'color': region['color'],
+                           'alpha': region['alpha']}
+            sprite, position = self.region_label(cell_region, image_size, stats)
+            if sprite is not None:
+                labels.append((sprite, position))
+        return labels
+
+    def region_overlay(self, region, window=None):
+        """区域覆盖层：纯色或渐变填充，再按圆角遮罩裁剪（渐变和遮罩均按尺寸缓存）；
+        window=(top, bottom) 时只生成区域内这些行（不缓存渐变）"""
+        size = (region['width'], region['height'])
+        color = (*hex_to_rgb(region['color']), region['alpha'])
+        fill = region.get('fill', 'solid')
+        corner_radius = int(region.get('corner_radius', 0))
+        part_size = (size[0], window[1] - window[0]) if window else size
+
+        if fill in GRADIENT_FILLS:
+            end_color = (*hex_to_rgb(region.get('color2', DEFAULT_GRADIENT_END)), region['alpha'])
+            if window:
+                overlay = gradient_rows(size, color, end_color, fill, window)
+            else:
+                overlay = gradient_fill(size, color, end_color, fill)
+        else:
+            if not corner_radius:
+                return Image.new('RGBA', part_size, color)
+            overlay = None
+
+        if corner_radius:
+            mask = rounded_mask(size, corner_radius)
+            if window:
+                mask = mask.crop((0, window[0], size[0], window[1]))
+            if overlay is None:
+                # 纯色圆角：直接用遮罩缩放后的alpha，无需逐像素绘制
+                overlay = Image.new('RGBA', part_size, color)
+                overlay.putalpha(mask.point(lambda value: value * color[3] // 255))
+            else:
+                overlay = overlay.copy()
+                overlay.putalpha(ImageChops.multiply(overlay.getchannel('A'), mask))
+        return overlay
+
+    def frosted_patch(self, source, box, radius, size=None, window=None):
+        """区域背后的模糊图块：box 为源图坐标 (x, y, width, height)，size 为输出尺寸（默认同 box），
+        window=(top, bottom) 时只放大区域内这些行。
+        低分辨率的模糊结果按区域几何缓存，预览和导出只是以不同尺寸放大同一份结果"""
+        x, y, width, height = box
+        radius = max(1, int(round(radius)))
+        key = (self.source_key(source), x, y, width, height, radius)
+        cached = self.blur_cache.get(key)
+        if cached is None:
+            cached = blur_region(source, box, radius)
+            self.blur_cache.put(key, cached)
+
+        blurred, inner_box = cached
+        if window:
+            # 采样中心与整块放大时相同，结果等于整块放大后裁剪
+            left, top, right, bottom = inner_box
+            step = (bottom - top) / height
+            return blurred.resize((width, window[1] - window[0]), Image.Resampling.BILINEAR,
+                                  box=(left, top + window[0] * step, right, top + window[1] * step))
+        return blurred.resize(size or (width, height), Image.Resampling.BILINEAR, box=inner_box)
+
+    def source_key(self, source):
+        """源图在缓存键中的标识：同一图片对象始终相同，id 被新图片复用后不同。
+        界面和导出线程共用合成器，各自的源图结果同时留在缓存中，由 LRU 淘汰"""
+        source_id = id(source)
+        with self._source_lock:
+            entry = self._source_keys.get(source_id)
+            if entry is None or entry[0]() is not source:
+                keys = self._source_keys
+
+                def forget(ref):
+                    if keys.get(source_id, (None,))[0] is ref:
+                        keys.pop(source_id, None)
+
+                entry = keys[source_id] = (weakref.ref(source, forget), next(_source_tokens))
+            return entry[1]
+
+    def region_label(self, region, image_size, stats=None):
+        """获取区域的标签贴图及其在图片中的位置，颜色按标签下方的亮度选择"""
+        text, width, height = region['text'], region['width'], region['height']
+        sprite, offset = self.text_sprite(text, width, height)
+        if sprite is None:
+            return None, (0, 0)
+        position = (region['x'] + offset[0], region['y'] + offset[1])
+        if stats is None:
+            return sprite, position
+
+        # 积分图O(1)查询标签覆盖范围内的亮度
+        mean, variance = stats.query(position[0] / image_size[0], position[1] / image_size[1],
+                                     (position[0] + sprite.width) / image_size[0],
+                                     (position[1] + sprite.height) / image_size[1])
+        style = label_style(mean, variance, region['color'], region['alpha'])
+        if style != DEFAULT_LABEL_STYLE:
+            sprite, offset = self.text_sprite(text, width, height, style)
+            position = (region['x'] + offset[0], region['y'] + offset[1])
+        return sprite, position
+
+    def text_sprite(self, text, width, height, style=DEFAULT_LABEL_STYLE):
+        """获取标签文字贴图（裁剪到有效像素），返回贴图和相对区域左上角的偏移"""
+        key = (text, width, height, self.font_size, self.font_path, style)
+        cached = self.sprite_cache.get(key)
+        if cached is not None:
+            return cached
+
+        text_img = self.render_text_layer(text, width, height, style)
+        bbox = text_img.getbbox()
+        if bbox:
+            cached = (text_img.crop(bbox), bbox[:2])
+        else:
+            cached = (None, (0, 0))
+        self.sprite_cache.put(key, cached)
+        return cached
+
+    def render_text_layer(self, text, width, height, style=DEFAULT_LABEL_STYLE):
+        """绘制与区域同尺寸的文字层（置顶显示，超出时自动换行）"""
+        font = load_font(self.font_size, self.font_path)
+        text_color, shadow_color = style
+        text_img = Image.new('RGBA', (width, height), (0, 0, 0, 0))
+        draw = ImageDraw.Draw(text_img)
+
+        # 获取文字边界框
+        bbox = draw.textbbox((0, 0), text, font=font)
+        text_width = bbox[2] - bbox[0]
+        text_height = bbox[3] - bbox[1]
+
+        # 计算文字位置（置顶显示，留3像素边距）
+        text_x = 3
+        text_y = 3
+
+        # 检查文字是否超出区域边界
+        max_width = width - 6  # 留出6px边距（置顶显示）
+        max_height = height - 6  # 留出6px边距
+
+        # 如果文字超出边界，进行自动换行
+        if text_width > max_width or text_height > max_height:
+            # 计算每行最大字符数
+            char_width = text_width / len(text) if text else 1
+            max_chars_per_line = int(max_width / char_width) if char_width > 0 else 1
+
+            # 分行处理
+            lines = []
+            current_line = ""
+            for char in text:
+                if len(current_line) >= max_chars_per_line:
+                    lines.append(current_line)
+                    current_line = char
+                else:
+                    current_line += char
+            if current_line:
+                lines.append(current_line)
+
+            # 绘制多行文字
+            line_height = text_height + 2  # 行间距
+            for i, line in enumerate(lines):
+                if text_y + i * line_height + text_height <= max_height:
+                    # 先绘制阴影
+                    draw.text((text_x + 1, text_y + i * line_height + 1), line, fill=shadow_color, font=font)
+                    # 再绘制主文字
+                    draw.text((text_x, text_y + i * line_height), line, fill=text_color, font=font)
+                else:
+                    # 如果还有更多行但空间不够，显示省略号
+                    if i < len(lines) - 1:
+                        # 省略号也添加阴影
+                        draw.text((text_x + 1, text_y + i * line_height + 1), "...", fill=shadow_color, font=font)
+                        draw.text((text_x, text_y + i * line_height), "...", fill=text_color, font=font)
+                    break
+        else:
+            # 文字不超出边界，正常绘制
+            # 先绘制阴影效果（偏移1像素）
+            draw.text((text_x + 1, text_y + 1), text, fill=shadow_color, font=font)
+            # 再绘制主文字
+            draw.text((text_x, text_y), text, fill=text_color, font=font)
+
+        return text_img
+
+
+def is_animated(file_path):
+    """判断图片文件是否为多帧动画（只读取文件头和帧索引）"""
+    with Image.open(file_path) as image:
+        return getattr(image, 'is_animated', False)
+
+
+def iter_composited_frames(file_path, layer):
+    """逐帧解码并叠加区域图层，任一时刻只保留当前帧"""
+    with Image.open(file_path) as source:
+        for frame in ImageSequence.Iterator(source):
+            composited = frame.convert('RGBA')
+            # 帧加载后 info 才是这一帧的时长（WebP 在加载前仍是上一帧的）
+            composited.alpha_composite(layer)
+            composited.info['duration'] = frame.info.get('duration', 100)
+            yield composited
+
+
+class CompositedFrames(Image.Image):
+    """按需合成的多帧图像：seek(i) 时才解码源动画的第 i 帧并叠加区域图层。
+    WebP 编码器逐帧 seek 后立即压缩，所以任一时刻只有一帧未压缩的像素；
+    durations 在合成每帧时追加该帧时长，编码器加入这一帧之后才读取它"""
+
+    def __init__(self, source, layer, durations):
+        super().__init__()
+        self._source = source
+        self._layer = layer
+        self._durations = durations
+        self._mode = 'RGBA'
+        self._size = source.size
+        self.n_frames = getattr(source, 'n_frames', 1)
+        self.is_animated = self.n_frames > 1
+        self._frame = None
+        self.seek(0)
+
+    def tell(self):
+        return self._frame
+
+    def seek(self, frame):
+        if frame == self._frame:
+            return
+        self._source.seek(frame)
+        composited = self._source.convert('RGBA')
+        composited.alpha_composite(self._layer)
+        self.im = composited.im
+        self._frame = frame
+        if frame == len(self._durations):
+            # 帧加载后 info 才是这一帧的时长
+            self._durations.append(self._source.info.get('duration', 100))
+
+
+def _build_palette(frame):
+    """从缩小后的首帧生成全局调色板，各帧直接映射，避免逐帧生成调色板"""
+    sample = frame.convert('RGB')
+    sample.thumbnail((256, 256))
+    return sample.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+
+
+def _to_palette_frames(frames, dither):
+    """将RGBA帧映射到同一个调色板"""
+    palette = None
+    for frame in frames:
+        if palette is None:
+            palette = _build_palette(frame)
+        mapped = frame.convert('RGB').quantize(palette=palette, dither=dither)
+        mapped.info['duration'] = frame.info['duration']
+        yield mapped
+
+
+def save_animated(source_path, layer, file_path, profile=DEFAULT_PROFILE, fmt=None):
+    """导出动画：逐帧解码、叠加同一区域图层，保留每帧时长和循环次数。
+    WebP 逐帧合成、逐帧压缩，不会同时持有所有帧。GIF 和 APNG 由 Pillow 的编码器决定：
+    它们在写出前把全部帧收集到列表里（比较相邻帧、合并相同帧），峰值内存随帧数增长，
+    其中 GIF 保存的是调色板帧（每像素 1 字节）"""
+    fmt = fmt or format_for_path(file_path)
+    if fmt not in ANIMATED_FORMATS:
+        raise ValueError(f"{fmt} 格式不支持动画")
+    if not format_available(fmt):
+        raise ValueError(f"当前环境不支持 {fmt} 编码")
+
+    with Image.open(source_path) as source:
+        loop = source.info.get('loop')  # 没有循环信息的动画只播放一次
+
+        start = time.perf_counter()
+        options = encoder_options(fmt, profile)
+        if loop is not None:
+            options['loop'] = loop
+        elif fmt != 'GIF':
+            options['loop'] = 1  # APNG/WebP 不指定时默认无限循环，1 表示播放一次
+
+        if fmt == 'WEBP':
+            # 编码器按 n_frames 逐帧 seek 并立即压缩，时长列表随合成逐帧填充
+            durations = []
+            first, rest = CompositedFrames(source, layer, durations), []
+            options['duration'] = durations
+        elif fmt == 'GIF':
+            dither = Image.Dither.NONE if profile == 'fast' else Image.Dither.FLOYDSTEINBERG
+            rest = _to_palette_frames(iter_composited_frames(source_path, layer), dither)
+            first = next(rest)
+        else:
+            # APNG：首帧也属于动画；Pillow 会先遍历一遍所有帧检查模式，再次遍历时才编码，
+            # 传入生成器会在检查时耗尽，所以这里需要列表
+            options['default_image'] = False
+            frames = list(iter_composited_frames(source_path, layer))
+            first, rest = frames[0], frames[1:]
+        first.save(file_path, fmt, save_all=True, append_images=rest, **options)
+        elapsed = time.perf_counter() - start
+
+    return {
+        'path': file_path,
+        'format': fmt,
+        'profile': profile,
+        'seconds': elapsed,
+        'bytes': os.path.getsize(file_path),
+    }
+
+
+# 常见显示器分辨率预设，用于多目标导出
+EXPORT_PRESETS = {
+    '1080p': (1920, 1080),
+    '1440p': (2560, 1440),
+    '4K': (3840, 2160),
+    'ultrawide': (3440, 1440),
+}
+
+
+def split_monitors(width, height, columns, rows=1):
+    """将整张壁纸按显示器均分为多个矩形导出目标"""
+    targets = []
+    for row in range(rows):
+        for column in range(columns):
+            left = width * column // columns
+            top = height * row // rows
+            right = width * (column + 1) // columns
+            bottom = height * (row + 1) // rows
+            targets.append({
+                'name': f"monitor{row * columns + column + 1}",
+                'rect': [left, top, right - left, bottom - top],
+            })
+    return targets
+
+
+def derive_target(master, target):
+    """从合成好的母版中裁剪/缩放出一个导出目标"""
+    x, y, width, height = target.get('rect') or (0, 0, *master.size)
+    size = tuple(target.get('size') or (width, height))
+
+    if size == (width, height):
+        if (width, height) == master.size:
+            return master
+        return master.crop((x, y, x + width, y + height))
+
+    # 等比覆盖目标尺寸，居中裁剪，只对需要的区域重采样
+    scale = max(size[0] / width, size[1] / height)
+    crop_width = size[0] / scale
+    crop_height = size[1] / scale
+    left = x + (width - crop_width) / 2
+    top = y + (height - crop_height) / 2
+    return master.resize(size, Image.Resampling.LANCZOS,
+                         box=(left, top, left + crop_width, top + crop_height),
+                         reducing_gap=3.0)
+
+
+def target_output_path(source_path, target, fmt=None):
+    """多目标导出中一个目标的 (输出路径, 格式)"""
+    target_fmt = target.get('format', fmt)
+    target_fmt = target_fmt.upper() if target_fmt else None
+    return build_output_path(source_path, target_fmt, suffix=f"_edit_{target['name']}"), target_fmt
+
+
+def export_targets(master, source_path, targets, profile=DEFAULT_PROFILE, fmt=None, job=None):
+    """将一张合成母版导出为多个目标，每个目标可单独指定格式和编码配置；
+    在后台导出任务 job 中执行时每个目标先写临时文件，由 job 检查取消后替换"""
+    results = []
+    for target in targets:
+        file_path, target_fmt = target_output_path(source_path, target, fmt)
+        image = derive_target(master, target)
+        if job is not None:
+            job.check()
+            temp_path = job.temp_path(file_path)
+            result = encode_image(image, temp_path, target.get('profile', profile), target_fmt)
+            job.commit(temp_path, file_path)
+            result['path'] = file_path
+        else:
+            result = encode_image(image, file_path, target.get('profile', profile), target_fmt)
+        result['name'] = target['name']
+        result['size'] = image.size
+        results.append(result)
+    return results
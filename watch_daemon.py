@@ -0,0 +1,381 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+壁纸编辑器 - 监视文件夹自动渲染
+监视输入目录中的壁纸和项目JSON，文件变化（防抖后）重新扫描，
+只重新渲染源图或项目指纹发生变化的输出，输出文件名与 save_wallpaper 相同（原文件名_edit.扩展名）。
+Linux 下使用 inotify，其他系统轮询；状态文件记录已完成的指纹，重启后跳过已完成的工作
+
+用法:
+    python watch_daemon.py D:/wallpapers D:/projects
+    python watch_daemon.py ./incoming --default-project template.json --format PNG
+    python watch_daemon.py ./incoming --template 看板    # 按每张壁纸的尺寸求解参数化模板
+    python watch_daemon.py ./incoming --once        # 只处理一轮后退出
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import re
+import select
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from PIL import Image
+
+from region_templates import TemplateError, TemplateLibrary
+from render_server import RenderEngine, project_image_path
+from wallpaper_render import (ANIMATED_FORMATS, DEFAULT_PROFILE, ENCODER_PROFILES, LRUCache,
+                              build_output_path, encode_image, format_for_path, is_animated, save_animated)
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.gif', '.webp')  # 与打开壁纸对话框一致
+# 导出结果的文件名（不含扩展名），这些文件不作为源图：save_wallpaper 的“_edit”、
+# 多目标导出的“_edit_<目标名>”，以及后台导出尚未替换的临时文件“<输出名>.<任务号>.part”
+OUTPUT_NAME = re.compile(r'_edit(_[^.]+)?(\.\d+\.part)?$')
+DEFAULT_DEBOUNCE = 1.0  # 最后一个文件事件之后等待的秒数
+DEFAULT_POLL_INTERVAL = 2.0  # 轮询模式的扫描间隔（秒）
+DEFAULT_STATE_FILE = "watch_state.json"
+
+# inotify 事件掩码
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+
+
+class InotifyWatcher:
+    """Linux inotify 监视（通过 ctypes 调用 libc，无需第三方库）"""
+
+    def __init__(self, directories):
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 失败")
+        for directory in directories:
+            if self.libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK) < 0:
+                os.close(self.fd)
+                raise OSError(ctypes.get_errno(), f"无法监视目录: {directory}")
+
+    def wait(self, timeout):
+        """等待文件事件，返回是否有事件（事件内容不解析，统一重新扫描）"""
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        while True:
+            try:
+                if not os.read(self.fd, 65536):
+                    break
+            except BlockingIOError:
+                break
+        return True
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher:
+    """轮询监视：比较目录中文件的大小和修改时间"""
+
+    def __init__(self, directories, interval=DEFAULT_POLL_INTERVAL):
+        self.directories = directories
+        self.interval = interval
+        self.snapshot = self.take_snapshot()
+
+    def take_snapshot(self):
+        snapshot = {}
+        for directory in self.directories:
+            try:
+                with os.scandir(directory) as entries:
+                    for entry in entries:
+                        if entry.is_file():
+                            stat = entry.stat()
+                            snapshot[entry.path] = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                continue
+        return snapshot
+
+    def wait(self, timeout):
+        """间隔一段时间后比较快照，返回是否有变化"""
+        time.sleep(min(timeout, self.interval))
+        snapshot = self.take_snapshot()
+        changed = snapshot != self.snapshot
+        self.snapshot = snapshot
+        return changed
+
+    def close(self):
+        pass
+
+
+def create_watcher(directories, poll_interval=DEFAULT_POLL_INTERVAL, force_polling=False):
+    """优先使用 inotify，不可用时退回轮询"""
+    if not force_polling and sys.platform.startswith('linux'):
+        try:
+            return InotifyWatcher(directories)
+        except (OSError, AttributeError) as e:
+            print(f"⚠️  inotify 不可用，改为轮询: {str(e)}")
+    return PollingWatcher(directories, poll_interval)
+
+
+def project_fingerprint(project, fmt, profile):
+    """项目内容（区域和预览比例）与输出设置的指纹"""
+    content = json.dumps({'regions': project.get('regions', []), 'scale': project.get('scale', 1.0),
+                          'format': fmt, 'profile': profile}, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+
+class WatchDaemon:
+    """扫描输入目录、比较指纹并在线程池中增量渲染"""
+
+    def __init__(self, directories, state_path=DEFAULT_STATE_FILE, fmt=None, profile=DEFAULT_PROFILE,
+                 workers=2, default_project=None, engine=None, template=None):
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.state_path = state_path
+        self.fmt = fmt
+        self.profile = profile
+        self.default_project = default_project
+        self.template = template  # 参数化模板，优先于 default_project
+        self.image_sizes = LRUCache(max_entries=4096)  # 源图指纹 -> 尺寸（只读文件头）
+        self.engine = engine or RenderEngine()
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='watch')
+        self.pending = {}  # 输出路径 -> 正在渲染的指纹
+        self.dirty = False  # 有任务在渲染期间其输入又发生了变化，需要再扫描一次
+        self.duplicates = set()  # 已警告过的 (输出路径, 被跳过的来源)，每个冲突只提示一次
+        self._lock = threading.Lock()
+        self.state = self.load_state()
+
+    def load_state(self):
+        try:
+            with open(self.state_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_state(self):
+        """原子写入状态文件（调用方持有锁）"""
+        tmp_path = self.state_path + ".tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.state, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.state_path)
+        except OSError as e:
+            print(f"状态文件保存失败: {str(e)}")
+
+    def resolve_image(self, image_path, project_dir):
+        """项目中的壁纸路径：先按原路径，其次相对项目目录，最后在项目目录中按文件名查找"""
+        if not image_path:
+            return None
+        for candidate in (image_path, os.path.join(project_dir, image_path),
+                          os.path.join(project_dir, os.path.basename(image_path))):
+            if os.path.isfile(candidate):
+                return os.path.abspath(candidate)
+        return None
+
+    def output_format(self, image_path):
+        """输出格式：指定格式，否则与源图相同（BMP 等非导出格式按扩展名交给 Pillow）"""
+        ext = os.path.splitext(image_path)[1].lower()
+        return self.fmt or format_for_path(image_path) or Image.registered_extensions().get(ext, 'PNG')
+
+    def is_source_image(self, path):
+        name, ext = os.path.splitext(os.path.basename(path))
+        return ext.lower() in IMAGE_EXTENSIONS and not OUTPUT_NAME.search(name)
+
+    def scan(self):
+        """扫描所有输入目录，返回需要渲染的任务列表 (输出路径, 指纹, 壁纸路径, 项目)。
+        多个来源（项目文件或壁纸）对应同一个输出文件时只渲染按路径排序的第一个，
+        否则它们的指纹互相覆盖，输出会被无限次重新渲染"""
+        projects = []  # (壁纸路径, 项目, 来源)
+        images = set()
+        for directory in self.directories:
+            try:
+                with os.scandir(directory) as entries:
+                    paths = sorted(entry.path for entry in entries if entry.is_file())
+            except OSError as e:
+                print(f"⚠️  无法读取目录 {directory}: {str(e)}")
+                continue
+            for path in paths:
+                if path.lower().endswith('.json') and os.path.abspath(path) != os.path.abspath(self.state_path):
+                    try:
+                        with open(path, 'r', encoding='utf-8') as f:
+                            project = json.load(f)
+                    except (OSError, ValueError):
+                        continue  # 可能还在写入，下次事件再处理
+                    if isinstance(project, dict) and 'regions' in project:
+                        image_path = self.resolve_image(project_image_path(project), directory)
+                        if image_path:
+                            projects.append((image_path, project, path))
+                elif self.is_source_image(path):
+                    images.add(os.path.abspath(path))
+
+        # 没有项目引用的新壁纸套用模板或默认项目
+        referenced = {image_path for image_path, _, _ in projects}
+        if self.template is not None:
+            for image_path in sorted(images - referenced):
+                project = self.template_project(image_path)
+                if project is not None:
+                    projects.append((image_path, project, image_path))
+        elif self.default_project is not None:
+            projects.extend((image_path, self.default_project, image_path)
+                            for image_path in sorted(images - referenced))
+
+        jobs = []
+        claimed = {}  # 输出路径 -> 来源
+        for image_path, project, origin in projects:
+            fmt = self.output_format(image_path)
+            output_path = build_output_path(image_path, self.fmt)
+            if output_path in claimed:
+                if (output_path, origin) not in self.duplicates:
+                    self.duplicates.add((output_path, origin))
+                    print(f"⚠️  {os.path.basename(origin)} 与 {os.path.basename(claimed[output_path])} "
+                          f"输出到同一文件 {os.path.basename(output_path)}，只渲染后者")
+                continue
+            claimed[output_path] = origin
+            try:
+                source_key = self.engine.pixel_cache.fingerprint(image_path)
+            except OSError:
+                continue
+            fingerprint = f"{source_key}:{project_fingerprint(project, fmt, self.profile)}"
+            if self.state.get(output_path) == fingerprint and os.path.exists(output_path):
+                continue
+            jobs.append((output_path, fingerprint, image_path, project))
+        return jobs
+
+    def template_project(self, image_path):
+        """按壁纸尺寸求解模板（同尺寸的壁纸共用缓存的求解结果），无法读取或求解时返回 None"""
+        try:
+            key = self.engine.pixel_cache.fingerprint(image_path)
+            size = self.image_sizes.get(key)
+            if size is None:
+                with Image.open(image_path) as image:
+                    size = image.size
+                self.image_sizes.put(key, size)
+            return self.template.project(image_path, *size)
+        except (OSError, TemplateError) as e:
+            print(f"⚠️  无法套用模板 {os.path.basename(image_path)}: {str(e)}")
+            return None
+
+    def submit(self, jobs):
+        """提交渲染任务；同一输出正在渲染时先跳过，完成后再扫描一次"""
+        submitted = 0
+        for output_path, fingerprint, image_path, project in jobs:
+            with self._lock:
+                if output_path in self.pending:
+                    if self.pending[output_path] != fingerprint:
+                        self.dirty = True
+                    continue
+                self.pending[output_path] = fingerprint
+            self.executor.submit(self.render_job, output_path, fingerprint, image_path, project)
+            submitted += 1
+        return submitted
+
+    def render_job(self, output_path, fingerprint, image_path, project):
+        """渲染一个输出：先写临时文件再替换，避免读到写了一半的图片"""
+        fmt = self.output_format(image_path)
+        tmp_path = output_path + ".part"
+        start = time.perf_counter()
+        try:
+            image, stats, compositor = self.engine.source(image_path)
+            regions = project.get('regions', [])
+            scale = project.get('scale', 1.0)
+            if is_animated(image_path) and fmt in ANIMATED_FORMATS:
+                # 动画：区域图层只合成一次，逐帧叠加后写出（与 save_wallpaper 相同）
+                layer = compositor.compose_layer(image.size, regions, scale, stats)
+                save_animated(image_path, layer, tmp_path, self.profile, fmt)
+            else:
+                encode_image(compositor.compose(image, regions, scale, stats), tmp_path, self.profile, fmt)
+            os.replace(tmp_path, output_path)
+        except Exception as e:
+            print(f"❌ 渲染失败 {os.path.basename(image_path)}: {str(e)}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            with self._lock:
+                self.pending.pop(output_path, None)
+            return
+
+        with self._lock:
+            self.pending.pop(output_path, None)
+            self.state[output_path] = fingerprint
+            self.save_state()
+        print(f"✅ {os.path.basename(output_path)}  {(time.perf_counter() - start) * 1000:.0f} ms")
+
+    def run_once(self):
+        """扫描一轮并等待所有任务完成"""
+        self.submit(self.scan())
+        self.executor.shutdown(wait=True)
+
+    def run(self, watcher, debounce=DEFAULT_DEBOUNCE):
+        """常驻运行：启动时先扫描一次，之后每批文件事件防抖后重新扫描"""
+        print(f"👀 正在监视: {', '.join(self.directories)}  ({type(watcher).__name__})")
+        self.submit(self.scan())
+        try:
+            while True:
+                rescan = watcher.wait(debounce)
+                if rescan:
+                    # 防抖：持续有事件时继续等待，直到安静 debounce 秒
+                    while watcher.wait(debounce):
+                        pass
+                with self._lock:
+                    if self.dirty and not self.pending:
+                        self.dirty = False
+                        rescan = True
+                if rescan:
+                    self.submit(self.scan())
+        finally:
+            watcher.close()
+            self.executor.shutdown(wait=True)
+
+
+def main():
+    """主函数"""
+    parser = argparse.ArgumentParser(description="监视文件夹，壁纸或项目变化时自动重新渲染")
+    parser.add_argument('directories', nargs='+', help="输入目录（壁纸和项目JSON）")
+    parser.add_argument('--format', default=None, choices=['PNG', 'JPEG', 'WEBP', 'AVIF', 'GIF'],
+                        help="输出格式（默认与源图相同）")
+    parser.add_argument('--profile', default=DEFAULT_PROFILE, choices=list(ENCODER_PROFILES),
+                        help="编码配置")
+    defaults = parser.add_mutually_exclusive_group()
+    defaults.add_argument('--default-project', default=None,
+                          help="没有项目引用的壁纸套用此项目的区域")
+    defaults.add_argument('--template', default=None,
+                          help="没有项目引用的壁纸按自身尺寸套用此模板（模板名称或文件路径）")
+    parser.add_argument('--state', default=DEFAULT_STATE_FILE, help="状态文件")
+    parser.add_argument('--workers', type=int, default=2, help="渲染线程数")
+    parser.add_argument('--debounce', type=float, default=DEFAULT_DEBOUNCE, help="防抖时间（秒）")
+    parser.add_argument('--poll', action='store_true', help="强制使用轮询")
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL, help="轮询间隔（秒）")
+    parser.add_argument('--once', action='store_true', help="只处理一轮后退出")
+    args = parser.parse_args()
+
+    default_project = None
+    if args.default_project:
+        with open(args.default_project, 'r', encoding='utf-8') as f:
+            default_project = json.load(f)
+
+    template = None
+    if args.template:
+        try:
+            template = TemplateLibrary().find(args.template)
+        except (OSError, TemplateError) as e:
+            print(f"❌ {str(e)}")
+            sys.exit(1)
+
+    daemon = WatchDaemon(args.directories, args.state, args.format, args.profile,
+                         args.workers, default_project, template=template)
+    if args.once:
+        daemon.run_once()
+        return
+    try:
+        daemon.run(create_watcher(daemon.directories, args.poll_interval, args.poll), args.debounce)
+    except KeyboardInterrupt:
+        print("\n👋 已停止监视")
+
+
+if __name__ == "__main__":
+    main()
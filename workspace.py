@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+壁纸编辑器 - 多壁纸工作区
+同时打开多张壁纸，每张有独立的区域、选择和撤销历史；
+解码后的原图、亮度积分图（按需计算）和预览金字塔放在按内存预算淘汰的LRU中，
+在最近用过的壁纸之间切换时不需要重新解码
+"""
+
+import os
+from collections import OrderedDict
+
+from region_layout import LazyLuminanceStats
+from wallpaper_render import LRUCache, image_bytes, is_animated
+
+DEFAULT_MEMORY_BUDGET = 1024 * 1024 * 1024  # 解码缓存的内存预算（字节）
+MAX_CACHED_SOURCES = 8  # 解码缓存最多保留的壁纸数
+PYRAMID_MIN_SIDE = 256  # 金字塔最小一级的最短边（像素）
+PYRAMID_MODES = {'L', 'LA', 'RGB', 'RGBA', 'RGBX'}  # Image.reduce 支持的模式（调色板图等直接使用原图）
+
+
+class WallpaperSource:
+    """一张已解码的壁纸：原图、亮度积分图和按需生成的预览金字塔"""
+
+    def __init__(self, path, fingerprint, image):
+        self.path = path
+        self.fingerprint = fingerprint
+        self.image = image
+        self.stats = LazyLuminanceStats(image)  # 第一次选择标签颜色时才计算
+        self.animated = is_animated(path)
+        self.levels = [image]  # 第 i 级为原图缩小 2**i 倍
+
+    @property
+    def nbytes(self):
+        return sum(image_bytes(level) for level in self.levels)
+
+    def level_for(self, display_scale):
+        """返回 (图像, 缩小倍数)：尺寸仍不小于显示尺寸两倍的最小一级，
+        从它重采样与直接从原图重采样（reducing_gap=2.0）画质相当"""
+        factor = 1
+        index = 0
+        if self.image.mode in PYRAMID_MODES:
+            while display_scale * factor * 4 <= 1 and min(self.image.size) // (factor * 2) >= PYRAMID_MIN_SIDE:
+                factor *= 2
+                index += 1
+        while len(self.levels) <= index:
+            self.levels.append(self.levels[-1].reduce(2))
+        return self.levels[index], factor
+
+
+class WallpaperDocument:
+    """工作区中的一张壁纸及其编辑状态"""
+
+    def __init__(self, path):
+        self.path = path
+        self.regions = []
+        self.history = []
+        self.selected_regions = set()
+        self.selected_region = None
+        self.zoom = 1.0
+        self.scale = None  # 区域所在的预览缩放比例，None 表示尚未显示过
+        self.view = (0.0, 0.0)  # 画布滚动位置（xview/yview 的起点）
+
+    @property
+    def name(self):
+        return os.path.basename(self.path)
+
+    def project_data(self):
+        """与项目文件相同格式的数据"""
+        return {'regions': self.regions, 'image_path': self.path, 'scale': self.scale or 1.0}
+
+
+class Workspace:
+    """多壁纸工作区：打开的文档按打开顺序排列，解码结果按最近使用和内存预算淘汰"""
+
+    def __init__(self, pixel_cache, memory_budget=DEFAULT_MEMORY_BUDGET):
+        self.pixel_cache = pixel_cache
+        self.documents = OrderedDict()  # 绝对路径 -> WallpaperDocument
+        self.sources = LRUCache(max_entries=MAX_CACHED_SOURCES, max_bytes=memory_budget,
+                                sizeof=lambda source: source.nbytes)
+        self.active = None
+
+    def open(self, file_path):
+        """打开壁纸（已打开时返回原文档），并确保已解码"""
+        path = os.path.abspath(file_path)
+        self.source(path)
+        document = self.documents.get(path)
+        if document is None:
+            document = self.documents[path] = WallpaperDocument(path)
+        return document
+
+    def source(self, path):
+        """壁纸的解码结果；文件在磁盘上变化后重新解码"""
+        fingerprint = self.pixel_cache.fingerprint(path)
+        source = self.sources.get(path)
+        if source is None or source.fingerprint != fingerprint:
+            source = WallpaperSource(path, fingerprint, self.pixel_cache.open_image(path))
+            self.sources.put(path, source)
+        return source
+
+    def preview_level(self, source, display_scale):
+        """按显示比例取金字塔中的一级；新生成了层级时更新缓存的内存占用"""
+        count = len(source.levels)
+        level = source.level_for(display_scale)
+        if len(source.levels) != count:
+            self.sources.put(source.path, source)
+        return level
+
+    def register_budget(self, budget):
+        """把原图和预览金字塔登记到内存预算（金字塔可以重建，先于原图淘汰）"""
+        self.sources.budget = budget
+        budget.register('previews', self.preview_bytes, self.evict_previews)
+        budget.register('originals', self.original_bytes, self.sources.evict)
+
+    def original_bytes(self):
+        return sum(image_bytes(source.image) for source in self.sources.values())
+
+    def preview_bytes(self):
+        return sum(source.nbytes - image_bytes(source.image) for source in self.sources.values())
+
+    def evict_previews(self, amount):
+        """丢弃金字塔层级（当前壁纸最后丢弃），返回释放的字节数"""
+        active = self.active.path if self.active else None
+        freed = 0
+        for source in sorted(self.sources.values(), key=lambda source: source.path == active):
+            if freed >= amount:
+                break
+            freed += source.nbytes - image_bytes(source.image)
+            source.levels = source.levels[:1]
+            self.sources.update_size(source.path)
+        return freed
+
+    def close(self, document):
+        """关闭文档（解码结果留在缓存中，重新打开时仍可复用）"""
+        self.documents.pop(document.path, None)
+        if self.active is document:
+            self.active = None
+
+    def neighbor(self, document, step=1):
+        """按打开顺序与 document 相隔 step 的文档"""
+        documents = list(self.documents.values())
+        if not documents:
+            return None
+        if document not in documents:
+            return documents[-1]
+        return documents[(documents.index(document) + step) % len(documents)]